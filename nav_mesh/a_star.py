@@ -1,10 +1,14 @@
 import numpy as np
-from sortedcontainers import SortedList
+from scipy.spatial import KDTree
 
 import os, sys
 import math
-import bisect # for inserting into sorted list
+import heapq
+import itertools
 import random
+import array
+import threading
+import weakref
 
 from .exceptions import PathUnreachableError
 
@@ -15,13 +19,103 @@ from .exceptions import PathUnreachableError
 #            return f"{self.vert.index} (parent: none) (g: {self.g}, h: {self.h}, f: {self.f})"
     
 def eucledian( node, end_nodes ):
-    min_val = np.inf
-    for end in end_nodes:
-        #length_squared = ((end.pos - node.pos)**2).sum()
-        squared = (end.pos - node.pos)**2
-        length_squared = squared[0] + squared[1] + squared[2]
-        min_val = min( length_squared, min_val )
-    return math.sqrt( min_val )
+    target_positions = np.asarray( [end.pos for end in end_nodes] )
+    return math.sqrt( ((target_positions - node.pos)**2).sum( axis=1 ).min() )
+
+class EucledianHeuristic():
+    """ Straight-line distance to the closest of a set of target positions.
+
+    The target positions are put into an array once per search, so that the distance to all
+    targets (and for many positions at once) is computed in a single numpy operation. For wide
+    entrances with many target nodes, a KD-tree over the targets is queried instead. """
+
+    # Use a KD-tree if there are at least this many targets:
+    # (below that, computing all distances with numpy is cheaper than querying the tree)
+    kd_tree_min_targets = 200
+
+    def __init__( self, target_positions ):
+        self.target_positions = np.asarray( target_positions, dtype=np.float64 ).reshape( -1, 3 )
+        if len( self.target_positions ) == 1:
+            self.single_target = self.target_positions[0].tolist()
+        else:
+            self.single_target = None
+        if len( self.target_positions ) >= EucledianHeuristic.kd_tree_min_targets:
+            self.kd_tree = KDTree( self.target_positions )
+        else:
+            self.kd_tree = None
+
+    def __call__( self, positions ):
+        """ Distance from each of the given positions (or from a single position) to the
+        closest target """
+        positions = np.asarray( positions, dtype=np.float64 )
+        if self.kd_tree is not None:
+            dist, _ = self.kd_tree.query( positions )
+            return dist
+        if len( self.target_positions ) == 1:
+            diff = positions - self.target_positions[0]
+            return np.sqrt( (diff*diff).sum( axis=-1 ) )
+        diff = positions[...,np.newaxis,:] - self.target_positions
+        return np.sqrt( (diff*diff).sum( axis=-1 ).min( axis=-1 ) )
+
+    def for_nodes( self, positions, indices ):
+        """ Distances for the nodes with the given indices (into the positions array), as a list.
+        For a single target, plain python math beats the overhead of calling into numpy for the
+        handful of nodes which are evaluated per expansion. """
+        if self.single_target is not None:
+            tx, ty, tz = self.single_target
+            distances = []
+            for i in indices:
+                x, y, z = positions[i].tolist()
+                distances.append( math.sqrt( (x - tx)**2 + (y - ty)**2 + (z - tz)**2 ) )
+            return distances
+        return self( positions[indices] ).tolist()
+
+class LandmarkHeuristic():
+    """ ALT heuristic: lower bound for the path length to the closest of a set of target nodes,
+    derived from the precomputed distances to landmarks (see landmarks.Landmarks) via the triangle
+    inequality. For each landmark L, |d(L,v) - d(L,t)| <= d(v,t), so the largest of these
+    differences is used. Since the straight-line distance is a lower bound as well, the larger of
+    the two bounds is returned. All target nodes must be in the same zone as the searched nodes. """
+
+    def __init__( self, landmark_distances, target_indices, target_positions ):
+        self.landmark_distances = landmark_distances
+        # Distances from the targets to the landmarks, shape (targets, landmarks):
+        self.target_distances = landmark_distances[target_indices].astype( np.float64 )
+        self.eucledian = EucledianHeuristic( target_positions )
+        if len( self.target_distances ) == 1:
+            self.single_target = self.target_distances[0].tolist()
+        else:
+            self.single_target = None
+
+    def for_nodes( self, positions, indices ):
+        bounds = self.eucledian.for_nodes( positions, indices )
+        if self.single_target is not None:
+            # Few nodes and landmarks per call, plain python is faster than numpy here:
+            target = self.single_target
+            for k, i in enumerate( indices ):
+                bound = bounds[k]
+                for d_node, d_target in zip( self.landmark_distances[i].tolist(), target ):
+                    diff = abs( d_node - d_target )
+                    # Landmarks which can't be reached from one of the nodes give no information:
+                    if bound < diff < math.inf:
+                        bound = diff
+                bounds[k] = bound
+            return bounds
+
+        node_distances = self.landmark_distances[indices].astype( np.float64 )
+        with np.errstate( invalid="ignore" ):
+            diff = np.abs( node_distances[:,np.newaxis,:] - self.target_distances[np.newaxis,:,:] )
+        # Landmarks which can't be reached from one of the nodes give no information:
+        diff[~np.isfinite( diff )] = 0
+        bound = diff.max( axis=2 ).min( axis=1 )
+        return np.maximum( bound, bounds ).tolist()
+
+class ZeroHeuristic():
+    """ No heuristic at all, which turns A* into Dijkstra's algorithm. Useful for graphs whose
+    edge costs are not bounded from below by the straight-line distance. """
+
+    def for_nodes( self, positions, indices ):
+        return [0]*len( indices )
 
 def manhatten( node, end_nodes ):
     min_val = np.inf
@@ -31,16 +125,16 @@ def manhatten( node, end_nodes ):
         min_val = min( d, min_val )
     return min_val
 
-def backtrack( final_node ):
+def backtrack( parents, final_node ):
     
     path = []
    
     cur_node = final_node
     while cur_node:
-        # insert at beginning of path:
-        path.insert( 0, cur_node )
+        path.append( cur_node )
         
-        cur_node = cur_node.parent_node
+        cur_node = parents[cur_node.index]
+    path.reverse()
         
     return path
 
@@ -58,7 +152,7 @@ def a_star( start_node, end_nodes, verbose=False, max_end_nodes=2, avoid=[], min
     assert len( end_nodes ) > 0, "Cannot run A*, end nodes list is empty!"
 
     valid_end_nodes = [n for n in end_nodes if n.max_height >= min_height]
-    if len(valid_end_nodes) < 0:
+    if len(valid_end_nodes) == 0:
         raise PathUnreachableError( "All end nodes are too low!" )
     #end_nodes = random.sample(valid_end_nodes, max_end_nodes)      # TODO: Reenable?
     #end_nodes = valid_end_nodes[0:max_end_nodes]
@@ -77,62 +171,84 @@ def a_star( start_node, end_nodes, verbose=False, max_end_nodes=2, avoid=[], min
 
     
     
-    open_list = list()
+    # All search state is kept in this function (and not on the nodes), so that multiple
+    # searches can run at the same time.
+    # g holds the cost from the start node, h the heuristic and parents the previous node on the
+    # path for every node which has been reached so far.
+    g = {}
+    h = {}
+    parents = {}
+
+    # The open list is a binary heap of (f, tie_breaker, node) entries. Instead of removing a node
+    # from the heap when a cheaper route to it is found, a new entry is pushed and the outdated
+    # one is skipped when it is popped ("lazy deletion"). open_nodes holds the nodes which are
+    # currently on the open list, indexed by node index, for O(1) membership tests.
+    open_list = []
+    open_nodes = {}
+    tie_breaker = itertools.count()
     closed = set()
     # Add all the nodes to avoid to the "closed" list:
     for n in avoid:
         closed.add( n.index )
     
-    start_node.set_parent( None )
-    bisect.insort( open_list, start_node )
+    end_node_indices = set( n.index for n in end_nodes )
+
+    g[start_node.index] = 0
+    h[start_node.index] = 0
+    parents[start_node.index] = None
+    heapq.heappush( open_list, (0, next(tie_breaker), start_node) )
+    open_nodes[start_node.index] = start_node
 
     # If given, steer towards the final target node. Otherwise, steer towards any of the end nodes:
     if final_target_node:
         target_nodes_for_heuristic = [final_target_node]
     else:
         target_nodes_for_heuristic = end_nodes
+    heuristic = EucledianHeuristic( [n.pos for n in target_nodes_for_heuristic] )
     
     iterations = 0
-    while len(open_list) > 0:
-        iterations += 1
+    while len(open_nodes) > 0:
         
         if verbose:
-            print(f"Loop start. Open nodes: {len(open_list)}")
-        #print( [str(n) for n in open] )
+            print(f"Loop start. Open nodes: {len(open_nodes)}")
         
-        # Get node with lowest f value. We assume open_list is sorted!
-        cur_node = open_list.pop(0)
+        # Get node with lowest f value:
+        f, _, cur_node = heapq.heappop( open_list )
+        if cur_node.index in closed:
+            # Outdated entry, the node was re-added with a lower f value in the meantime:
+            continue
+        iterations += 1
         if verbose:
             print("\tChoosing ", cur_node)
         
         # Move node to "closed" list:
+        del open_nodes[cur_node.index]
         closed.add( cur_node.index )
         
-        if cur_node in end_nodes:
+        if cur_node.index in end_node_indices:
             if verbose:
                 print("\tTarget node found. Returning path.")
             if not return_debug_info:
-                return backtrack( cur_node )
+                return backtrack( parents, cur_node )
             else:
                 debug_info = {
                         "closed": closed,
-                        "open_list": open_list,
+                        "open_list": list( open_nodes.values() ),
+                        "parents": { i: p.index for i, p in parents.items() if p },
                         "end_nodes": end_nodes
                         }
-                return backtrack( cur_node ), debug_info
+                return backtrack( parents, cur_node ), debug_info
             
 
-        parent = cur_node.parent_node
+        parent = parents[cur_node.index]
         if use_angular_penalty:
             if parent:
-                vec_from_parent = cur_node.pos - parent.pos
-                dir_from_parent = vec_from_parent/np.linalg.norm( vec_from_parent )
+                dir_from_parent = cur_node.pos - parent.pos
             else:
                 dir_from_parent = initial_dir
 
         angle_penalty = 0
         
-        f_updated = False
         for neighbor_node in cur_node.direct_neighbors:
             if verbose:
                 print("\t\tneighbor:", neighbor_node, neighbor_node.index, f"(closed {neighbor_node.index in closed})")
@@ -142,45 +258,460 @@ def a_star( start_node, end_nodes, verbose=False, max_end_nodes=2, avoid=[], min
                 continue
             if not neighbor_node.index in closed:
                 
-                # If this is not in the open list, create a new vert and add it to the open list:
-                if not neighbor_node in open_list:
-                    h = eucledian( neighbor_node, target_nodes_for_heuristic )
-                    #h = eucledian( neighbor_node, end_nodes )
-                    neighbor_node.set_heuristic( h )
-                   
-                    if use_angular_penalty:
-                        angle_penalty = cur_node.angle_penalty(
-                                neighbor_node, initial_dir=dir_from_parent )
-
-                    #angle_penalty = 0   # DEBUG!
-                    neighbor_node.set_parent( cur_node, angle_penalty ) 
-                    bisect.insort( open_list, neighbor_node )
-                else:
-                    # If node is already on the open list, potentially update:
-                    #new_g = cur_node.g + np.linalg.norm(neighbor_node.pos - cur_node.pos)
-                    if use_angular_penalty:
-                        angle_penalty = cur_node.angle_penalty(
-                                neighbor_node, initial_dir=dir_from_parent )
-                    #angle_penalty = 0   # DEBUG!
-                    new_g = cur_node.g + \
-                            cur_node.dist_to_neighbor( neighbor_node ) + \
-                            angle_penalty
-                    if neighbor_node.g > new_g:
-                        # Remove node, change values, re-add node:
-                        open_list.remove( neighbor_node )
-                        # WARNING: after the following operation, "open" list may not be sorted
-                        # any more!
-                        # That's why we removed the node first and then re-add it.
-                        neighbor_node.set_parent( cur_node, angle_penalty=angle_penalty )
-                        bisect.insort( open_list, neighbor_node )                        
-
-    print("NO END NODE FOUND! iterations:", iterations)
+                if use_angular_penalty:
+                    angle_penalty = cur_node.angle_penalty(
+                            neighbor_node, initial_dir=dir_from_parent )
+                #angle_penalty = 0   # DEBUG!
+                new_g = g[cur_node.index] + \
+                        cur_node.dist_to_neighbor( neighbor_node ) + \
+                        angle_penalty
+
+                # If this is not in the open list, add it to the open list:
+                if not neighbor_node.index in open_nodes:
+                    h[neighbor_node.index] = float( heuristic( neighbor_node.pos ) )
+                    open_nodes[neighbor_node.index] = neighbor_node
+                # If node is already on the open list, potentially update:
+                elif g[neighbor_node.index] <= new_g:
+                    continue
+
+                # Set or change values and push the node. If the node was already on the open
+                # list, the old heap entry now has a higher f than the node and will be skipped
+                # once it is popped.
+                g[neighbor_node.index] = new_g
+                parents[neighbor_node.index] = cur_node
+                heapq.heappush( open_list,
+                        (new_g + h[neighbor_node.index], next(tie_breaker), neighbor_node) )
+
     # No path found:
     if verbose:
+        print("NO END NODE FOUND! iterations:", iterations)
         print("\tNo path found.")
     #return None
     raise PathUnreachableError("Could not find path to target")
 
+def backtrack_indices( parents, final_index ):
+    
+    path = []
+    
+    cur_index = final_index
+    while cur_index >= 0:
+        path.append( cur_index )
+        cur_index = parents[cur_index]
+    path.reverse()
+    
+    return path
+
+def angle_penalty( from_parent, to_other ):
+    """ Penalize tight angles in a path. from_parent is the direction in which the path arrives
+    at a node, to_other the direction in which it would leave it. The sharper the turn, the
+    higher the penalty. Same as NavNode.angle_penalty, but on plain vectors. """
+
+    dist_from_parent = np.linalg.norm( from_parent )
+    dist_to_other = np.linalg.norm( to_other )
+    if dist_from_parent > 0 and dist_to_other > 0:
+        dot = np.dot( from_parent, to_other )/(dist_from_parent*dist_to_other)
+        dot = max( -1, min( dot, 1 ) )  # Only necessary for the occasional numerical imprecision
+        ang = math.acos( dot )
+        return 50*ang # Make it very expensive to use this steep ang (but not impossible)
+    return 0    # Fallback
+
+class SearchWorkspace():
+    """ Search state of A* on a NavGraph: cost, heuristic and parent of every node, in arrays
+    indexed by node index.
+
+    A workspace is reused from search to search without clearing the arrays. Instead, every
+    search gets a new generation number, and a node's entries only count as set if the node
+    has been stamped with the current generation. """
+
+    def __init__( self, num_nodes ):
+        self.num_nodes = num_nodes
+        self.g = array.array( "d", [0] )*num_nodes
+        self.h = array.array( "d", [0] )*num_nodes
+        self.parents = array.array( "l", [-1] )*num_nodes
+        # Generation in which a node was reached (i.e. g, h and parents are valid) and closed:
+        self.reached = array.array( "L", [0] )*num_nodes
+        self.closed = array.array( "L", [0] )*num_nodes
+        self.generation = 0
+
+    def start_search( self ):
+        self.generation += 1
+        if self.generation >= 2**32:
+            # Stamps are (at least) 32 bit, start over before they overflow:
+            self.reached = array.array( "L", [0] )*self.num_nodes
+            self.closed = array.array( "L", [0] )*self.num_nodes
+            self.generation = 1
+        return self.generation
+
+# Every thread gets its own workspaces (one per graph), so that searches on the same graph can
+# run concurrently:
+thread_local = threading.local()
+
+def get_workspace( graph, slot=0 ):
+    # Searches which need more than one workspace at a time (see a_star_bidirectional) use one
+    # slot per workspace.
+    workspaces = getattr( thread_local, "workspaces", None )
+    if workspaces is None:
+        workspaces = weakref.WeakKeyDictionary()
+        thread_local.workspaces = workspaces
+    slots = workspaces.get( graph )
+    if slots is None:
+        slots = {}
+        workspaces[graph] = slots
+    workspace = slots.get( slot )
+    if workspace is None or workspace.num_nodes != graph.num_nodes:
+        workspace = SearchWorkspace( graph.num_nodes )
+        slots[slot] = workspace
+    return workspace
+
+def make_heuristic( graph, heuristic, target_indices ):
+    """ Create the heuristic (see a_star_graph) which estimates the cost to the closest of the
+    target nodes """
+    if heuristic is None:
+        return ZeroHeuristic()
+    elif hasattr( heuristic, "for_nodes" ):
+        return heuristic    # Already created by the caller
+    elif heuristic == "eucledian":
+        return EucledianHeuristic( graph.positions[target_indices] )
+    elif heuristic == "landmarks":
+        if graph.landmarks is None:
+            raise ValueError( "The graph has no landmarks, cannot use the landmark heuristic!" )
+        return LandmarkHeuristic( graph.landmarks.distances, target_indices,
+                graph.positions[target_indices] )
+    else:
+        raise ValueError( f"Unknown heuristic: {heuristic}" )
+
+def a_star_graph( graph, start, end_indices, avoid=[], min_height=0, initial_dir=None,
+        final_target=None, return_debug_info=False, workspace=None, heuristic="eucledian" ):
+    """ Same as a_star, but works directly on the arrays of a NavGraph instead of on NavNodes.
+    - graph: the NavGraph to search in
+    - start: index of the node at which to start searching. Can also be a dict of
+        {index: initial cost}, to start at any of multiple nodes.
+    - end_indices: indices of multiple nodes, the path will end at one of these. Can also be a dict
+        of {index: end cost}, where end cost is added to the cost of a path ending at that node.
+        The path with the lowest total cost is returned then (instead of the path to the first
+        end node which is reached).
+    - avoid: indices of nodes which should be considered "blocked" (in addition to the nodes which
+        are blocked in the graph itself, see NavGraph.set_blocked)
+    - min_height: only nodes are allowed to be traversed which have a max_height higher than the
+        min_height given here.
+    - final_target: index of a node towards which the search should be steered (optional). If not
+        given, the search steers towards the closest of the end nodes.
+    - workspace: SearchWorkspace to use. By default, the calling thread's workspace for the graph
+        is used, so calls from different threads don't interfere.
+    - heuristic: "eucledian", "landmarks" (the ALT heuristic, needs graph.landmarks, see
+        NavMesh.init_landmarks) or None to search without heuristic (Dijkstra). The landmark
+        heuristic steers towards the end nodes and ignores final_target. Can also be a heuristic
+        object (like EucledianHeuristic), which is used as it is.
+    Returns the path as a list of node indices.
+    """
+    assert len( end_indices ) > 0, "Cannot run A*, end nodes list is empty!"
+
+    if isinstance( end_indices, dict ):
+        end_costs = end_indices
+        end_indices = list( end_costs.keys() )
+    else:
+        end_costs = None
+
+    positions = graph.positions
+    max_heights = graph.max_heights
+    offsets = graph.offsets
+    neighbors = graph.neighbors
+    lengths = graph.lengths
+    blocked = graph.blocked
+
+    end_indices = [i for i in end_indices if max_heights[i] >= min_height]
+    if len( end_indices ) == 0:
+        raise PathUnreachableError( "All end nodes are too low!" )
+
+    if isinstance( start, dict ):
+        start_costs = start
+    else:
+        start_costs = { start: 0 }
+    start_zone_id = graph.zone_ids[next( iter( start_costs ) )]
+
+    for i in end_indices:
+        assert graph.zone_ids[i] == start_zone_id, "Cannot run A* for nodes from separete Zones. Zone_id must be the same for each node!"
+
+    use_angular_penalty = (initial_dir is not None)
+
+    # If given, steer towards the final target node. Otherwise, steer towards any of the end nodes:
+    if heuristic == "eucledian" and final_target is not None:
+        heuristic = EucledianHeuristic( positions[[final_target]] )
+    else:
+        heuristic = make_heuristic( graph, heuristic, end_indices )
+
+    end_indices_set = set( end_indices )
+
+    if workspace is None:
+        workspace = get_workspace( graph )
+    generation = workspace.start_search()
+    g = workspace.g
+    h = workspace.h
+    parents = workspace.parents
+    reached = workspace.reached
+    closed = workspace.closed
+
+    for i in avoid:
+        closed[i] = generation
+
+    # Binary heap of (f, index). Outdated entries are skipped when they are popped (the node is
+    # already closed by then, because its up-to-date entry has a lower f):
+    open_list = []
+    for i, cost in start_costs.items():
+        g[i] = cost
+        h[i] = 0
+        parents[i] = -1
+        reached[i] = generation
+        open_list.append( (cost, i) )
+    heapq.heapify( open_list )
+
+    best_end = -1
+    best_cost = math.inf
+
+    while len(open_list) > 0:
+
+        f, cur = heapq.heappop( open_list )
+        if f >= best_cost:
+            # No path which is still open can end up cheaper than the best one found so far:
+            break
+        if closed[cur] == generation:
+            continue
+        closed[cur] = generation
+
+        if cur in end_indices_set:
+            if end_costs is None:
+                best_end = cur
+                break
+            cost = g[cur] + end_costs[cur]
+            if cost < best_cost:
+                best_cost = cost
+                best_end = cur
+
+        if use_angular_penalty:
+            parent = parents[cur]
+            if parent >= 0:
+                dir_from_parent = positions[cur] - positions[parent]
+            else:
+                dir_from_parent = initial_dir
+
+        begin, end = offsets[cur], offsets[cur+1]
+        cur_neighbors = neighbors[begin:end]
+        cur_lengths = lengths[begin:end]
+        if min_height > 0 or blocked is not None:
+            if min_height > 0:
+                passable = max_heights[cur_neighbors] >= min_height
+                if blocked is not None:
+                    passable &= ~blocked[cur_neighbors]
+            else:
+                passable = ~blocked[cur_neighbors]
+            cur_neighbors = cur_neighbors[passable]
+            cur_lengths = cur_lengths[passable]
+        cur_neighbors = cur_neighbors.tolist()
+
+        # Neighbors which are reached for the first time during this search are added to the
+        # open list. Their heuristic is computed for all of them at once and then kept in the
+        # workspace for the rest of the search:
+        new_neighbors = [n for n in cur_neighbors if reached[n] != generation]
+        if len( new_neighbors ) > 0:
+            for neighbor, value in zip( new_neighbors,
+                    heuristic.for_nodes( positions, new_neighbors ) ):
+                reached[neighbor] = generation
+                h[neighbor] = value
+                g[neighbor] = math.inf
+
+        cur_g = g[cur]
+        for neighbor, length in zip( cur_neighbors, cur_lengths.tolist() ):
+            if closed[neighbor] == generation:
+                continue
+
+            new_g = cur_g + length
+            if use_angular_penalty:
+                new_g += angle_penalty( dir_from_parent, positions[neighbor] - positions[cur] )
+
+            # Potentially update the node's cost:
+            if g[neighbor] <= new_g:
+                continue
+            g[neighbor] = new_g
+            parents[neighbor] = cur
+            heapq.heappush( open_list, (new_g + h[neighbor], neighbor) )
+
+    if best_end < 0:
+        raise PathUnreachableError("Could not find path to target")
+
+    path = backtrack_indices( parents, best_end )
+    if not return_debug_info:
+        return path
+    else:
+        reached_nodes = [i for i in range( graph.num_nodes ) if reached[i] == generation]
+        debug_info = {
+                "closed": set( i for i in reached_nodes if closed[i] == generation ),
+                "open_list": [i for i in reached_nodes if closed[i] != generation],
+                "parents": { i: parents[i] for i in reached_nodes },
+                "end_nodes": end_indices
+                }
+        return path, debug_info
+
+def a_star_bidirectional( graph, start, end, avoid=[], min_height=0, initial_dir=None,
+        return_debug_info=False, heuristic="eucledian" ):
+    """ Bidirectional A* on a NavGraph between a single start and a single end node: one search
+    runs forward from the start, one backward from the end, and the path is found where they
+    meet. For long paths in large zones, this expands far fewer nodes than a_star_graph.
+
+    Both searches use the same ("average") potential p(v) = (h_end(v) - h_start(v))/2, the
+    forward search ordered by g + p, the backward search by g - p, where h_end and h_start are
+    the heuristic (see a_star_graph) towards the end and towards the start node. The search is
+    done once the smallest keys of both open lists add up to at least the cost of the best path
+    found so far.
+
+    Parameters are the same as for a_star_graph, but the searched edge costs must be the same in
+    both directions. min_height, avoid and blocked nodes are fine. The angular penalty is not: it
+    depends on the direction in which a path arrives at a node, so passing an initial_dir (which
+    enables the angular penalty in a_star_graph) raises a ValueError.
+    Returns the path as a list of node indices.
+    """
+    if initial_dir is not None:
+        raise ValueError( "The angular penalty depends on the search direction, it cannot be " +
+                "used with bidirectional search. Use a_star_graph instead!" )
+
+    max_heights = graph.max_heights
+    offsets = graph.offsets
+    neighbors = graph.neighbors
+    lengths = graph.lengths
+    blocked = graph.blocked
+
+    assert graph.zone_ids[start] == graph.zone_ids[end], "Cannot run A* for nodes from separete Zones. Zone_id must be the same for each node!"
+    if max_heights[end] < min_height:
+        raise PathUnreachableError( "End node is too low!" )
+
+    heuristic_to_end = make_heuristic( graph, heuristic, [end] )
+    heuristic_to_start = make_heuristic( graph, heuristic, [start] )
+
+    forward = get_workspace( graph, 0 )
+    backward = get_workspace( graph, 1 )
+    forward_generation = forward.start_search()
+    backward_generation = backward.start_search()
+    for i in avoid:
+        forward.closed[i] = forward_generation
+        backward.closed[i] = backward_generation
+
+    # Per direction: workspace, generation, open list, the other direction's workspace and
+    # generation and the sign of the potential:
+    forward_open_list = []
+    backward_open_list = []
+    directions = (
+            (forward, forward_generation, forward_open_list, backward, backward_generation, 1),
+            (backward, backward_generation, backward_open_list, forward, forward_generation, -1) )
+
+    def potentials( indices, sign ):
+        to_end = heuristic_to_end.for_nodes( graph.positions, indices )
+        to_start = heuristic_to_start.for_nodes( graph.positions, indices )
+        return [sign*(e - s)*0.5 for e, s in zip( to_end, to_start )]
+
+    for (workspace, generation, open_list, _, _, sign), i in zip( directions, (start, end) ):
+        workspace.g[i] = 0
+        workspace.h[i] = potentials( [i], sign )[0]
+        workspace.parents[i] = -1
+        workspace.reached[i] = generation
+        open_list.append( (workspace.h[i], i) )
+
+    # Cost of the best path found so far, and the edge at which its two halves meet:
+    best_cost = 0 if start == end else math.inf
+    meet_forward = meet_backward = start if start == end else -1
+
+    while len( forward_open_list ) > 0 and len( backward_open_list ) > 0:
+
+        if forward_open_list[0][0] + backward_open_list[0][0] >= best_cost:
+            # No path which is still open can be cheaper than the best one found so far:
+            break
+
+        # Continue in the direction which has the smaller key:
+        if forward_open_list[0][0] <= backward_open_list[0][0]:
+            workspace, generation, open_list, other, other_generation, sign = directions[0]
+        else:
+            workspace, generation, open_list, other, other_generation, sign = directions[1]
+        g = workspace.g
+        h = workspace.h
+        parents = workspace.parents
+        reached = workspace.reached
+        closed = workspace.closed
+
+        f, cur = heapq.heappop( open_list )
+        if closed[cur] == generation:
+            continue
+        closed[cur] = generation
+
+        begin, end_offset = offsets[cur], offsets[cur+1]
+        cur_neighbors = neighbors[begin:end_offset]
+        cur_lengths = lengths[begin:end_offset]
+        if min_height > 0 or blocked is not None:
+            if min_height > 0:
+                passable = max_heights[cur_neighbors] >= min_height
+                if blocked is not None:
+                    passable &= ~blocked[cur_neighbors]
+            else:
+                passable = ~blocked[cur_neighbors]
+            cur_neighbors = cur_neighbors[passable]
+            cur_lengths = cur_lengths[passable]
+        cur_neighbors = cur_neighbors.tolist()
+
+        new_neighbors = [n for n in cur_neighbors if reached[n] != generation]
+        if len( new_neighbors ) > 0:
+            for neighbor, value in zip( new_neighbors, potentials( new_neighbors, sign ) ):
+                reached[neighbor] = generation
+                h[neighbor] = value
+                g[neighbor] = math.inf
+
+        cur_g = g[cur]
+        for neighbor, length in zip( cur_neighbors, cur_lengths.tolist() ):
+            if closed[neighbor] == generation:
+                continue
+
+            new_g = cur_g + length
+            if other.reached[neighbor] == other_generation:
+                # The other search has already found a path to this neighbor:
+                cost = new_g + other.g[neighbor]
+                if cost < best_cost:
+                    best_cost = cost
+                    if sign > 0:
+                        meet_forward, meet_backward = cur, neighbor
+                    else:
+                        meet_forward, meet_backward = neighbor, cur
+
+            if g[neighbor] <= new_g:
+                continue
+            g[neighbor] = new_g
+            parents[neighbor] = cur
+            heapq.heappush( open_list, (new_g + h[neighbor], neighbor) )
+
+    if meet_forward < 0:
+        raise PathUnreachableError("Could not find path to target")
+
+    path = backtrack_indices( forward.parents, meet_forward )
+    if meet_backward != meet_forward:
+        path += backtrack_indices( backward.parents, meet_backward )[::-1]
+
+    if not return_debug_info:
+        return path
+    else:
+        closed_nodes = set()
+        open_nodes = set()
+        parents = {}
+        for workspace, generation, _, _, _, _ in directions:
+            for i in range( graph.num_nodes ):
+                if workspace.reached[i] == generation:
+                    if workspace.closed[i] == generation:
+                        closed_nodes.add( i )
+                    else:
+                        open_nodes.add( i )
+                    parents.setdefault( i, workspace.parents[i] )
+        debug_info = {
+                "closed": closed_nodes,
+                "open_list": list( open_nodes - closed_nodes ),
+                "parents": parents,
+                "end_nodes": [end]
+                }
+        return path, debug_info
+
 def path_to_mesh( nodes ):
     
     import bmesh
@@ -0,0 +1,128 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+# Benchmarks for the search heuristics and for the latency of full path queries (see
+# nav_mesh_builder.tune_nav_mesh). Run on a saved NavMesh with:
+#   python -m nav_mesh.benchmark nav_mesh.pickle [num_queries]
+
+import sys
+import time
+import random
+import numpy as np
+
+from . import a_star
+from .exceptions import PathUnreachableError
+
+def random_zone_queries( nav_mesh, num_queries=500, seed=0 ):
+    """ Random pairs of (start_index, end_index) of low-level nodes which are in the same zone """
+    rng = random.Random( seed )
+    zones = [zone for zone in nav_mesh.zones.values() if len( zone.nodes ) > 1]
+    queries = []
+    for i in range( num_queries ):
+        zone = rng.choice( zones )
+        start, end = rng.sample( zone.nodes, 2 )
+        queries.append( (start.index, end.index) )
+    return queries
+
+def random_path_queries( num_nodes, num_queries=500, seed=0 ):
+    """ Random (start_index, end_index) pairs of low-level nodes anywhere on the mesh. Node
+    indices don't change when a mesh is baked again with other settings, so the same queries
+    can be replayed on all bakes. """
+    rng = np.random.default_rng( seed )
+    return rng.integers( 0, num_nodes, size=(num_queries, 2) ).tolist()
+
+def benchmark_path_queries( nav_mesh, queries, warmup=10 ):
+    """ Time every query of the workload (rows of (start_index, end_index) or (start_index,
+    end_index, min_height)), each running the full path search (see NavMesh.find_path_indices).
+    The first few queries are run once before, untimed, so that one-time initialization doesn't
+    show up in the latencies.
+    Returns the latencies of the queries which found a path (in seconds) and the number of
+    queries which failed. Failed queries are usually rejected early, so their latencies are left
+    out, they would only make the statistics look better. """
+    requests = [(int(r[0]), int(r[1]), float(r[2]) if len(r) > 2 else 0) for r in queries]
+    for request in requests[:warmup]:
+        nav_mesh.find_path_indices( request )
+
+    latencies = []
+    failed = 0
+    for request in requests:
+        t = time.perf_counter()
+        high_level_path, low_level_path, error = nav_mesh.find_path_indices( request )
+        duration = time.perf_counter() - t
+        if error is None:
+            latencies.append( duration )
+        else:
+            failed += 1
+    return np.asarray( latencies ), failed
+
+def latency_statistics( latencies ):
+    """ Median, 99th percentile and mean of the latencies (in seconds) """
+    if len( latencies ) == 0:
+        return { "p50": 0.0, "p99": 0.0, "mean": 0.0 }
+    return {
+            "p50": float( np.percentile( latencies, 50 ) ),
+            "p99": float( np.percentile( latencies, 99 ) ),
+            "mean": float( np.mean( latencies ) ),
+            }
+
+def benchmark_heuristics( nav_mesh, heuristics=("eucledian", "landmarks"), queries=None ):
+    """ Run the same low-level queries with each of the heuristics. Returns a dict which holds, for
+    each heuristic, the number of expanded (closed) nodes per query, the mean path length and the
+    total time taken. """
+    if queries is None:
+        queries = random_zone_queries( nav_mesh )
+    graph = nav_mesh.graph
+
+    results = {}
+    for heuristic in heuristics:
+        expanded = []
+        lengths = []
+        duration = 0
+        for start, end in queries:
+            try:
+                t = time.time()
+                path = a_star.a_star_graph( graph, start, [end], heuristic=heuristic )
+                duration += time.time() - t
+                # Search again to count the expanded nodes, without timing the debug output:
+                path, debug_info = a_star.a_star_graph( graph, start, [end],
+                        heuristic=heuristic, return_debug_info=True )
+            except PathUnreachableError:
+                continue
+            expanded.append( len( debug_info["closed"] ) )
+            lengths.append( graph.path_length( path ) )
+        results[heuristic] = {
+                "expanded": np.asarray( expanded ),
+                "mean_path_length": float( np.mean( lengths ) ) if len( lengths ) > 0 else 0,
+                "time": duration,
+                }
+    return results
+
+def print_results( results ):
+    baseline = None
+    for heuristic, r in results.items():
+        expanded = r["expanded"].mean() if len( r["expanded"] ) > 0 else 0
+        line = f"{heuristic:>12}: {expanded:9.1f} expanded nodes per query, " + \
+                f"mean path length {r['mean_path_length']:.3f}, {r['time']:.3f} s"
+        if baseline is None:
+            baseline = expanded
+        elif baseline > 0:
+            line += f" ({100*(1 - expanded/baseline):.1f}% fewer expanded nodes)"
+        print( line )
+
+if __name__ == "__main__":
+
+    from .nav_mesh import NavMesh
+
+    nav_mesh = NavMesh.load_from_file( sys.argv[1] )
+    num_queries = int( sys.argv[2] ) if len( sys.argv ) > 2 else 500
+
+    t = time.time()
+    nav_mesh.init_landmarks()
+    print( f"Landmarks calculated in {time.time() - t:.3f} s " +
+            f"({nav_mesh.graph.landmarks.nbytes/1024:.1f} KiB)" )
+
+    results = benchmark_heuristics( nav_mesh,
+            queries=random_zone_queries( nav_mesh, num_queries ) )
+    print_results( results )
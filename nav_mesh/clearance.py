@@ -0,0 +1,275 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+# Ray casting against the triangles of a mesh, without needing blender. Used to find the
+# clearance above each vertex of the nav surface (see max_node_heights), like
+# nav_mesh_factory_utils.calculate_max_node_heights does with blender's BVHTree. The heights can
+# then be smoothed (see smooth_max_node_heights).
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial import KDTree
+
+# Rays start slightly above the surface, so that they don't hit the triangles they start on:
+RAY_START_OFFSET = 1e-3
+
+# Number of rays which are traced together. Small enough that the arrays of a traversal step
+# stay in the CPU caches, large enough that numpy's per-call overhead doesn't dominate:
+RAY_CHUNK_SIZE = 2048
+
+def ray_triangle_distances( origins, directions, a, edge_1, edge_2 ):
+    """ Distance along each ray to its triangle, both sides of the triangles count. Möller-Trumbore
+    intersection, returns inf where the ray misses the triangle.
+    All arguments are given per axis, with shape (3,N): the ray origins and directions, the
+    first corners of the triangles and their edges from the first to the second and third
+    corner. """
+    def cross( x, y ):
+        return ( x[1]*y[2] - x[2]*y[1], x[2]*y[0] - x[0]*y[2], x[0]*y[1] - x[1]*y[0] )
+
+    def dot( x, y ):
+        return x[0]*y[0] + x[1]*y[1] + x[2]*y[2]
+
+    p = cross( directions, edge_2 )
+    det = dot( edge_1, p )
+    with np.errstate( divide="ignore", invalid="ignore" ):
+        inv_det = 1/det
+        t_vec = ( origins[0] - a[0], origins[1] - a[1], origins[2] - a[2] )
+        u = dot( t_vec, p )*inv_det
+        q = cross( t_vec, edge_1 )
+        v = dot( directions, q )*inv_det
+        t = dot( edge_2, q )*inv_det
+    hit = (np.abs( det ) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0)
+    return np.where( hit, t, np.inf )
+
+def morton_codes( points ):
+    """ Interleave the bits of the points' (quantized) coordinates, so that sorting by the codes
+    keeps points which are close to each other close together """
+    low = points.min( axis=0 )
+    # Same scale for all axes, so that the cells are cubes:
+    extent = max( float( (points.max( axis=0 ) - low).max() ), 1e-12 )
+    cells = ((points - low)/extent*(2**21 - 1)).astype( np.uint64 )
+    codes = np.zeros( len( points ), dtype=np.uint64 )
+    for axis in range( 3 ):
+        x = cells[:,axis]
+        x = (x | (x << np.uint64( 32 ))) & np.uint64( 0x1f00000000ffff )
+        x = (x | (x << np.uint64( 16 ))) & np.uint64( 0x1f0000ff0000ff )
+        x = (x | (x << np.uint64( 8 ))) & np.uint64( 0x100f00f00f00f00f )
+        x = (x | (x << np.uint64( 4 ))) & np.uint64( 0x10c30c30c30c30c3 )
+        x = (x | (x << np.uint64( 2 ))) & np.uint64( 0x1249249249249249 )
+        codes |= x << np.uint64( axis )
+    return codes
+
+class TriangleBVH():
+    """ Bounding volume hierarchy over triangles (given by their corner positions).
+
+    The triangles are sorted along a space filling curve (by the Morton codes of their
+    centroids), and the tree is a complete binary tree over this order: node i has the children
+    2i+1 and 2i+2, and all leaves are on the lowest level. Node i covers the axis aligned box
+    from bounds_min[:,i] to bounds_max[:,i]. Leaves hold the (sorted) triangles
+    first[i] to first[i]+count[i], at most leaf_size of them.
+    Building needs no python loop over the nodes, so it is fast even for millions of triangles.
+    All per-node and per-triangle data is stored per axis (shape (3,N)), which keeps the
+    vectorized traversal fast. """
+
+    def __init__( self, corners, leaf_size=8 ):
+        corners = np.asarray( corners, dtype=np.float64 ).reshape( -1, 3, 3 )
+        self.leaf_size = leaf_size
+        self.num_triangles = num_triangles = len( corners )
+
+        self.depth = 0
+        while (num_triangles >> self.depth) > leaf_size:
+            self.depth += 1
+        self.num_nodes = 2**(self.depth + 1) - 1
+        self.first_leaf = 2**self.depth - 1
+
+        # Original index of each sorted triangle:
+        if num_triangles > 0:
+            self.triangle_order = np.argsort( morton_codes( corners.mean( axis=1 ) ),
+                    kind="stable" )
+        else:
+            self.triangle_order = np.zeros( 0, dtype=np.int64 )
+        corners = corners[self.triangle_order]
+        self.a = np.ascontiguousarray( corners[:,0].T )
+        self.edge_1 = np.ascontiguousarray( (corners[:,1] - corners[:,0]).T )
+        self.edge_2 = np.ascontiguousarray( (corners[:,2] - corners[:,0]).T )
+
+        # Leaf k holds the triangles from k*T/num_leaves on. Splitting the ranges like this at
+        # every level makes the ranges of a node's children add up to its own range:
+        num_leaves = 2**self.depth
+        leaf_starts = np.arange( num_leaves + 1, dtype=np.int64 )*num_triangles//num_leaves
+        self.first = np.zeros( self.num_nodes, dtype=np.int64 )
+        self.count = np.zeros( self.num_nodes, dtype=np.int64 )
+        self.first[self.first_leaf:] = leaf_starts[:-1]
+        self.count[self.first_leaf:] = np.diff( leaf_starts )
+
+        # Bounds of the leaves, then of each level above from the level below:
+        bounds_min = np.full( (self.num_nodes,3), np.inf )
+        bounds_max = np.full( (self.num_nodes,3), -np.inf )
+        if num_triangles > 0:
+            starts = leaf_starts[:-1]
+            nonempty = np.diff( leaf_starts ) > 0
+            leaves = self.first_leaf + np.flatnonzero( nonempty )
+            bounds_min[leaves] = np.minimum.reduceat( corners.min( axis=1 ), starts[nonempty],
+                    axis=0 )
+            bounds_max[leaves] = np.maximum.reduceat( corners.max( axis=1 ), starts[nonempty],
+                    axis=0 )
+        for level in range( self.depth - 1, -1, -1 ):
+            nodes = np.arange( 2**level - 1, 2**(level + 1) - 1 )
+            bounds_min[nodes] = np.minimum( bounds_min[2*nodes + 1], bounds_min[2*nodes + 2] )
+            bounds_max[nodes] = np.maximum( bounds_max[2*nodes + 1], bounds_max[2*nodes + 2] )
+        self.bounds_min = np.ascontiguousarray( bounds_min.T )
+        self.bounds_max = np.ascontiguousarray( bounds_max.T )
+
+    def ray_cast( self, origin, direction ):
+        """ Distance to the closest triangle hit by the ray, or None if it hits nothing (like
+        blender's BVHTree.ray_cast) """
+        dist = self.ray_cast_batch( np.reshape( origin, (1,3) ), np.reshape( direction, (1,3) ) )
+        return float( dist[0] ) if np.isfinite( dist[0] ) else None
+
+    def ray_cast_batch( self, origins, directions, chunk_size=RAY_CHUNK_SIZE ):
+        """ Distance to the closest triangle hit by each ray (origins and directions of shape
+        (N,3)), inf for rays which hit nothing. Rays are traced in chunks of chunk_size. """
+        origins = np.asarray( origins, dtype=np.float64 ).reshape( -1, 3 )
+        directions = np.asarray( directions, dtype=np.float64 ).reshape( -1, 3 )
+        dist = np.full( len( origins ), np.inf )
+        if self.num_triangles == 0:
+            return dist
+        for begin in range( 0, len( origins ), chunk_size ):
+            end = begin + chunk_size
+            dist[begin:end] = self.ray_cast_chunk( np.ascontiguousarray( origins[begin:end].T ),
+                    np.ascontiguousarray( directions[begin:end].T ) )
+        return dist
+
+    def ray_cast_chunk( self, origins, directions ):
+        """ Trace all rays (given per axis, shape (3,N)) at once, breadth first: the (ray, node)
+        pairs of one level of the tree are tested against the node boxes together, and those
+        that hit continue with the node's children. At the leaves, the rays are tested against
+        the leaves' triangles. """
+        # Avoid divisions by zero, so that the slab test below never sees inf*0:
+        safe_directions = np.where( directions == 0, 1e-30, directions )
+        inv_directions = 1/safe_directions
+        closest = np.full( origins.shape[1], np.inf )
+        rays = np.arange( origins.shape[1] )
+        nodes = np.zeros( origins.shape[1], dtype=np.int64 )
+        while len( rays ) > 0:
+            # Slab test of the rays against the nodes' boxes:
+            t_near = np.zeros( len( rays ) )
+            t_far = closest[rays]
+            for axis in range( 3 ):
+                origin = origins[axis][rays]
+                inv_direction = inv_directions[axis][rays]
+                t_1 = (self.bounds_min[axis][nodes] - origin)*inv_direction
+                t_2 = (self.bounds_max[axis][nodes] - origin)*inv_direction
+                t_near = np.maximum( t_near, np.minimum( t_1, t_2 ) )
+                t_far = np.minimum( t_far, np.maximum( t_1, t_2 ) )
+            hit = t_far >= t_near
+            rays, nodes = rays[hit], nodes[hit]
+            if len( rays ) == 0 or nodes[0] < self.first_leaf:
+                nodes = np.concatenate( (2*nodes + 1, 2*nodes + 2) )
+                rays = np.concatenate( (rays, rays) )
+                continue
+
+            # All remaining nodes are leaves (they're all on the same level):
+            counts = self.count[nodes]
+            ray_of_pair = np.repeat( rays, counts )
+            pair_starts = np.cumsum( counts ) - counts
+            triangles = np.repeat( self.first[nodes] - pair_starts, counts ) + \
+                    np.arange( counts.sum() )
+            dist = ray_triangle_distances( origins[:,ray_of_pair], directions[:,ray_of_pair],
+                    self.a[:,triangles], self.edge_1[:,triangles], self.edge_2[:,triangles] )
+            np.minimum.at( closest, ray_of_pair, dist )
+            break
+        return closest
+
+    def triangles_near( self, points, max_dists ):
+        """ Find all triangles in the leaves whose boxes are at most max_dists[i] away from
+        points[i] (points of shape (N,3)). Like ray_cast_chunk, all points descend the tree
+        together, level by level.
+        Returns the point index and the (original) triangle index of each such pair, sorted by
+        point index. """
+        points = np.ascontiguousarray( np.asarray( points, dtype=np.float64 ).reshape( -1, 3 ).T )
+        max_dists2 = np.asarray( max_dists, dtype=np.float64 )**2
+        queries = np.arange( points.shape[1] )
+        nodes = np.zeros( points.shape[1], dtype=np.int64 )
+        if self.num_triangles == 0:
+            queries = nodes = np.zeros( 0, dtype=np.int64 )
+        while len( queries ) > 0:
+            # Squared distance between the points and the nodes' boxes:
+            dist2 = np.zeros( len( queries ) )
+            for axis in range( 3 ):
+                point = points[axis][queries]
+                d = np.maximum( self.bounds_min[axis][nodes] - point, 0 ) + \
+                        np.maximum( point - self.bounds_max[axis][nodes], 0 )
+                dist2 += d*d
+            near = dist2 <= max_dists2[queries]
+            queries, nodes = queries[near], nodes[near]
+            if len( queries ) == 0 or nodes[0] >= self.first_leaf:
+                break
+            nodes = np.concatenate( (2*nodes + 1, 2*nodes + 2) )
+            queries = np.concatenate( (queries, queries) )
+
+        order = np.argsort( queries, kind="stable" )
+        queries, nodes = queries[order], nodes[order]
+        counts = self.count[nodes]
+        pair_starts = np.cumsum( counts ) - counts
+        triangles = np.repeat( self.first[nodes] - pair_starts, counts ) + \
+                np.arange( counts.sum() )
+        return np.repeat( queries, counts ), self.triangle_order[triangles]
+
+# BVH used by a worker process (see init_worker):
+worker_bvh = None
+
+def init_worker( bvh ):
+    """ Initializer for worker pools: keep the BVH, so it's only sent to each worker once """
+    global worker_bvh
+    worker_bvh = bvh
+
+def ray_cast_in_worker( task ):
+    origins, directions, chunk_size = task
+    return worker_bvh.ray_cast_batch( origins, directions, chunk_size )
+
+def max_node_heights( vertices, normals, triangles, workers=1, chunk_size=RAY_CHUNK_SIZE ):
+    """ The free space above each vertex: the distance along its normal until a triangle of the
+    mesh is hit. Vertices whose ray hits nothing get a height of 0 (they're considered not
+    passable), just like in nav_mesh_factory_utils.calculate_max_node_heights.
+    - triangles: vertex indices of the triangles (T,3)
+    - workers: number of worker processes which trace the rays (None for the number of CPUs).
+        With 1, all rays are traced in this process. """
+    vertices = np.asarray( vertices, dtype=np.float64 )
+    bvh = TriangleBVH( vertices[np.asarray( triangles, dtype=np.int64 ).reshape( -1 )] )
+
+    lengths = np.linalg.norm( normals, axis=1 )
+    valid = np.flatnonzero( lengths > 0 )
+    directions = normals[valid]/lengths[valid,np.newaxis]
+    origins = vertices[valid] + directions*RAY_START_OFFSET
+
+    if workers is None:
+        workers = os.cpu_count()
+    if workers <= 1 or len( valid ) <= chunk_size:
+        dist = bvh.ray_cast_batch( origins, directions, chunk_size )
+    else:
+        # A few tasks per worker, so that workers which finish early can take over some work:
+        parts = np.array_split( np.arange( len( valid ) ), 4*workers )
+        tasks = [(origins[part], directions[part], chunk_size) for part in parts]
+        with ProcessPoolExecutor( max_workers=workers, initializer=init_worker,
+                initargs=(bvh,) ) as pool:
+            dist = np.concatenate( list( pool.map( ray_cast_in_worker, tasks ) ) )
+
+    heights = np.zeros( len( vertices ) )
+    heights[valid] = np.where( np.isfinite( dist ), dist, 0 )
+    return heights
+
+def smooth_max_node_heights( positions, heights, radius=3 ):
+    """ Lower the height of every node to the lowest height of all nodes within radius of it
+    (including itself), so that agents keep some distance from low ceilings. All neighborhoods
+    are found with a single query, and the minimum is taken with one vectorized update. """
+    positions = np.asarray( positions, dtype=np.float64 ).reshape( -1, 3 )
+    heights = np.asarray( heights, dtype=np.float64 )
+    pairs = KDTree( positions ).query_pairs( r=radius, output_type="ndarray" )
+    smooth_heights = heights.copy()
+    np.minimum.at( smooth_heights, pairs[:,0], heights[pairs[:,1]] )
+    np.minimum.at( smooth_heights, pairs[:,1], heights[pairs[:,0]] )
+    return smooth_heights
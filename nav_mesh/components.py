@@ -0,0 +1,156 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+
+from . import entrance_costs
+
+def label_zone( graph, zone_id, min_height ):
+    """ Connected components of the nodes of the zone which are passable for the min_height (see
+    entrance_costs.zone_sub_graph). Returns the (sorted) indices of the passable nodes and the
+    label of each of them. """
+    zone_nodes, zone_matrix = entrance_costs.zone_sub_graph( graph, zone_id, min_height )
+    if len( zone_nodes ) == 0:
+        return zone_nodes, np.zeros( 0, dtype=np.int32 )
+    # Weakly connected: if two nodes are not even connected when ignoring the edge directions,
+    # there is definitely no path between them.
+    num_components, labels = connected_components( zone_matrix, directed=True,
+            connection="weak" )
+    return zone_nodes, labels
+
+class ConnectedComponents():
+    """ Connected-component labels, used to reject queries between nodes which can't be connected
+    by any path before searching.
+
+    The labels depend on the agent's height: only nodes with a max_height of at least min_height
+    (and which are not blocked) are passable. Nothing is calculated for the whole low-level graph
+    at once. Instead, the nodes of a zone are labeled when a query first needs them (see
+    zone_labels), and zones are joined through their entrances by the connected components of
+    the high-level graph of the min_height (see NavMesh.high_level_graph_for), which follows
+    the same entrance costs as the high-level search. The labels of the max_zones most recently
+    used zones (per height class) are kept, and dropped again when a zone is modified (see
+    zones_modified).
+    """
+
+    def __init__( self, max_classes=8, max_zones=1024 ):
+        self.max_classes = max_classes
+        self.max_zones = max_zones
+        # (min_height, zone_id) -> (passable nodes of the zone, their labels, high-level indices
+        # of the zone's entrances, labels of their transition nodes), least recently used first:
+        self.zones = OrderedDict()
+        # min_height -> (high-level graph, labels of its nodes), least recently used first. Each
+        # height class has its own high-level graph, and a graph is replaced whenever it changes:
+        self.high_level_classes = OrderedDict()
+        # Counts the calls to zones_modified, so that labels which were calculated while a zone
+        # was modified are not kept:
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def zone_labels( self, nav_mesh, zone_id, min_height=0 ):
+        """ Return the passable nodes of the zone, their labels, the high-level indices of the
+        zone's entrances and the labels of the entrances' transition nodes (-1 for entrances
+        which can't be crossed, see entrance_costs.transition_node) """
+        key = (float( min_height ), int( zone_id ))
+        with self.lock:
+            entry = self.zones.get( key )
+            if entry is not None:
+                self.zones.move_to_end( key )
+                return entry
+            generation = self.generation
+
+        zone_nodes, labels = label_zone( nav_mesh.graph, zone_id, min_height )
+        entrances = entrance_costs.zone_entrances( nav_mesh.zones[zone_id] )
+        entrance_indices = [e.node.index for e in entrances]
+        entrance_labels = []
+        for e in entrances:
+            i = entrance_costs.local_index( zone_nodes,
+                    entrance_costs.transition_node( e, zone_id, min_height ) )
+            entrance_labels.append( labels[i] if i >= 0 else -1 )
+        entry = (zone_nodes, labels, entrance_indices, entrance_labels)
+
+        with self.lock:
+            if generation != self.generation:
+                return entry
+            self.zones[key] = entry
+            while len( self.zones ) > self.max_zones:
+                self.zones.popitem( last=False )
+        return entry
+
+    def connected( self, nav_mesh, index_1, index_2, min_height=0 ):
+        """ False if the searches can't find a path from the first to the second low-level node:
+        either the nodes are in the same component of a zone, or the components of their zones
+        reach entrances which are connected in the high-level graph. The first node (where the
+        agent starts) may itself be too low or blocked, as long as one of its neighbors leads on.
+        True does not guarantee that there is a path, for example if the graph has one-way
+        edges. """
+        graph = nav_mesh.graph
+        zone_1 = int( graph.zone_ids[index_1] )
+        zone_2 = int( graph.zone_ids[index_2] )
+
+        zone_nodes, labels, entrances_2, entrance_labels = self.zone_labels( nav_mesh, zone_2,
+                min_height )
+        i = np.searchsorted( zone_nodes, index_2 )
+        if i >= len( zone_nodes ) or zone_nodes[i] != index_2:
+            return False
+        label_2 = labels[i]
+        ends = [e for e, label in zip( entrances_2, entrance_labels ) if label == label_2]
+
+        zone_nodes, labels, entrances_1, entrance_labels = self.zone_labels( nav_mesh, zone_1,
+                min_height )
+        if len( zone_nodes ) == 0:
+            return False
+        # The start node itself, or its neighbors in the zone if it isn't passable:
+        starts = np.asarray( [index_1] )
+        i = np.searchsorted( zone_nodes, index_1 )
+        if i >= len( zone_nodes ) or zone_nodes[i] != index_1:
+            starts = graph.direct_neighbors_of( index_1 )[0]
+        i = np.minimum( np.searchsorted( zone_nodes, starts ), len( zone_nodes ) - 1 )
+        labels_1 = set( labels[i[zone_nodes[i] == starts]].tolist() )
+        if zone_1 == zone_2 and label_2 in labels_1:
+            return True
+        begins = [e for e, label in zip( entrances_1, entrance_labels ) if label in labels_1]
+
+        if len( begins ) == 0 or len( ends ) == 0:
+            return False
+        return self.high_level_connected( nav_mesh.high_level_graph_for( min_height ), begins,
+                ends, min_height )
+
+    def zones_modified( self, zone_ids ):
+        """ Drop the labels of the given zones (of all height classes), after nodes in them were
+        blocked or unblocked. The labels of the high-level graphs are calculated again once the
+        graphs are replaced (see NavMesh.zones_modified). """
+        zone_ids = set( int( zone_id ) for zone_id in zone_ids )
+        with self.lock:
+            self.generation += 1
+            for key in [key for key in self.zones if key[1] in zone_ids]:
+                del self.zones[key]
+
+    def high_level_connected( self, high_level_graph, indices_1, indices_2, min_height=0 ):
+        """ False if none of the high-level nodes indices_1 is connected to any of indices_2 in
+        the high-level graph of the min_height (see NavMesh.high_level_graph_for) """
+        min_height = float( min_height )
+        with self.lock:
+            entry = self.high_level_classes.get( min_height )
+            if entry is None or entry[0] is not high_level_graph:
+                num_components, labels = connected_components(
+                        high_level_graph.to_sparse_matrix(), directed=True, connection="weak" )
+                entry = (high_level_graph, labels)
+            self.high_level_classes[min_height] = entry
+            self.high_level_classes.move_to_end( min_height )
+            while len( self.high_level_classes ) > self.max_classes:
+                self.high_level_classes.popitem( last=False )
+            labels = entry[1]
+        return len( set( labels[list( indices_1 )].tolist() ) &
+                set( labels[list( indices_2 )].tolist() ) ) > 0
+
+    def __getstate__( self ):
+        # The labels are calculated again when needed:
+        return { "max_classes": self.max_classes, "max_zones": self.max_zones }
+
+    def __setstate__( self, state ):
+        self.__init__( state["max_classes"], state.get( "max_zones", 1024 ) )
@@ -8,7 +8,7 @@ def display_debug_info( debug_info, all_nodes ):
     l = LineSegs()
     l.set_thickness(2)
 
-    node = debug_info["end_nodes"][0]
+    node = all_nodes[debug_info["end_nodes"][0]]
     zone_id = node.zone_id
     l.set_color( (1, 1, 1, 1) )
     l.set_thickness( 4 )
@@ -24,29 +24,34 @@ def display_debug_info( debug_info, all_nodes ):
         l.move_to( to_panda_vector(n.pos) + LVector3f.up()*0.1 )
         l.draw_to( to_panda_vector(n.pos) )
         l.set_thickness( 2 )
-        if n.parent_node_id >= 0:
-            parent_node = all_nodes[n.parent_node_id]
+        parent_node_id = debug_info["parents"].get( n.index, -1 )
+        if parent_node_id >= 0:
+            parent_node = all_nodes[parent_node_id]
             l.draw_to( to_panda_vector(parent_node.pos) )
 
     l.set_color( (0.5, 0.5, 1, 1) )
-    for n in debug_info["open_list"]:
+    open_nodes = [all_nodes[i] for i in debug_info["open_list"]]
+    for n in open_nodes:
         l.set_thickness( 4 )
         l.move_to( to_panda_vector(n.pos) + LVector3f.up()*0.1 )
         l.draw_to( to_panda_vector(n.pos) )
         l.set_thickness( 2 )
-        if n.parent_node_id >= 0:
-            parent_node = all_nodes[n.parent_node_id]
+        parent_node_id = debug_info["parents"].get( n.index, -1 )
+        if parent_node_id >= 0:
+            parent_node = all_nodes[parent_node_id]
             l.draw_to( to_panda_vector(parent_node.pos) )
 
 
     l.set_color( (1, 0.25, 0.25, 1) )
-    for n in debug_info["end_nodes"]:
+    end_nodes = [all_nodes[i] for i in debug_info["end_nodes"]]
+    for n in end_nodes:
         l.set_thickness( 20 )
         l.move_to( to_panda_vector(n.pos) + LVector3f.up()*0.9 )
         l.draw_to( to_panda_vector(n.pos) )
         l.set_thickness( 2 )
-        if n.parent_node_id >= 0:
-            parent_node = all_nodes[n.parent_node_id]
+        parent_node_id = debug_info["parents"].get( n.index, -1 )
+        if parent_node_id >= 0:
+            parent_node = all_nodes[parent_node_id]
             l.draw_to( to_panda_vector(parent_node.pos) )
 
     geom = l.create()
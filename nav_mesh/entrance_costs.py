@@ -0,0 +1,259 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import scipy.sparse
+from scipy.sparse.csgraph import dijkstra
+
+from . import nav_graph
+from . import node_registry
+
+def zone_entrances( zone ):
+    """ All entrances of a zone, in a fixed order """
+    entrances = []
+    for other_zone_id in sorted( zone.entrances.keys() ):
+        entrances += zone.entrances[other_zone_id]
+    return entrances
+
+def crossable( node, entrance, min_height ):
+    """ True if agents which need min_height can cross the entrance at the (low-level) node: both
+    the node and the node on the other side (see NavNode.get_node_on_other_side) are high
+    enough """
+    if node.max_height < min_height:
+        return False
+    other = node.get_node_on_other_side( entrance )
+    return other is not None and other.max_height >= min_height
+
+def transition_node( entrance, zone_id, min_height=0 ):
+    """ The node of the entrance on the side of the given zone which is closest to the entrance's
+    center, out of those at which agents which need min_height can cross (see crossable).
+    High-level costs are measured between these nodes. """
+    if isinstance( entrance.nodes, node_registry.NodeSubset ):
+        # Entrances of meshes created from arrays, look the nodes up in the arrays directly:
+        arrays = entrance.node.registry.arrays[0]
+        indices = entrance.nodes.indices
+        indices = indices[(arrays.zone_ids[indices] == zone_id) &
+                (arrays.max_heights[indices] >= min_height)]
+        if min_height > 0:
+            indices = indices[[crossable( entrance.nodes.nodes[int( i )], entrance, min_height )
+                    for i in indices]]
+        if len( indices ) == 0:
+            return None
+        dist2 = ((arrays.positions[indices] - entrance.node.pos)**2).sum( axis=1 )
+        return entrance.nodes.nodes[int( indices[np.argmin( dist2 )] )]
+    nodes = [n for n in entrance.nodes if n.zone_id == zone_id and n.max_height >= min_height]
+    if min_height > 0:
+        nodes = [n for n in nodes if crossable( n, entrance, min_height )]
+    if len( nodes ) == 0:
+        return None
+    center = entrance.node.pos
+    return min( nodes, key=lambda n: ((n.pos - center)**2).sum() )
+
+def zone_sub_graph( graph, zone_id, min_height=0, include=None, skip_blocked=True ):
+    """ Return the (sorted) indices of all nodes in the zone which are at least min_height high
+    and not blocked (unless skip_blocked is False), and the matrix of edge lengths between them.
+    The node with the index include (if given) is kept even if it is too low or blocked. """
+    zone_nodes = graph.zone_node_indices( zone_id )
+    passable = graph.max_heights[zone_nodes] >= min_height
+    if skip_blocked and graph.blocked is not None:
+        passable &= ~graph.blocked[zone_nodes]
+    if include is not None:
+        passable |= zone_nodes == include
+    zone_nodes = np.asarray( zone_nodes[passable], dtype=np.int64 )
+    num_nodes = len( zone_nodes )
+
+    # Gather the CSR rows of the zone's nodes (like zone_pager.ZonePage.load, so only the zone's
+    # part of the graph's arrays is read) and keep the edges which lead to other nodes in the
+    # sub-graph:
+    begins = graph.offsets[zone_nodes]
+    counts = graph.offsets[zone_nodes + 1] - begins
+    row_offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+    row_offsets[1:] = np.cumsum( counts )
+    edges = np.repeat( begins - row_offsets[:-1], counts ) + np.arange( row_offsets[-1] )
+    targets = graph.neighbors[edges]
+    columns = np.minimum( np.searchsorted( zone_nodes, targets ), max( num_nodes - 1, 0 ) )
+    inside = zone_nodes[columns] == targets if num_nodes > 0 else np.zeros( 0, dtype=bool )
+    row_of_edge = np.repeat( np.arange( num_nodes ), counts )
+    offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+    offsets[1:] = np.cumsum( np.bincount( row_of_edge[inside], minlength=num_nodes ) )
+    zone_matrix = scipy.sparse.csr_matrix( (graph.lengths[edges[inside]], columns[inside],
+            offsets), shape=(num_nodes, num_nodes) )
+    return zone_nodes, zone_matrix
+
+def local_index( zone_nodes, node ):
+    """ Position of the node's index in zone_nodes, or -1 if it is not in there """
+    if node is None:
+        return -1
+    index = node.index
+    i = np.searchsorted( zone_nodes, index )
+    if i < len( zone_nodes ) and zone_nodes[i] == index:
+        return int(i)
+    return -1
+
+def calculate_entrance_costs( nav_mesh, min_height=0 ):
+    """ For every zone, find the cost of the shortest low-level path between every pair of its
+    entrances (see calculate_zone_entrance_costs).
+    Returns a dict which holds a list of (entrance_node_index_1, entrance_node_index_2, cost) for
+    each zone id. """
+    return { zone_id: calculate_zone_entrance_costs( nav_mesh, zone_id, min_height )
+            for zone_id in nav_mesh.zones.keys() }
+
+def calculate_zone_entrance_costs( nav_mesh, zone_id, min_height=0 ):
+    """ Find the cost of the shortest low-level path between every pair of entrances of the zone.
+    The cost between two entrances is the length of the shortest path between their transition
+    nodes (see transition_node), using only nodes in the zone which are at least min_height high
+    and not blocked.
+    Returns a list of (entrance_node_index_1, entrance_node_index_2, cost). Entrances which can't
+    be reached from each other within the zone have no entry.
+    """
+
+    costs = []
+
+    entrances = zone_entrances( nav_mesh.zones[zone_id] )
+    if len( entrances ) < 2:
+        return costs
+
+    zone_nodes, zone_matrix = zone_sub_graph( nav_mesh.graph, zone_id, min_height )
+
+    # Position of each entrance's transition node in zone_nodes (or -1 if it is not passable):
+    sources = [local_index( zone_nodes, transition_node( e, zone_id, min_height ) )
+            for e in entrances]
+    valid = [i for i in range( len( entrances ) ) if sources[i] >= 0]
+    if len( valid ) < 2:
+        return costs
+
+    # Distances from each transition node to all other nodes in the zone:
+    dist = dijkstra( zone_matrix, indices=[sources[i] for i in valid] )
+    for k, i in enumerate( valid ):
+        for j in valid[k+1:]:
+            cost = dist[k,sources[j]]
+            if np.isfinite( cost ):
+                costs.append( (entrances[i].node.index, entrances[j].node.index, float(cost)) )
+
+    return costs
+
+def costs_to_entrances( nav_mesh, node, min_height=0, is_start=False ):
+    """ Find the low-level path costs from the (low-level) node to the transition nodes of all
+    entrances of its zone. This connects a start or end node to the high-level graph. Like the
+    low-level search, a start node (is_start) may be too low or blocked itself.
+    Returns a dict of {entrance_node_index: cost}, without entrances which can't be reached. """
+
+    zone = nav_mesh.zones[node.zone_id]
+    zone_nodes, zone_matrix = zone_sub_graph( nav_mesh.graph, node.zone_id, min_height,
+            include=node.index if is_start else None )
+    source = local_index( zone_nodes, node )
+    if source < 0:
+        return {}
+
+    dist = dijkstra( zone_matrix, indices=source )
+    costs = {}
+    for e in zone_entrances( zone ):
+        target = local_index( zone_nodes, transition_node( e, node.zone_id, min_height ) )
+        if target >= 0 and np.isfinite( dist[target] ):
+            costs[e.node.index] = float( dist[target] )
+    return costs
+
+def build_high_level_graph( nav_mesh, entrance_costs ):
+    """ Build the high-level graph used for routing between zones (HPA*).
+
+    Entrance nodes are connected to the other entrances of the same zone, weighted by the
+    actual low-level path cost between them (see calculate_entrance_costs). Zone nodes have no
+    edges. Instead, a high-level search starts at the entrances of the start zone and ends at
+    the entrances of the end zone (see NavMesh.find_high_level_path).
+    """
+    nodes = nav_mesh.high_level_nodes
+
+    sources = []
+    targets = []
+    lengths = []
+    for zone_id, costs in entrance_costs.items():
+        for index_1, index_2, cost in costs:
+            sources += [index_1, index_2]
+            targets += [index_2, index_1]
+            lengths += [cost, cost]
+
+    return nav_graph.NavGraph.from_edges(
+            [n.pos for n in nodes],
+            [n.zone_id if n.zone_id is not None else -1 for n in nodes],
+            [n.max_height for n in nodes],
+            sources, targets, lengths, nodes=nodes )
+
+def update_high_level_graph( nav_mesh, high_level_graph, entrance_costs, zone_ids ):
+    """ Return a copy of the high-level graph (see build_high_level_graph) in which only the edges
+    of the entrances of the given zones are built again from the entrance costs. An entrance
+    also has edges in the zone on its other side, so the costs of the neighboring zones are
+    taken into account for these entrances as well. """
+    rows = set()
+    zones = set()
+    for zone_id in zone_ids:
+        zone = nav_mesh.zones[zone_id]
+        rows.update( e.node.index for e in zone_entrances( zone ) )
+        zones.add( zone_id )
+        zones.update( zone.entrances.keys() )
+
+    sources = []
+    targets = []
+    lengths = []
+    for zone_id in zones:
+        for index_1, index_2, cost in entrance_costs.get( zone_id, [] ):
+            if index_1 in rows:
+                sources.append( index_1 )
+                targets.append( index_2 )
+                lengths.append( cost )
+            if index_2 in rows:
+                sources.append( index_2 )
+                targets.append( index_1 )
+                lengths.append( cost )
+
+    return high_level_graph.with_replaced_rows( sorted( rows ), sources, targets, lengths )
+
+class HeightClassGraphs():
+    """ Entrance costs and high-level graphs for agents which need a min_height above 0, one per
+    min_height (a "height class", see NavMesh.high_level_graph_for). The costs of a class only
+    follow paths on which all nodes are high enough, so entrances which the agent can't reach or
+    fit through have no edges. Built on first use, only the max_classes most recently used ones
+    are kept. """
+
+    def __init__( self, max_classes=8 ):
+        self.max_classes = max_classes
+        # min_height -> (entrance costs, high-level graph), least recently used first:
+        self.classes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get( self, nav_mesh, min_height ):
+        """ Return the high-level graph for the min_height """
+        min_height = float( min_height )
+        with self.lock:
+            entry = self.classes.get( min_height )
+            if entry is not None:
+                self.classes.move_to_end( min_height )
+                return entry[1]
+
+        costs = calculate_entrance_costs( nav_mesh, min_height )
+        graph = build_high_level_graph( nav_mesh, costs )
+
+        with self.lock:
+            self.classes[min_height] = (costs, graph)
+            while len( self.classes ) > self.max_classes:
+                self.classes.popitem( last=False )
+        return graph
+
+    def zones_modified( self, nav_mesh, zone_ids ):
+        """ Update the costs of the given zones and the graphs of all classes """
+        with self.lock:
+            for min_height, (costs, graph) in list( self.classes.items() ):
+                for zone_id in zone_ids:
+                    costs[zone_id] = calculate_zone_entrance_costs( nav_mesh, zone_id, min_height )
+                self.classes[min_height] = (costs, update_high_level_graph( nav_mesh, graph,
+                        costs, zone_ids ))
+
+    def __getstate__( self ):
+        # The graphs are built again when needed:
+        return { "max_classes": self.max_classes }
+
+    def __setstate__( self, state ):
+        self.__init__( state["max_classes"] )
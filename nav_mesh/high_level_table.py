@@ -0,0 +1,86 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import numpy as np
+from scipy.sparse.csgraph import shortest_path
+
+from .exceptions import PathUnreachableError
+
+class HighLevelTable():
+    """ Precomputed shortest paths between all pairs of (a subset of the) nodes of the high-level
+    graph.
+
+    rows[i] is the row of high-level node i in the table, or -1 if it is not in the table;
+    nodes[r] is the high-level node index of row r.
+    dist[r1,r2] is the cost of the shortest path from row r1 to row r2 (inf if there is none),
+    next_hop[r1,r2] is the row of the node which follows r1 on that path.
+    """
+
+    def __init__( self, rows, nodes, dist, next_hop ):
+        self.rows = rows
+        self.nodes = nodes
+        self.dist = dist
+        self.next_hop = next_hop
+
+    @staticmethod
+    def from_graph( graph, nodes=None ):
+        """ Calculate the table for a high-level NavGraph (by running Dijkstra from every node).
+        The graph must be undirected, i.e. every edge must exist in both directions with the same
+        length. If nodes (a list of node indices) is given, only paths between these nodes are
+        stored and all paths must run along these nodes only. """
+        if nodes is None:
+            nodes = np.arange( graph.num_nodes, dtype=np.int32 )
+        nodes = np.asarray( sorted( nodes ), dtype=np.int32 )
+        rows = np.full( graph.num_nodes, -1, dtype=np.int32 )
+        rows[nodes] = np.arange( len( nodes ), dtype=np.int32 )
+
+        matrix = graph.to_sparse_matrix()[nodes][:,nodes]
+        dist, predecessors = shortest_path( matrix, method="D", directed=True,
+                return_predecessors=True )
+        # predecessors[r2,r1] is the node before r1 on the path from r2 to r1. Since the graph is
+        # undirected, that's the node after r1 on the (reversed) path from r1 to r2:
+        next_hop = np.ascontiguousarray( predecessors.T, dtype=np.int32 )
+        return HighLevelTable( rows, nodes, dist.astype( np.float32 ), next_hop )
+
+    @property
+    def nbytes( self ):
+        return self.rows.nbytes + self.nodes.nbytes + self.dist.nbytes + self.next_hop.nbytes
+
+    def distance( self, index_from, index_to ):
+        """ Cost of the shortest path between two high-level nodes """
+        return float( self.dist[self.rows[index_from],self.rows[index_to]] )
+
+    def path( self, index_from, index_to ):
+        """ Return the shortest path between two high-level nodes, as a list of high-level node
+        indices, by walking along the next_hop table """
+        cur = self.rows[index_from]
+        target = self.rows[index_to]
+        if not np.isfinite( self.dist[cur,target] ):
+            raise PathUnreachableError( "No high-level path between the nodes" )
+        path = [int(self.nodes[cur])]
+        while cur != target:
+            cur = self.next_hop[cur,target]
+            path.append( int(self.nodes[cur]) )
+        return path
+
+    def find_path( self, start_costs, end_costs ):
+        """ Find the cheapest path from any of the start nodes to any of the end nodes.
+        - start_costs: dict of {high-level node index: cost to get to this node}
+        - end_costs: dict of {high-level node index: cost to get from this node to the end}
+        Returns the path (list of high-level node indices) and its cost, including the start and
+        end costs. """
+        starts = list( start_costs.keys() )
+        ends = list( end_costs.keys() )
+        start_rows = self.rows[starts]
+        end_rows = self.rows[ends]
+        total = np.asarray( list( start_costs.values() ) )[:,None] + \
+                self.dist[start_rows[:,None],end_rows[None,:]] + \
+                np.asarray( list( end_costs.values() ) )[None,:]
+        best = np.argmin( total )
+        cost = total.flat[best]
+        if not np.isfinite( cost ):
+            raise PathUnreachableError( "No high-level path between the start and end zone" )
+        i, j = np.unravel_index( best, total.shape )
+        return self.path( starts[i], ends[j] ), float( cost )
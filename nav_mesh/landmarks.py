@@ -0,0 +1,69 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from . import entrance_costs
+
+class Landmarks():
+    """ Landmarks for the ALT heuristic (A*, Landmarks, Triangle inequality).
+
+    Every zone gets its own landmarks (up to num_landmarks nodes of the zone). distances[i,k] is
+    the length of the shortest path, within the zone, between node i and the k-th landmark of
+    node i's zone (inf if there is no such path or the zone has fewer landmarks). Since
+    searches never leave a zone, only these distances are needed.
+
+    By the triangle inequality, |distances[v,k] - distances[t,k]| is a lower bound for the path
+    length between two nodes v and t of the same zone (see a_star.LandmarkHeuristic).
+    The distances are measured on the unblocked graph at min_height 0. Blocking nodes or
+    searching with a min_height only makes paths longer, so the bound stays valid. """
+
+    def __init__( self, landmarks, distances ):
+        # Node indices of the landmarks of each zone, -1 where a zone has fewer landmarks:
+        self.landmarks = landmarks
+        self.distances = distances
+
+    @property
+    def num_landmarks( self ):
+        return self.distances.shape[1]
+
+    @property
+    def nbytes( self ):
+        return self.landmarks.nbytes + self.distances.nbytes
+
+    @staticmethod
+    def from_graph( graph, num_landmarks=8 ):
+        """ Choose the landmarks of every zone and calculate the distances to them.
+        Landmarks are chosen by farthest-point selection: the first landmark is the node farthest
+        away from an arbitrary node of the zone, every following landmark is the node farthest
+        away from all landmarks chosen so far. Landmarks on the "edges" of a zone give the
+        tightest bounds. """
+
+        num_zones = int( graph.zone_ids.max() ) + 1 if graph.num_nodes > 0 else 0
+        landmarks = np.full( (num_zones, num_landmarks), -1, dtype=np.int32 )
+        distances = np.full( (graph.num_nodes, num_landmarks), np.inf, dtype=np.float32 )
+
+        for zone_id in range( num_zones ):
+            zone_nodes, zone_matrix = entrance_costs.zone_sub_graph( graph, zone_id,
+                    min_height=-np.inf, skip_blocked=False )
+            if len( zone_nodes ) == 0:
+                continue
+
+            # Distance from each node to the closest landmark chosen so far:
+            min_dist = dijkstra( zone_matrix, indices=0 )
+            for k in range( min( num_landmarks, len( zone_nodes ) ) ):
+                # Unreachable nodes (inf) are chosen first, so that every part of a zone which is
+                # not connected to the rest gets a landmark:
+                landmark = int( np.argmax( min_dist ) )
+                dist = dijkstra( zone_matrix, indices=landmark )
+                landmarks[zone_id,k] = zone_nodes[landmark]
+                distances[zone_nodes,k] = dist
+                if k == 0:
+                    min_dist = dist
+                else:
+                    min_dist = np.minimum( min_dist, dist )
+
+        return Landmarks( landmarks, distances )
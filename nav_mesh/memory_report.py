@@ -0,0 +1,78 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+# Compares the memory used by the nodes of a NavMesh when every node holds its own data with the
+# memory used when the data is compacted into arrays (see NodeRegistry.compact). Run with:
+#   python -m nav_mesh.memory_report nav_mesh.pickle
+
+import sys
+import copy
+
+def object_size( obj ):
+    """ Size of the object plus the containers and numbers it holds directly. Nodes are not
+    followed, shared objects (like the registry) are not counted. """
+    size = sys.getsizeof( obj )
+    if isinstance( obj, (set, list, tuple) ):
+        size += sum( object_size( o ) for o in obj if isinstance( o, (int, float) ) )
+    elif isinstance( obj, dict ):
+        size += sum( object_size( k ) + object_size( v ) for k, v in obj.items() )
+    return size
+
+def node_size( node ):
+    """ Memory held by a single node, including its own numpy arrays, sets and dicts """
+    size = sys.getsizeof( node )
+    for name in node.state_attributes:
+        if name in ("registry", "entrance"):
+            continue
+        value = getattr( node, name )
+        if value is None or isinstance( value, bool ):
+            continue
+        if isinstance( value, int ) and -5 <= value <= 256:
+            continue    # Small ints are cached by python
+        size += object_size( value )
+    return size
+
+def nodes_memory( registry ):
+    """ Return the number of bytes used by the nodes of the registry (node objects plus arrays),
+    per level """
+    sizes = []
+    for level, nodes in enumerate( registry.levels ):
+        size = sys.getsizeof( nodes ) + sum( node_size( n ) for n in nodes if n is not None )
+        if registry.arrays[level] is not None:
+            size += registry.arrays[level].nbytes
+        sizes.append( size )
+    return sizes
+
+def memory_report( nav_mesh ):
+    """ Measure the memory used by the nodes of the mesh in both layouts. The "objects" layout is
+    measured on a copy of the mesh's nodes, the mesh itself is not changed.
+    Returns a dict with the bytes per level for the "objects" and the "compact" layout. """
+    registry = nav_mesh.registry
+    expanded = copy.deepcopy( registry )
+    expanded.expand()
+    compact = copy.deepcopy( expanded )
+    compact.compact()
+    return { "objects": nodes_memory( expanded ), "compact": nodes_memory( compact ),
+            "num_nodes": [len( registry.nodes( level ) ) for level in range( len( registry.levels ) )] }
+
+def print_memory_report( report ):
+    for level in range( len( report["objects"] ) ):
+        num_nodes = report["num_nodes"][level]
+        objects = report["objects"][level]
+        compact = report["compact"][level]
+        print( f"Level {level} ({num_nodes} nodes):" )
+        if num_nodes == 0:
+            continue
+        print( f"\tone object per node: {objects/1024**2:9.2f} MiB " +
+                f"({objects/num_nodes:.0f} bytes per node)" )
+        print( f"\tcompact arrays:      {compact/1024**2:9.2f} MiB " +
+                f"({compact/num_nodes:.0f} bytes per node, {objects/max(compact,1):.1f}x smaller)" )
+
+if __name__ == "__main__":
+
+    from .nav_mesh import NavMesh
+
+    nav_mesh = NavMesh.load_from_file( sys.argv[1] )
+    print_memory_report( memory_report( nav_mesh ) )
@@ -0,0 +1,195 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+# Load the vertices and faces of a mesh from OBJ or PLY files, without needing blender.
+# Faces are returned as a list of vertex index lists (polygons may have any number of corners),
+# or as an integer array of shape (F,k) if all faces have k corners.
+
+import os
+import numpy as np
+
+def load_mesh( filename ):
+    """ Load the vertices (V,3) and faces of an OBJ or PLY file, depending on the file ending """
+    ending = os.path.splitext( filename )[1].lower()
+    if ending == ".obj":
+        return load_obj( filename )
+    if ending == ".ply":
+        return load_ply( filename )
+    raise ValueError( f"Unknown mesh file type: {filename} (expected .obj or .ply)" )
+
+def load_obj( filename ):
+    """ Load a Wavefront OBJ file. Only the vertex positions ('v') and faces ('f') are read, all
+    objects and groups in the file are merged into one mesh. """
+    vertices = []
+    faces = []
+    with open( filename, "r" ) as f:
+        for line in f:
+            if line.startswith( "v " ):
+                values = line.split()
+                vertices.append( (float( values[1] ), float( values[2] ), float( values[3] )) )
+            elif line.startswith( "f " ):
+                face = []
+                for corner in line.split()[1:]:
+                    # Corners are given as vertex/texture/normal, indices start at 1. Negative
+                    # indices count back from the last vertex read so far:
+                    index = int( corner.split( "/", 1 )[0] )
+                    face.append( index - 1 if index > 0 else len( vertices ) + index )
+                faces.append( face )
+    return np.asarray( vertices, dtype=np.float64 ).reshape( -1, 3 ), uniform_faces( faces )
+
+# PLY property types and the corresponding numpy types:
+PLY_TYPES = {
+        "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+        "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+        "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+        "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+        }
+
+def load_ply( filename ):
+    """ Load a PLY file (ascii or binary). Reads the x, y, z properties of the 'vertex' element
+    and the vertex index list of the 'face' element. """
+    with open( filename, "rb" ) as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError( f"Not a PLY file: {filename}" )
+
+        # Parse the header into a list of elements, each with its number of entries and its
+        # properties. Properties are (name, type) or, for lists, (name, count type, item type):
+        file_format = None
+        elements = []
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError( f"Unexpected end of PLY header: {filename}" )
+            words = line.decode( "ascii" ).split()
+            if len( words ) == 0 or words[0] in ( "comment", "obj_info" ):
+                continue
+            if words[0] == "end_header":
+                break
+            if words[0] == "format":
+                file_format = words[1]
+            elif words[0] == "element":
+                elements.append( (words[1], int( words[2] ), []) )
+            elif words[0] == "property":
+                if words[1] == "list":
+                    elements[-1][2].append( (words[4], PLY_TYPES[words[2]], PLY_TYPES[words[3]]) )
+                else:
+                    elements[-1][2].append( (words[2], PLY_TYPES[words[1]]) )
+
+        if file_format == "ascii":
+            data = read_ply_ascii( f, elements )
+        elif file_format in ( "binary_little_endian", "binary_big_endian" ):
+            byte_order = "<" if file_format == "binary_little_endian" else ">"
+            data = read_ply_binary( f.read(), elements, byte_order )
+        else:
+            raise ValueError( f"Unknown PLY format: {file_format}" )
+
+    vertex = data["vertex"]
+    vertices = np.stack( (vertex["x"], vertex["y"], vertex["z"]), axis=1 ).astype( np.float64 )
+    face = data.get( "face", {} )
+    faces = face.get( "vertex_indices", face.get( "vertex_index", [] ) )
+    return vertices, faces
+
+def read_ply_ascii( f, elements ):
+    data = {}
+    for name, count, properties in elements:
+        rows = [f.readline().split() for i in range( count )]
+        values = {}
+        if all( len( p ) == 2 for p in properties ):
+            table = np.asarray( rows, dtype=np.float64 ).reshape( count, len( properties ) )
+            for i, (prop_name, dtype) in enumerate( properties ):
+                values[prop_name] = table[:,i].astype( dtype )
+        else:
+            columns = {p[0]: [] for p in properties}
+            for row in rows:
+                pos = 0
+                for prop in properties:
+                    if len( prop ) == 2:
+                        columns[prop[0]].append( float( row[pos] ) )
+                        pos += 1
+                    else:
+                        length = int( row[pos] )
+                        columns[prop[0]].append( [int( v ) for v in row[pos+1:pos+1+length]] )
+                        pos += 1 + length
+            for prop in properties:
+                column = columns[prop[0]]
+                values[prop[0]] = np.asarray( column, dtype=prop[1] ) if len( prop ) == 2 else \
+                        uniform_faces( column )
+        data[name] = values
+    return data
+
+def read_ply_binary( buffer, elements, byte_order ):
+    data = {}
+    pos = 0
+    for name, count, properties in elements:
+        if all( len( p ) == 2 for p in properties ):
+            dtype = np.dtype( [(p[0], byte_order + p[1]) for p in properties] )
+            table = np.frombuffer( buffer, dtype=dtype, count=count, offset=pos )
+            data[name] = { p[0]: table[p[0]] for p in properties }
+            pos += dtype.itemsize*count
+            continue
+
+        # Elements with lists. Try reading them as if all lists had the length of the first one
+        # (all triangles, for example), and only fall back to reading one entry after another if
+        # that is not the case:
+        table, size = read_uniform_ply_lists( buffer, pos, count, properties, byte_order )
+        if table is not None:
+            data[name] = table
+            pos += size
+            continue
+        columns = {p[0]: [] for p in properties}
+        for i in range( count ):
+            for prop in properties:
+                if len( prop ) == 2:
+                    dtype = np.dtype( byte_order + prop[1] )
+                    columns[prop[0]].append( np.frombuffer( buffer, dtype, 1, pos )[0] )
+                    pos += dtype.itemsize
+                else:
+                    count_dtype = np.dtype( byte_order + prop[1] )
+                    item_dtype = np.dtype( byte_order + prop[2] )
+                    length = int( np.frombuffer( buffer, count_dtype, 1, pos )[0] )
+                    pos += count_dtype.itemsize
+                    columns[prop[0]].append(
+                            np.frombuffer( buffer, item_dtype, length, pos ).tolist() )
+                    pos += item_dtype.itemsize*length
+        data[name] = { p[0]: (np.asarray( columns[p[0]] ) if len( p ) == 2 else
+                uniform_faces( columns[p[0]] )) for p in properties }
+    return data
+
+def read_uniform_ply_lists( buffer, pos, count, properties, byte_order ):
+    """ Read an element whose lists all have the same length. Returns the values and the number of
+    bytes read, or (None, 0) if the lists have different lengths. """
+    fields = []
+    offset = pos
+    for prop in properties:
+        if len( prop ) == 2:
+            fields.append( (prop[0], byte_order + prop[1]) )
+            offset += np.dtype( prop[1] ).itemsize
+        else:
+            count_dtype = np.dtype( byte_order + prop[1] )
+            if offset + count_dtype.itemsize > len( buffer ):
+                return None, 0
+            length = int( np.frombuffer( buffer, count_dtype, 1, offset )[0] )
+            fields.append( (prop[0] + ".count", byte_order + prop[1]) )
+            fields.append( (prop[0], byte_order + prop[2], (length,)) )
+            offset += count_dtype.itemsize + np.dtype( prop[2] ).itemsize*length
+    dtype = np.dtype( fields )
+    if pos + dtype.itemsize*count > len( buffer ):
+        return None, 0
+    table = np.frombuffer( buffer, dtype=dtype, count=count, offset=pos )
+    values = {}
+    for field in fields:
+        if len( field ) == 3:
+            if (table[field[0] + ".count"] != field[2][0]).any():
+                return None, 0
+            values[field[0]] = table[field[0]].astype( np.int64 )
+        elif not field[0].endswith( ".count" ):
+            values[field[0]] = table[field[0]]
+    return values, dtype.itemsize*count
+
+def uniform_faces( faces ):
+    """ Turn the list of faces into an array of shape (F,k) if all faces have k corners """
+    if len( faces ) > 0 and all( len( face ) == len( faces[0] ) for face in faces ):
+        return np.asarray( faces, dtype=np.int64 )
+    return faces
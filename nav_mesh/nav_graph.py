@@ -0,0 +1,232 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import numpy as np
+import scipy.sparse
+
+class NavGraph():
+    """ Compact, array-backed representation of the nodes of one level of a NavMesh.
+
+    The edges are stored in compressed sparse row (CSR) form: the neighbors of node i are
+    neighbors[offsets[i]:offsets[i+1]], the lengths of the corresponding edges are
+    lengths[offsets[i]:offsets[i+1]]. Edges between nodes of the same zone ("direct" neighbors)
+    and edges which lead into another zone ("next level" neighbors) are kept in two separate
+    CSR structures, just like NavNode keeps them in two separate sets.
+
+    All per-node data is indexed by node index, so node indices must run from 0 to N-1.
+    The NavNode objects are not needed for searching the graph. If they are given, they are only
+    used to turn the node indices of a result back into nodes (see to_nodes).
+    """
+
+    def __init__( self, positions, zone_ids, max_heights, offsets, neighbors, lengths,
+            next_level_offsets, next_level_neighbors, nodes=None ):
+
+        self.positions = positions
+        self.zone_ids = zone_ids
+        self.max_heights = max_heights
+
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.lengths = lengths
+
+        self.next_level_offsets = next_level_offsets
+        self.next_level_neighbors = next_level_neighbors
+
+        # Optional list of NavNode objects, indexed by node index:
+        self.nodes = nodes
+
+        # Node indices sorted by zone, see zone_node_indices:
+        self.zone_offsets = None
+        self.zone_nodes = None
+
+        # Cached scipy.sparse version of the direct edges, see to_sparse_matrix:
+        self.sparse_matrix = None
+
+        # Nodes which can currently not be traversed (None while no node is blocked):
+        self.blocked = None
+
+        # Optional landmarks for the ALT heuristic (see landmarks.Landmarks):
+        self.landmarks = None
+
+    @staticmethod
+    def from_nodes( nodes ):
+        """ Build the graph from a list of NavNodes. Node i in the list must have index i. """
+
+        num_nodes = len( nodes )
+
+        positions = np.empty( (num_nodes,3), dtype=np.float32 )
+        zone_ids = np.empty( num_nodes, dtype=np.int32 )
+        max_heights = np.empty( num_nodes, dtype=np.float32 )
+
+        offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+        next_level_offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+        neighbors = []
+        lengths = []
+        next_level_neighbors = []
+
+        for i, n in enumerate( nodes ):
+            assert n.index == i, "Nodes must be sorted by index, and indices must start at 0!"
+            positions[i,:] = n.pos
+            zone_ids[i] = n.zone_id if n.zone_id is not None else -1
+            max_heights[i] = n.max_height
+
+            for neighbor in n.direct_neighbors:
+                neighbors.append( neighbor.index )
+                lengths.append( n.dist_to_neighbor( neighbor ) )
+            offsets[i+1] = len( neighbors )
+
+            for neighbor in n.next_level_neighbors:
+                next_level_neighbors.append( neighbor.index )
+            next_level_offsets[i+1] = len( next_level_neighbors )
+
+        return NavGraph( positions, zone_ids, max_heights,
+                offsets, np.asarray( neighbors, dtype=np.int32 ),
+                np.asarray( lengths, dtype=np.float32 ),
+                next_level_offsets, np.asarray( next_level_neighbors, dtype=np.int32 ),
+                nodes=list( nodes ) )
+
+    @staticmethod
+    def from_node_arrays( arrays, nodes=None ):
+        """ Build the graph from the NodeArrays of a compacted NodeRegistry level. The graph uses
+        the same arrays, they are not copied. """
+        return NavGraph( arrays.positions, arrays.zone_ids, arrays.max_heights,
+                arrays.offsets, arrays.neighbors, arrays.lengths,
+                arrays.next_level_offsets, arrays.next_level_neighbors, nodes=nodes )
+
+    @staticmethod
+    def from_edges( positions, zone_ids, max_heights, sources, targets, lengths, nodes=None ):
+        """ Build a graph from a list of (directed!) edges sources[i] -> targets[i].
+        Parallel edges are merged into one, keeping the shortest length. """
+
+        num_nodes = len( zone_ids )
+        sources = np.asarray( sources, dtype=np.int64 )
+        targets = np.asarray( targets, dtype=np.int64 )
+        lengths = np.asarray( lengths, dtype=np.float32 )
+
+        # Sort by source, then target, then length, and keep the first of each (source, target):
+        order = np.lexsort( (lengths, targets, sources) )
+        sources, targets, lengths = sources[order], targets[order], lengths[order]
+        first = np.ones( len( sources ), dtype=bool )
+        first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets, lengths = sources[first], targets[first], lengths[first]
+
+        offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+        offsets[1:] = np.cumsum( np.bincount( sources, minlength=num_nodes ) )
+
+        return NavGraph( np.asarray( positions, dtype=np.float32 ),
+                np.asarray( zone_ids, dtype=np.int32 ),
+                np.asarray( max_heights, dtype=np.float32 ),
+                offsets, targets.astype( np.int32 ), lengths,
+                np.zeros( num_nodes + 1, dtype=np.int64 ), np.zeros( 0, dtype=np.int32 ),
+                nodes=nodes )
+
+    def with_replaced_rows( self, rows, sources, targets, lengths ):
+        """ Return a copy of the graph in which all direct edges of the given nodes (rows) are
+        replaced by the edges sources[i] -> targets[i] (all sources must be in rows). The edges of
+        the other nodes are copied without looking at them one by one, the per-node data is
+        shared with this graph. Parallel edges are merged like in from_edges. """
+
+        num_nodes = self.num_nodes
+        rows = np.asarray( rows, dtype=np.int64 )
+        sources = np.asarray( sources, dtype=np.int64 )
+        targets = np.asarray( targets, dtype=np.int64 )
+        lengths = np.asarray( lengths, dtype=np.float32 )
+
+        order = np.lexsort( (lengths, targets, sources) )
+        sources, targets, lengths = sources[order], targets[order], lengths[order]
+        first = np.ones( len( sources ), dtype=bool )
+        first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets, lengths = sources[first], targets[first], lengths[first]
+
+        counts = np.diff( self.offsets )
+        replaced = np.zeros( num_nodes, dtype=bool )
+        replaced[rows] = True
+        new_counts = np.where( replaced, 0, counts )
+        new_counts += np.bincount( sources, minlength=num_nodes )
+        offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+        offsets[1:] = np.cumsum( new_counts )
+
+        # The kept rows have the same length as before, they are only shifted:
+        neighbors = np.empty( offsets[-1], dtype=np.int32 )
+        edge_lengths = np.empty( offsets[-1], dtype=np.float32 )
+        shift = np.repeat( offsets[:-1] - self.offsets[:-1], counts )
+        kept = ~np.repeat( replaced, counts )
+        positions = np.flatnonzero( kept ) + shift[kept]
+        neighbors[positions] = self.neighbors[kept]
+        edge_lengths[positions] = self.lengths[kept]
+
+        # The new edges are sorted by source, so they are the next ones in each row:
+        run_start = np.searchsorted( sources, sources )
+        positions = offsets[sources] + np.arange( len( sources ) ) - run_start
+        neighbors[positions] = targets
+        edge_lengths[positions] = lengths
+
+        return NavGraph( self.positions, self.zone_ids, self.max_heights,
+                offsets, neighbors, edge_lengths,
+                self.next_level_offsets, self.next_level_neighbors, nodes=self.nodes )
+
+    @property
+    def num_nodes( self ):
+        return len( self.zone_ids )
+
+    def direct_neighbors_of( self, index ):
+        """ Return the indices of the direct neighbors of the node and the lengths of the edges
+        leading to them """
+        begin, end = self.offsets[index], self.offsets[index+1]
+        return self.neighbors[begin:end], self.lengths[begin:end]
+
+    def next_level_neighbors_of( self, index ):
+        begin, end = self.next_level_offsets[index], self.next_level_offsets[index+1]
+        return self.next_level_neighbors[begin:end]
+
+    def set_blocked( self, indices, blocked=True ):
+        """ Mark the nodes as blocked (or unblock them). Blocked nodes are never entered by a
+        search on the graph. """
+        if self.blocked is None:
+            if not blocked:
+                return
+            self.blocked = np.zeros( self.num_nodes, dtype=bool )
+        self.blocked[np.asarray( indices, dtype=np.int64 )] = blocked
+
+    def zone_node_indices( self, zone_id ):
+        """ Return the (sorted) indices of all nodes in the given zone """
+        if self.zone_offsets is None:
+            self.zone_nodes = np.argsort( self.zone_ids, kind="stable" ).astype( np.int32 )
+            num_zones = int( self.zone_ids.max() ) + 1 if self.num_nodes > 0 else 0
+            counts = np.bincount( self.zone_ids[self.zone_ids >= 0], minlength=num_zones )
+            self.zone_offsets = np.zeros( num_zones + 1, dtype=np.int64 )
+            self.zone_offsets[1:] = np.cumsum( counts )
+            # Nodes without a zone (zone id -1) are sorted to the front, skip them:
+            self.zone_offsets += np.count_nonzero( self.zone_ids < 0 )
+        if zone_id < 0 or zone_id >= len( self.zone_offsets ) - 1:
+            return np.zeros( 0, dtype=np.int32 )
+        return self.zone_nodes[self.zone_offsets[zone_id]:self.zone_offsets[zone_id+1]]
+
+    def to_sparse_matrix( self ):
+        """ Return the direct edges as a scipy.sparse matrix of edge lengths, for use with
+        scipy.sparse.csgraph """
+        if self.sparse_matrix is None:
+            self.sparse_matrix = scipy.sparse.csr_matrix(
+                    (self.lengths, self.neighbors, self.offsets),
+                    shape=(self.num_nodes, self.num_nodes) )
+        return self.sparse_matrix
+
+    def edge_length( self, index_from, index_to ):
+        neighbors, lengths = self.direct_neighbors_of( index_from )
+        return float( lengths[neighbors == index_to].min() )
+
+    def path_length( self, path ):
+        """ Sum of the lengths of the edges along a path (given as node indices) """
+        return sum( self.edge_length( a, b ) for a, b in zip( path[:-1], path[1:] ) )
+
+    def to_nodes( self, indices ):
+        """ Turn a list of node indices (for example a path) into a list of NavNodes """
+        return [self.nodes[i] for i in indices]
+
+    def __getstate__( self ):
+        state = self.__dict__.copy()
+        # Can be re-created from the other arrays:
+        state["sparse_matrix"] = None
+        return state
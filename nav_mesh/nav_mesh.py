@@ -5,14 +5,29 @@
 
 import os, sys, math
 import time
+import contextlib
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import pickle
 import random
+import threading
 from scipy.spatial import KDTree
 
 from . import a_star
 from . import loader
 from . import nav_node
+from . import nav_graph
+from . import node_registry
+from . import entrance_costs
+from . import segment_cache
+from . import high_level_table
+from . import landmarks
+from . import nav_mesh_file
+from . import shared_nav_mesh
+from . import zone_pager
+from . import spatial_index
+from . import triangle_mesh
+from . import components
 try:
     from . import debug_utils
 except:
@@ -21,34 +36,348 @@ from .exceptions import PathUnreachableError
 
 # Remove to disable panda3d dependency:
 
+# File ending of the spatial index which can be saved next to a mesh file, see save_kd_tree:
+KD_TREE_FILE_SUFFIX = ".kdtree"
+
+# Makes sure that the KD-tree is only built once, even if multiple threads query at once:
+kd_tree_lock = threading.Lock()
+# The same for rebuilding the high-level table after zones were modified:
+high_level_table_lock = threading.Lock()
+
 class NavMesh():
     
-    def __init__( self, nodes, num_zones ):
+    def __init__( self, nodes, num_zones, registry=None ):
         
         num_nodes = len(nodes)
         self.nodes = nodes
+        # Lookup of all nodes of this mesh by level and index. The high-level nodes are added
+        # once they are created (see NavZone.create_center_node):
+        if registry is None:
+            registry = node_registry.NodeRegistry.for_nodes( nodes )
+        self.registry = registry
         self.zones = {}
         self.entrances = []
 
         self.debug_display_node = None
         self.debug_display_active = False
 
-        #self.init_kd_tree()
+        # Array-backed versions of the low-level and the high-level graph, which are used for
+        # searching. Built by init_graphs once all zones and entrances have been added.
+        self.graph = None
+        self.high_level_graph = None
+
+        # Low-level path costs between the entrances of each zone, see
+        # entrance_costs.calculate_entrance_costs:
+        self.entrance_costs = None
+        # Entrance costs and high-level graphs for agents which need a min_height above 0, see
+        # high_level_graph_for:
+        self.height_class_graphs = entrance_costs.HeightClassGraphs()
+
+        # Optional cache of refined low-level path segments, see enable_segment_cache:
+        self.segment_cache = None
+
+        # Optional table of the shortest paths between all entrances, see init_high_level_table.
+        # Rebuilt on the next lookup once zones were modified (see get_high_level_table):
+        self.high_level_table = None
+        self.high_level_table_stale = False
+
+        # Optional pager which keeps the low-level graphs of recently searched zones in memory,
+        # see enable_zone_paging:
+        self.zone_pager = None
+
+        # Spatial index of the low-level node positions, built (or loaded from
+        # kd_tree_filename, see save_kd_tree) when it is first needed:
+        self._kd_tree = None
+        self.kd_tree_filename = None
+        # Spatial indices over the nodes which are high enough for a min_height, see
+        # find_closest_nodes:
+        self.height_classes = spatial_index.HeightClasses()
+        # Grid which maps positions to zones, built when first needed (see zone_ids_for_points):
+        self.zone_grid = None
+
+        # Optional triangles of the nav surface, see set_triangles and project_points:
+        self.triangle_mesh = None
+
+        # Connected components, used to reject queries which can't be fulfilled without having
+        # to search first (see is_reachable):
+        self.components = components.ConnectedComponents()
     def destroy( self ):
         if self.debug_display_node:
             self.debug_display_node.remove_node()
 
     def init_kd_tree( self ):
-        nodes_tensor = np.empty( (len(self.nodes),3) )
-        for i,n in enumerate(self.nodes):
-            nodes_tensor[i,:] = n.pos
+        """ Build the spatial index used by find_closest_node right away (instead of on the
+        first query) """
+        registry = self.registry
+        if registry.arrays[0] is not None:
+            positions = np.asarray( registry.arrays[0].positions, dtype=np.float64 )
+        else:
+            positions = np.asarray( [n.pos for n in self.nodes], dtype=np.float64 )
+        self._kd_tree = KDTree( positions )
+
+    @property
+    def kd_tree( self ):
+        if self._kd_tree is None:
+            with kd_tree_lock:
+                if self._kd_tree is None:
+                    if self.kd_tree_filename is not None:
+                        self._kd_tree = self.load_kd_tree( self.kd_tree_filename )
+                    if self._kd_tree is None:
+                        self.init_kd_tree()
+        return self._kd_tree
+
+    def save_kd_tree( self, filename ):
+        """ Save the spatial index, so that processes which load the mesh don't have to build it
+        again. Saved next to the mesh file (as mesh filename + KD_TREE_FILE_SUFFIX), it is
+        picked up by load_from_file automatically. """
+        with open( filename, "wb" ) as f:
+            pickle.dump( { "num_nodes": len( self.nodes ), "kd_tree": self.kd_tree }, f )
 
-        self.kd_tree = KDTree( nodes_tensor )
+    def load_kd_tree( self, filename ):
+        """ Load a spatial index saved by save_kd_tree. Returns None if it doesn't fit the mesh. """
+        with open( filename, "rb" ) as f:
+            state = pickle.load( f )
+        if state["num_nodes"] != len( self.nodes ):
+            print( "Warning: Ignoring KD-tree", filename, "which was saved for another mesh" )
+            return None
+        return state["kd_tree"]
+
+    def init_graphs( self ):
+        # Move the node data into arrays (the nodes become views into them). The low-level graph
+        # shares these arrays:
+        self.registry.compact()
+        self.graph = nav_graph.NavGraph.from_node_arrays( self.registry.arrays[0], self.nodes )
+        # The high-level graph is weighted by the actual path costs between entrances:
+        self.entrance_costs = entrance_costs.calculate_entrance_costs( self )
+        self.high_level_graph = entrance_costs.build_high_level_graph( self, self.entrance_costs )
+
+    def init_high_level_table( self ):
+        """ Precompute the shortest high-level paths between all pairs of entrances. High-level
+        routing then no longer needs a search, it only looks up the best pair of start and end
+        entrances and walks along the table. The table is stored with the mesh when it is saved.
+        Needs memory quadratic in the number of entrances (8 bytes per pair). """
+        # Cleared first, so that zones modified while the table is calculated mark it again:
+        self.high_level_table_stale = False
+        self.high_level_table = high_level_table.HighLevelTable.from_graph(
+                self.high_level_graph, [e.node.index for e in self.entrances] )
+
+    def get_high_level_table( self ):
+        """ Return the high-level table (or None if there is none), after building it again if
+        zones were modified since it was calculated """
+        if self.high_level_table is not None and self.high_level_table_stale:
+            with high_level_table_lock:
+                if self.high_level_table_stale:
+                    self.init_high_level_table()
+        return self.high_level_table
+
+    def init_landmarks( self, num_landmarks=8 ):
+        """ Choose num_landmarks landmarks per zone and precompute the distances from every node
+        to the landmarks of its zone, so that low-level searches can use the (much tighter) ALT
+        heuristic by passing heuristic="landmarks". Needs 4*num_landmarks bytes per node. """
+        self.graph.landmarks = landmarks.Landmarks.from_graph( self.graph, num_landmarks )
+
+    def enable_segment_cache( self, max_segments=10000, max_bytes=16*1024*1024 ):
+        """ Cache the low-level path segments found by find_path_to_next_entrance, so that agents
+        which pass through the same entrances don't have to search the same segments again.
+        The least recently used segments are dropped once the cache holds max_segments segments
+        or (roughly) max_bytes of memory. See segment_cache_stats for the hit rate. """
+        self.segment_cache = segment_cache.SegmentCache( max_segments, max_bytes )
+
+    def disable_segment_cache( self ):
+        self.segment_cache = None
+
+    def segment_cache_stats( self ):
+        if self.segment_cache is None:
+            return None
+        return self.segment_cache.stats()
+
+    def enable_zone_paging( self, max_bytes=64*1024*1024 ):
+        """ Run low-level searches on per-zone copies of the graph (see zone_pager.ZonePage),
+        which are loaded when a search first enters a zone. The least recently used zones are
+        dropped again once they take more than max_bytes.
+        Meant for meshes loaded from a binary file (see load_from_file), whose arrays are
+        memory-mapped: the low-level data of a zone is then only read from disk when it is paged
+        in, and the connections to the entrances of a zone are calculated from the zone's part
+        of the arrays only (see entrance_costs.zone_sub_graph). See zone_paging_stats for the
+        number of page-ins and evictions.
+        Still held in memory for the whole mesh: the high-level graph, the entrance costs and the
+        zone and entrance objects, the blocked flags (once nodes are blocked) and the low-level
+        node objects which were accessed. Optional structures, once they are used: the
+        KD-tree, the zone grid, the height class indices and the high-level table. """
+        self.zone_pager = zone_pager.ZonePager( max_bytes )
+
+    def disable_zone_paging( self ):
+        self.zone_pager = None
+
+    def zone_paging_stats( self ):
+        if self.zone_pager is None:
+            return None
+        return self.zone_pager.stats()
+
+    def search_in_zone( self, zone_id, start, end_indices, final_target=None,
+            bidirectional=False, heuristic="eucledian", avoid=[], **kwargs ):
+        """ Find a low-level path from start to one of the end nodes, which must all lie in the
+        given zone. The arguments are the same as for a_star.a_star_graph (or
+        a_star.a_star_bidirectional if bidirectional is set, in which case end_indices must hold
+        a single node). With zone paging, the search runs on the zone's page.
+        Returns the path as (global) node indices. """
+        if self.zone_pager is None:
+            if bidirectional:
+                return a_star.a_star_bidirectional( self.graph, start, end_indices[0],
+                        heuristic=heuristic, avoid=avoid, **kwargs )
+            return a_star.a_star_graph( self.graph, start, end_indices,
+                    final_target=final_target, heuristic=heuristic, avoid=avoid, **kwargs )
+
+        page = self.zone_pager.get( self.graph, zone_id )
+        if isinstance( start, dict ):
+            start = dict( zip( page.to_local( list( start.keys() ) ), start.values() ) )
+        else:
+            start = page.to_local( start )
+        end_indices = page.to_local( end_indices )
+        # Nodes outside of the zone can't be entered anyway:
+        avoid = page.to_local( [i for i in avoid if self.graph.zone_ids[i] == zone_id] )
+        if heuristic == "eucledian" and final_target is not None:
+            # The final target may lie outside of the zone (and page), so pass its position:
+            heuristic = a_star.EucledianHeuristic( self.graph.positions[[final_target]] )
+        if bidirectional:
+            path = a_star.a_star_bidirectional( page.graph, start, end_indices[0],
+                    heuristic=heuristic, avoid=avoid, **kwargs )
+        else:
+            path = a_star.a_star_graph( page.graph, start, end_indices, heuristic=heuristic,
+                    avoid=avoid, **kwargs )
+        return page.to_global( path )
+
+    def set_blocked( self, nodes, blocked=True ):
+        """ Block the given (low-level) nodes, so that no path leads through them anymore, or
+        unblock them again. """
+        self.graph.set_blocked( [n.index for n in nodes], blocked )
+        # Paths in neighboring zones may lead up to an entrance and cross into a blocked node:
+        zone_ids = set( n.zone_id for n in nodes )
+        for n in nodes:
+            zone_ids.update( other.zone_id for other in n.next_level_neighbors )
+        self.zones_modified( zone_ids )
+
+    def zones_modified( self, zone_ids ):
+        """ Must be called whenever nodes (or edges) in the given zones have changed, to update
+        the costs between their entrances and to drop cached path segments which run through
+        them. Only the high-level edges of the zones' entrances are built again, and the
+        high-level table (if any) is only recalculated when it is next needed. """
+        for zone_id in zone_ids:
+            self.entrance_costs[zone_id] = entrance_costs.calculate_zone_entrance_costs( self,
+                    zone_id )
+            if self.segment_cache is not None:
+                self.segment_cache.invalidate_zone( zone_id )
+            if self.zone_pager is not None:
+                self.zone_pager.invalidate_zone( zone_id )
+        self.high_level_graph = entrance_costs.update_high_level_graph( self,
+                self.high_level_graph, self.entrance_costs, zone_ids )
+        self.height_class_graphs.zones_modified( self, zone_ids )
+        self.components.zones_modified( zone_ids )
+        if self.high_level_table is not None:
+            self.high_level_table_stale = True
+
+    def is_reachable( self, start_node, end_node, min_height=0 ):
+        """ Quick check (without searching) whether there may be a path between the two
+        low-level nodes. If this returns False, the searches can't find a path (see
+        components.ConnectedComponents). Like the searches, this allows the start node itself to
+        be too low or blocked. """
+        return self.components.connected( self, start_node.index, end_node.index, min_height )
+
+    @property
+    def high_level_nodes( self ):
+        # All high-level nodes (zone centers and entrances), sorted by index:
+        return self.registry.nodes( 1 )
 
     def find_closest_node( self, pos ):
 
         dist, index = self.kd_tree.query( (pos.x, pos.y, pos.z) )
         return self.nodes[index]
+
+    def find_closest_nodes( self, points, min_height=0, zone_ids=None, k=1 ):
+        """ Find the closest low-level nodes for many points at once.
+        - points: array of shape (N,3)
+        - min_height: only nodes with a max_height of at least min_height are considered
+        - zone_ids: if given, only nodes of the given zone are considered. Either a single zone
+            id for all points or an array with one zone id per point (-1 for any zone).
+        - k: number of closest nodes to return per point
+        Returns the distances and the node indices, each of shape (N,) for k == 1 or (N,k)
+        otherwise, sorted by distance. Where fewer than k nodes qualify, the distance is inf and
+        the index is -1. """
+        points = np.asarray( points, dtype=np.float64 ).reshape( -1, 3 )
+        num_points = len( points )
+
+        if zone_ids is None:
+            distances, indices = self.query_height_class( points, min_height, k )
+        else:
+            zone_ids = np.broadcast_to( np.asarray( zone_ids, dtype=np.int64 ), (num_points,) )
+            distances = np.full( (num_points, k), np.inf )
+            indices = np.full( (num_points, k), -1, dtype=np.int64 )
+            graph = self.graph
+            # All points in the same zone are looked up at once:
+            for zone_id in np.unique( zone_ids ).tolist():
+                rows = np.flatnonzero( zone_ids == zone_id )
+                if zone_id < 0:
+                    distances[rows], indices[rows] = self.query_height_class( points[rows],
+                            min_height, k )
+                else:
+                    candidates = graph.zone_node_indices( zone_id )
+                    candidates = candidates[graph.max_heights[candidates] >= min_height]
+                    distances[rows], indices[rows] = spatial_index.query_nodes(
+                            graph.positions, candidates, points[rows], k )
+
+        if k == 1:
+            return distances[:,0], indices[:,0]
+        return distances, indices
+
+    def init_zone_grid( self, cell_size=None ):
+        """ Build the grid used by zone_ids_for_points right away, optionally with another cell
+        size than the default (see spatial_index.ZoneGrid) """
+        self.zone_grid = spatial_index.ZoneGrid.from_graph( self.graph, cell_size )
+
+    def zone_ids_for_points( self, points ):
+        """ Return the id of the zone each point (array of shape (N,3)) lies in, i.e. the zone of
+        the closest node. Most points are looked up in a grid (see spatial_index.ZoneGrid). Only
+        points in cells at the border between zones, or too far away from the nodes of their
+        cell, fall back to searching the closest node. """
+        if self.zone_grid is None:
+            with kd_tree_lock:
+                if self.zone_grid is None:
+                    self.init_zone_grid()
+        points = np.asarray( points, dtype=np.float64 ).reshape( -1, 3 )
+        zone_ids = self.zone_grid.lookup( points, self.graph.positions ).astype( np.int64 )
+        unresolved = np.flatnonzero( zone_ids < 0 )
+        if len( unresolved ) > 0:
+            distances, indices = self.find_closest_nodes( points[unresolved] )
+            zone_ids[unresolved] = self.graph.zone_ids[indices]
+        return zone_ids
+
+    def set_triangles( self, triangles ):
+        """ Keep the triangles of the nav surface (array of shape (T,3) holding the indices of
+        the low-level nodes at their corners), so that points can be projected onto the surface
+        (see project_points) """
+        self.triangle_mesh = triangle_mesh.TriangleMesh( triangles )
+
+    def project_points( self, points ):
+        """ Project many points (array of shape (N,3)) onto the nav surface at once, i.e. find
+        the closest point on any of the triangles (see set_triangles).
+        Returns the projected points (N,3), the indices of the triangles which contain them (N,),
+        the zone ids (N,) and the barycentric coordinates within the triangles (N,3). Triangles
+        may span multiple zones; the zone id of the corner closest to the projected point (the
+        one with the largest barycentric coordinate) is returned. """
+        if self.triangle_mesh is None:
+            raise ValueError( "The mesh has no triangles, see NavMesh.set_triangles!" )
+        projected, triangle_indices, barycentric, distances = self.triangle_mesh.project(
+                self.graph.positions, points )
+        corners = self.triangle_mesh.triangles[triangle_indices]
+        closest_corners = corners[np.arange( len( corners ) ), barycentric.argmax( axis=1 )]
+        zone_ids = np.asarray( self.graph.zone_ids[closest_corners], dtype=np.int64 )
+        return projected, triangle_indices, zone_ids, barycentric
+
+    def query_height_class( self, points, min_height, k ):
+        height_class = self.height_classes.get( self.graph, min_height )
+        if height_class is None:
+            return spatial_index.query_tree( self.kd_tree, None, points, k )
+        return spatial_index.query_tree( *height_class, points, k )
     
     def add_zone( self, zone ):
         self.zones[zone.zone_id] = zone
@@ -56,10 +385,78 @@ class NavMesh():
     def add_entrance( self, entrance ):
         self.entrances.append( entrance )
     
-    def find_next_entrance( self, high_level_path ):
-        # Find and retrun first entrance in high_level_path:
-        for node in high_level_path:
+    def high_level_graph_for( self, min_height=0 ):
+        """ The high-level graph for agents which need min_height. Its edges only follow paths on
+        which all nodes are at least min_height high (see entrance_costs.HeightClassGraphs). """
+        if min_height <= 0:
+            return self.high_level_graph
+        return self.height_class_graphs.get( self, min_height )
+
+    def find_high_level_path( self, start_node, end_node, min_height=0 ):
+        """ Find the path through the high-level graph from the zone of start_node to the zone of
+        end_node. The path starts at the node of the start zone, then runs along entrance nodes
+        and ends at the node of the end zone.
+        Like in HPA*, start_node and end_node are first connected to the entrances of their zones
+        by the low-level path costs to each entrance. From there on, the search follows the
+        precomputed low-level path costs between entrances. Returns the path and its cost. """
+
+        start_zone = self.zones[start_node.zone_id]
+        end_zone = self.zones[end_node.zone_id]
+
+        start_costs = entrance_costs.costs_to_entrances( self, start_node, min_height,
+                is_start=True )
+        end_costs = entrance_costs.costs_to_entrances( self, end_node, min_height )
+        if len( start_costs ) == 0 or len( end_costs ) == 0:
+            raise PathUnreachableError( "Start or end zone has no reachable entrances" )
+        high_level_graph = self.high_level_graph_for( min_height )
+        if not self.components.high_level_connected( high_level_graph, start_costs.keys(),
+                end_costs.keys(), min_height ):
+            raise PathUnreachableError( "No route between the entrances of the start and end zone" )
+
+        # The table only holds the routes for agents of any height:
+        table = self.get_high_level_table() if min_height <= 0 else None
+        if table is not None:
+            path, cost = table.find_path( start_costs, end_costs )
+        else:
+            # The high-level edge costs are not bounded from below by the straight-line distance
+            # between the entrance centers, so search without heuristic to find the optimal route:
+            path = a_star.a_star_graph( high_level_graph, start_costs, end_costs,
+                    heuristic=None )
+            cost = start_costs[path[0]] + high_level_graph.path_length( path ) + \
+                    end_costs[path[-1]]
+        path = [start_zone.node] + high_level_graph.to_nodes( path ) + [end_zone.node]
+        return path, cost
+
+    def estimate_path_cost( self, start_node, end_node, min_height=0 ):
+        """ Return the cost of the path from start_node to end_node, without refining the path
+        through every zone along the way: the cost is made up of the precomputed low-level costs
+        between the entrances along the high-level path, plus the costs from start_node and to
+        end_node within their zones.
+        If both nodes are in the same zone, there is no high-level path, so this falls back to a
+        low-level search. """
+
+        if not self.is_reachable( start_node, end_node, min_height ):
+            raise PathUnreachableError( "Start and end node are not connected" )
+        if start_node.zone_id == end_node.zone_id:
+            path = a_star.a_star_graph( self.graph, start_node.index, [end_node.index],
+                    min_height=min_height )
+            return self.graph.path_length( path )
+
+        high_level_path, cost = self.find_high_level_path( start_node, end_node, min_height )
+        return cost
+
+    def find_next_entrance( self, high_level_path, zone_id=None ):
+        # Find and retrun first entrance in high_level_path which has to be crossed.
+        # If zone_id (the current zone) is given, entrances which the path only touches while
+        # staying in the current zone are skipped: In the high-level graph, the route between two
+        # entrances of a zone may run via a third entrance of the same zone which lies on the way.
+        for i, node in enumerate( high_level_path ):
             if node.entrance:
+                if zone_id is not None and i + 1 < len( high_level_path ):
+                    following_entrance = high_level_path[i+1].entrance
+                    if following_entrance and zone_id in \
+                            (following_entrance.zone_id_1, following_entrance.zone_id_2):
+                        continue
                 return node.entrance
         return None
     
@@ -74,12 +471,14 @@ class NavMesh():
                 node_found = True
         return subpath
         
-    def find_full_path( self, start_node, end_node ):
+    def find_full_path( self, start_node, end_node, min_height=0, heuristic="eucledian",
+            bidirectional=False ):
 
         full_low_level_path = []
         full_high_level_path = None
         
-        finder = PathSectionFinder( self, start_node, end_node )
+        finder = PathSectionFinder( self, start_node, end_node, min_height=min_height,
+                heuristic=heuristic, bidirectional=bidirectional )
         for high_level_path, low_level_path in finder:
             if full_high_level_path is None:
                 full_high_level_path = high_level_path
@@ -87,17 +486,84 @@ class NavMesh():
 
         return full_high_level_path, full_low_level_path
 
+    def find_paths_batch( self, requests, workers=None, executor="thread", pool=None,
+            shared=None ):
+        """ Find the full paths for many requests at once, spread across a pool of workers.
+        - requests: array (or list) of rows (start_index, end_index) or
+            (start_index, end_index, min_height), where the indices are low-level node indices.
+        - workers: number of worker threads or processes. Defaults to the number of CPUs.
+        - executor: "thread" or "process". For "process", the mesh is published into shared
+            memory once and all worker processes attach to it (see shared_nav_mesh), instead of
+            each receiving its own copy.
+        - pool: an existing pool to run the requests in, so that repeated calls don't start new
+            workers. For "thread", any ThreadPoolExecutor. For "process", a pool of processes
+            attached to a shared copy of this mesh (see shared_nav_mesh.worker_pool).
+        - shared: for "process" without a pool, an existing shared copy of this mesh (see
+            SharedNavMesh.publish), so that it isn't published again. Nodes which were blocked or
+            unblocked after publishing are not updated in a shared copy.
+        Returns one PathResult per request, in the order of the requests. Requests which fail
+        (because the end is unreachable or the request is invalid) don't raise. Instead, the
+        error is stored in their result. """
+
+        requests = [(int(r[0]), int(r[1]), float(r[2]) if len(r) > 2 else 0) for r in requests]
+        if workers is None:
+            workers = os.cpu_count()
+
+        with contextlib.ExitStack() as stack:
+            if executor == "thread":
+                if pool is None:
+                    pool = stack.enter_context( ThreadPoolExecutor( max_workers=workers ) )
+                results = list( pool.map( self.find_path_indices, requests ) )
+            elif executor == "process":
+                chunksize = max( 1, len(requests)//(4*workers) )
+                if pool is None:
+                    if shared is None:
+                        shared = stack.enter_context(
+                                shared_nav_mesh.SharedNavMesh.publish( self ) )
+                    pool = stack.enter_context( shared_nav_mesh.worker_pool( shared, workers ) )
+                results = list( pool.map( find_path_indices_in_worker, requests,
+                    chunksize=chunksize ) )
+            else:
+                raise ValueError( f"Unknown executor '{executor}', use 'thread' or 'process'!" )
+
+        path_results = []
+        for high_level_path, low_level_path, error in results:
+            if error is None:
+                path_results.append( PathResult(
+                    self.high_level_graph.to_nodes( high_level_path ),
+                    self.graph.to_nodes( low_level_path ) ) )
+            else:
+                path_results.append( PathResult( error=error ) )
+        return path_results
+
+    def find_path_indices( self, request ):
+        """ Find the full path for a single (start_index, end_index, min_height) request.
+        Returns the high- and low-level paths as node indices and the error (if any), so that the
+        result can be sent back from a worker process. Only errors of the request itself
+        (unreachable end, invalid node indices) are returned, all others are raised. """
+        start, end, min_height = request
+        try:
+            for index in (start, end):
+                if not 0 <= index < len( self.nodes ):
+                    raise ValueError( f"Invalid node index {index}, the mesh has " +
+                            f"{len( self.nodes )} nodes" )
+            high_level_path, low_level_path = self.find_full_path( self.nodes[start],
+                    self.nodes[end], min_height=min_height )
+        except (PathUnreachableError, ValueError) as e:
+            return None, None, e
+        return [n.index for n in high_level_path], [n.index for n in low_level_path], None
+
     def find_path_sections( self, start_node, end_node, end_pos=None, avoid=[], min_height=0,
-            initial_dir = np.asarray((0,0,0)) ):
+            initial_dir = np.asarray((0,0,0)), heuristic="eucledian", bidirectional=False ):
         return PathSectionFinder( self, start_node, end_node, end_pos, avoid, min_height,
-                initial_dir )
+                initial_dir, heuristic, bidirectional )
 
     def find_path_to_next_entrance( self, start_node, prev_high_level_path,
             initial_dir = np.asarray((0,0,0)), final_target_node = None, min_height = 0,
-            debug_display_active = False ):
+            debug_display_active = False, heuristic = "eucledian", avoid = [] ):
         
         # Find the next entrance along the high level path:
-        next_entrance = self.find_next_entrance( prev_high_level_path )
+        next_entrance = self.find_next_entrance( prev_high_level_path, start_node.zone_id )
 
         if self.debug_display_node:
             self.debug_display_node.remove_node()
@@ -113,19 +579,52 @@ class NavMesh():
             # Find path to the entrance:
             # 1. Choose the nodes which are part of the current zone and part of the entrance
             # to the next zone:
-            entrance_nodes = [n for n in next_entrance.nodes \
+            entrance_nodes = [n.index for n in next_entrance.nodes \
                     if n.zone_id == start_node.zone_id]
-            # 2. Find the path to one of those:
-            if not debug_display_active:
-                low_level_path = a_star.a_star( start_node, entrance_nodes, initial_dir=initial_dir,
-                        final_target_node = final_target_node, min_height=min_height )
+            if min_height > 0:
+                # Don't cross the entrance into a node on the other side which is too low:
+                entrance_nodes = [i for i in entrance_nodes if entrance_costs.crossable(
+                    self.nodes[i], next_entrance, min_height )]
+                if len( entrance_nodes ) == 0:
+                    raise PathUnreachableError( "All nodes of the next entrance are too low" )
+            blocked = self.graph.blocked
+            if blocked is not None:
+                # Don't cross the entrance into a blocked node on the other side:
+                entrance_nodes = [i for i in entrance_nodes if not blocked[i] and \
+                        not blocked[self.nodes[i].get_node_on_other_side( next_entrance ).index]]
+                if len( entrance_nodes ) == 0:
+                    raise PathUnreachableError( "All nodes of the next entrance are blocked" )
+            if final_target_node:
+                final_target = final_target_node.index
             else:
-                low_level_path, node_debug_info = a_star.a_star( start_node, entrance_nodes, initial_dir=initial_dir,
-                        final_target_node = final_target_node, min_height=min_height,
-                        return_debug_info = True )
+                final_target = None
+            # 2. Find the path to one of those (or re-use the one found earlier). The cached segment
+            # is shared by all paths which pass through the start node and the entrance, no matter
+            # where they are headed after that. So it must not depend on the final target, and is
+            # searched towards the entrance nodes only. Searches which avoid nodes are not cached:
+            cache = self.segment_cache
+            if cache is not None and not debug_display_active and len( avoid ) == 0:
+                key = segment_cache.segment_key( start_node.index, next_entrance.node.index,
+                        min_height, initial_dir )
+                low_level_path = cache.get( key )
+                if low_level_path is None:
+                    low_level_path = self.search_in_zone( start_node.zone_id, start_node.index,
+                            entrance_nodes, initial_dir=initial_dir, final_target=None,
+                            min_height=min_height, heuristic=heuristic )
+                    cache.put( key, start_node.zone_id, low_level_path )
+            elif not debug_display_active:
+                low_level_path = self.search_in_zone( start_node.zone_id, start_node.index,
+                        entrance_nodes, initial_dir=initial_dir, final_target=final_target,
+                        min_height=min_height, heuristic=heuristic, avoid=avoid )
+            else:
+                low_level_path, node_debug_info = a_star.a_star_graph( self.graph,
+                        start_node.index, entrance_nodes,
+                        initial_dir=initial_dir, final_target=final_target, min_height=min_height,
+                        return_debug_info = True, heuristic=heuristic, avoid=avoid )
                 if self.debug_display_active:
                     self.debug_display_node = debug_utils.display_debug_info( node_debug_info,
                             self.nodes )
+            low_level_path = self.graph.to_nodes( low_level_path )
             
             #a_star.path_to_mesh( low_level_path )
             #print("Found detail level path:", len(low_level_path) )
@@ -146,55 +645,122 @@ class NavMesh():
         path = self.find_full_path( start_node, end_node )
         return path
 
+    def __getstate__( self ):
+        state = self.__dict__.copy()
+        # Built again when needed (or saved separately, see save_kd_tree):
+        state["_kd_tree"] = None
+        state["zone_grid"] = None
+        return state
+
     def __setstate__( self, state ):
+        # Meshes saved before the KD-tree was built lazily hold it under another name:
+        state.setdefault( "_kd_tree", state.pop( "kd_tree", None ) )
+        state.setdefault( "kd_tree_filename", None )
+        state.setdefault( "height_classes", spatial_index.HeightClasses() )
+        state.setdefault( "triangle_mesh", None )
+        state.setdefault( "zone_grid", None )
+        state.setdefault( "components", components.ConnectedComponents() )
+        state.setdefault( "height_class_graphs", entrance_costs.HeightClassGraphs() )
         self.__dict__ = state
-        self.init_kd_tree()
-
-        ####################################
-        # Warning: For some reason, the nodes adding themselves to the NavNode.node_list
-        # no longer works. I suspoect this is due to the renamed_load function, which
-        # does some magic to the imports. Somehow, the nodes add themselves, but after
-        # being imported, only the high-level nodes (node.level == 1) are present, the
-        # other list is somehow empty. I don't know why, but it may be that somehow the
-        # NavNode module is imported twice under different names, and then these different
-        # modules are used? Doesn't explain why there is a state during loading where both
-        # lists seem to be filled correctly, though.
-        # Anyways, adding them here again manually solves the issue:
-        for n in self.nodes:
-            nav_node.NavNode.node_list[n.level][n.index] = n
-        for k, r in self.zones.items():
-            n = r.node
-            nav_node.NavNode.node_list[n.level][n.index] = n
+
+        # Meshes saved before registries were introduced (the nodes were kept in a single, global
+        # list back then):
+        if self.__dict__.get( "registry" ) is None:
+            self.registry = node_registry.NodeRegistry.for_nodes( self.nodes )
+            for zone in self.zones.values():
+                self.registry.add( zone.node )
+            for entrance in self.entrances:
+                self.registry.add( entrance.node )
+
+        # Meshes saved before the graphs (or the entrance costs, or the compact node storage) were
+        # introduced:
+        if self.__dict__.get( "entrance_costs" ) is None or self.registry.arrays[0] is None:
+            self.init_graphs()
+        self.__dict__.setdefault( "segment_cache", None )
+        self.__dict__.setdefault( "high_level_table", None )
+        self.__dict__.setdefault( "high_level_table_stale", False )
+        self.__dict__.setdefault( "zone_pager", None )
 
         self.debug_display_node = None
 
-    def save_to_file( self, filename = "nav_mesh.pickle" ):
+    def save_to_file( self, filename = "nav_mesh.pickle", save_kd_tree = False ):
         with open( filename, "wb" ) as f:
             pickle.dump( self, f )
             print("Saved nav_mesh as:", filename)
+        if save_kd_tree:
+            self.save_kd_tree( filename + KD_TREE_FILE_SUFFIX )
+       
+    def save_to_binary_file( self, filename = "nav_mesh.navmesh", save_kd_tree = False ):
+        """ Save in the binary format (see nav_mesh_file), which can be loaded much faster than
+        a pickle. Runtime state (blocked nodes, the segment cache) is not saved. """
+        nav_mesh_file.save( self, filename )
+        print("Saved nav_mesh as:", filename)
+        if save_kd_tree:
+            self.save_kd_tree( filename + KD_TREE_FILE_SUFFIX )
        
     @staticmethod
-    def load_from_file( filename ):
+    def load_from_file( filename, mode="r" ):
+        """ Load a mesh which was saved with save_to_file or save_to_binary_file. Binary files are
+        memory-mapped (see nav_mesh_file.load_arrays for the mode).
+        If a KD-tree was saved next to the file (and is newer than it), it is loaded instead of
+        built on the first call to find_closest_node. """
 
         print("Attempting to load NavMesh from file:", filename)
-        with open( filename, "rb" ) as f:
-            nav_mesh = pickle.load( f )
-            #nav_mesh = loader.renamed_load( f, "nav_mesh", "lib.pathfinding" )
-            #nav_mesh = loader.renamed_load( f, "nav_mesh", "lib.pathfinding" )
-            print( "\tNavMesh loaded." )
+        if nav_mesh_file.is_nav_mesh_file( filename ):
+            nav_mesh = nav_mesh_file.load( filename, mode )
+        else:
+            with open( filename, "rb" ) as f:
+                nav_mesh = pickle.load( f )
+                #nav_mesh = loader.renamed_load( f, "nav_mesh", "lib.pathfinding" )
+                #nav_mesh = loader.renamed_load( f, "nav_mesh", "lib.pathfinding" )
+        kd_tree_filename = filename + KD_TREE_FILE_SUFFIX
+        if os.path.exists( kd_tree_filename ) and \
+                os.path.getmtime( kd_tree_filename ) >= os.path.getmtime( filename ):
+            nav_mesh.kd_tree_filename = kd_tree_filename
+        print( "\tNavMesh loaded." )
         return nav_mesh
 
+class PathResult():
+    # Result of a single request of NavMesh.find_paths_batch. If the path could not be found,
+    # the paths are None and error holds the exception which was raised.
+
+    def __init__( self, high_level_path=None, low_level_path=None, error=None ):
+        self.high_level_path = high_level_path
+        self.low_level_path = low_level_path
+        self.error = error
+
+    @property
+    def found( self ):
+        return self.error is None
+
+def find_path_indices_in_worker( request ):
+    # Runs in a worker process of NavMesh.find_paths_batch:
+    return shared_nav_mesh.worker_nav_mesh().find_path_indices( request )
+
 class PathSectionFinder:
 
     def __init__( self, nav_mesh, start_node, end_node, end_pos=None, avoid=[], min_height=0,
-            initial_dir = np.asarray((0,0,0)) ):
+            initial_dir = np.asarray((0,0,0)), heuristic="eucledian", bidirectional=False ):
         """ Find a (sub-part of a) path. If start_node and end_node are in the same sector, find
         the full detail-level path. If they are not, find the full high-level path and the detail-
         level path for the first sector.
 
         If end_pos is given, it is appended to the final low-level-path.
 
-        The 'avoid' parameter is an (optional) list of nodes which should be considered blocked"""
+        The 'avoid' parameter is an (optional) list of nodes which should be considered blocked
+        by the low-level searches. The high-level path does not take them into account, so a
+        section may become unreachable if they block a zone.
+
+        The 'heuristic' is used for the low-level searches, see a_star.a_star_graph
+
+        If 'bidirectional' is set, the section within the end zone is searched from both ends at
+        once (see a_star.a_star_bidirectional). That section then has no angular penalty, which
+        can't be applied by a bidirectional search, so a non-zero initial_dir raises a
+        ValueError."""
+
+        if bidirectional and np.any( np.asarray( initial_dir ) != 0 ):
+            raise ValueError( "The angular penalty depends on the search direction, it cannot " +
+                    "be used with bidirectional search. Pass no initial_dir instead!" )
 
         self.high_level_path = None
         self.start_node = start_node
@@ -205,20 +771,23 @@ class PathSectionFinder:
 
         self.debug_display_active = False
         self.debug_display_node = None
-    
-        # TODO!!
-        self.avoid = avoid
+
+        # Indices of the nodes to avoid:
+        self.avoid = [n.index for n in avoid]
         self.min_height = min_height
+        self.heuristic = heuristic
+        self.bidirectional = bidirectional
 
         self.last_section_found = False
 
+        # Don't search at all if the end can't be reached:
+        if not nav_mesh.is_reachable( start_node, end_node, min_height ):
+            raise PathUnreachableError( "Start and end node are not connected" )
+
         # need to cross at least one entrance to another sector?
         if self.start_node.zone_id != self.end_node.zone_id: 
-            start_high_level_node = self.nav_mesh.zones[self.start_node.zone_id].node
-            end_high_level_node = self.nav_mesh.zones[self.end_node.zone_id].node
-            
-            high_level_path = a_star.a_star( start_high_level_node, [end_high_level_node] )
-                    #min_height = self.min_height )
+            high_level_path, cost = self.nav_mesh.find_high_level_path( self.start_node,
+                    self.end_node, min_height = self.min_height )
             
             if not high_level_path:
                 self.last_section_found = True
@@ -246,17 +815,34 @@ class PathSectionFinder:
         if self.cur_start_node.zone_id == self.end_node.zone_id:
             # This means that there is no further
             # entrance on the path and we've reached the last zone:
-            if not self.debug_display_active:
-                low_level_path = a_star.a_star( self.cur_start_node, [self.end_node],
-                        initial_dir = self.initial_dir, min_height = self.min_height )
+            graph = self.nav_mesh.graph
+            if self.bidirectional and not self.debug_display_active:
+                low_level_path = self.nav_mesh.search_in_zone( self.end_node.zone_id,
+                        self.cur_start_node.index, [self.end_node.index], bidirectional = True,
+                        min_height = self.min_height, heuristic = self.heuristic,
+                        avoid = self.avoid )
+            elif self.bidirectional:
+                low_level_path, node_debug_info = a_star.a_star_bidirectional( graph,
+                        self.cur_start_node.index, self.end_node.index,
+                        min_height = self.min_height, heuristic = self.heuristic,
+                        return_debug_info = True, avoid = self.avoid )
+                self.debug_display_node = debug_utils.display_debug_info( node_debug_info,
+                        self.nav_mesh.nodes )
+            elif not self.debug_display_active:
+                low_level_path = self.nav_mesh.search_in_zone( self.end_node.zone_id,
+                        self.cur_start_node.index, [self.end_node.index],
+                        initial_dir = self.initial_dir, min_height = self.min_height,
+                        heuristic = self.heuristic, avoid = self.avoid )
             else:
-                low_level_path, node_debug_info = a_star.a_star( self.cur_start_node,
-                        [self.end_node],
+                low_level_path, node_debug_info = a_star.a_star_graph( graph,
+                        self.cur_start_node.index, [self.end_node.index],
                         initial_dir = self.initial_dir, min_height = self.min_height,
-                        return_debug_info = True )
+                        return_debug_info = True, heuristic = self.heuristic,
+                        avoid = self.avoid )
                 if self.debug_display_active:
                     self.debug_display_node = debug_utils.display_debug_info( node_debug_info,
                             self.nav_mesh.nodes )
+            low_level_path = graph.to_nodes( low_level_path )
 
             self.last_section_found = True   # Stop iteration after this
 
@@ -289,7 +875,8 @@ class PathSectionFinder:
                 self.nav_mesh.find_path_to_next_entrance(
                     self.cur_start_node, self.high_level_path, self.initial_dir,
                     final_target_node = self.end_node, min_height = self.min_height,
-                    debug_display_active = self.debug_display_active )
+                    debug_display_active = self.debug_display_active,
+                    heuristic = self.heuristic, avoid = self.avoid )
 
         if low_level_path:
             # "Jump through" next entrance:
@@ -0,0 +1,465 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+# Build a NavMesh from plain vertex and face arrays (or from an OBJ/PLY file), without needing
+# blender. Follows the same steps as nav_mesh_factory.nav_mesh_from_object, but works on numpy
+# arrays instead of a bmesh and never creates per-node python objects:
+#   - skip connections (see add_skip_connections in nav_mesh_factory)
+#   - clearance above each vertex (see clearance.max_node_heights and
+#     clearance.smooth_max_node_heights)
+#   - zones (see zone_clustering.cluster_zones, which replaces the flood fill of
+#     size_clustering.split_zones_by_height)
+#   - zone interfaces and entrances (see nav_mesh_factory.create_nav_mesh)
+#
+# Usage:
+#   nav_mesh = build_nav_mesh( vertices, faces )
+#   nav_mesh = build_nav_mesh_from_file( "level.obj" )
+# or from the command line:
+#   python -m nav_mesh.nav_mesh_builder level.obj level.navmesh
+#
+# The best zone size depends on the map: small zones make the low-level searches cheap, but the
+# high-level searches expensive, large zones the other way round. tune_nav_mesh bakes the mesh
+# with several zone radii, replays a query workload on each bake and keeps the fastest:
+#   nav_mesh, report = tune_nav_mesh( vertices, faces )
+#   python -m nav_mesh.nav_mesh_builder --tune level.obj level.navmesh
+
+import sys
+import math
+import time
+import numpy as np
+import scipy.sparse
+from scipy.sparse.csgraph import connected_components
+
+from . import mesh_io
+from . import clearance
+from . import zone_clustering
+from . import nav_mesh_file
+from . import benchmark
+
+class Polygons():
+    """ Faces with any number of corners. The vertex indices of face i are
+    corners[offsets[i]:offsets[i+1]]. """
+
+    def __init__( self, corners, offsets ):
+        self.corners = corners
+        self.offsets = offsets
+
+    @staticmethod
+    def from_faces( faces ):
+        """ faces is an integer array of shape (F,k) or a list of vertex index lists """
+        if isinstance( faces, np.ndarray ) and faces.ndim == 2:
+            corners = faces.astype( np.int64 ).reshape( -1 )
+            offsets = np.arange( len( faces ) + 1, dtype=np.int64 )*faces.shape[1]
+        else:
+            corners = np.fromiter( (v for face in faces for v in face), dtype=np.int64 )
+            offsets = np.zeros( len( faces ) + 1, dtype=np.int64 )
+            offsets[1:] = np.cumsum( [len( face ) for face in faces] )
+        return Polygons( corners, offsets )
+
+    @property
+    def num_faces( self ):
+        return len( self.offsets ) - 1
+
+    @property
+    def corner_faces( self ):
+        """ The face of each corner """
+        return np.repeat( np.arange( self.num_faces ), np.diff( self.offsets ) )
+
+    @property
+    def next_corners( self ):
+        """ The index (into corners) of the following corner of the same face, for each corner """
+        next_corners = np.arange( 1, len( self.corners ) + 1 )
+        next_corners[self.offsets[1:] - 1] = self.offsets[:-1]
+        return next_corners
+
+    @property
+    def prev_corners( self ):
+        prev_corners = np.arange( -1, len( self.corners ) - 1 )
+        prev_corners[self.offsets[:-1]] = self.offsets[1:] - 1
+        return prev_corners
+
+    def triangles( self ):
+        """ Fan triangulation of the faces, shape (T,3) """
+        counts = np.diff( self.offsets )
+        num_triangles = np.maximum( counts - 2, 0 )
+        first = np.repeat( self.offsets[:-1], num_triangles )
+        # Number of the triangle within its face:
+        k = np.arange( num_triangles.sum() ) - np.repeat( np.cumsum( num_triangles ) -
+                num_triangles, num_triangles )
+        return np.stack( (self.corners[first], self.corners[first + k + 1],
+                self.corners[first + k + 2]), axis=1 )
+
+    def face_normals( self, vertices ):
+        """ Unit normal of each face (Newell's method, also works for non-planar polygons) """
+        pos = vertices[self.corners]
+        cross = np.cross( pos, pos[self.next_corners] )
+        normals = np.zeros( (self.num_faces,3) )
+        np.add.at( normals, self.corner_faces, cross )
+        return normalized( normals )
+
+    def vertex_normals( self, vertices, face_normals ):
+        """ Normal of each vertex: the mean of the normals of its faces, weighted by the angle of
+        the face at the vertex (like blender's vertex normals) """
+        pos = vertices[self.corners]
+        to_next = normalized( pos[self.next_corners] - pos )
+        to_prev = normalized( pos[self.prev_corners] - pos )
+        angles = np.arccos( np.clip( np.einsum( "ij,ij->i", to_next, to_prev ), -1, 1 ) )
+        normals = np.zeros( (len( vertices ),3) )
+        np.add.at( normals, self.corners,
+                face_normals[self.corner_faces]*angles[:,np.newaxis] )
+        return normalized( normals )
+
+    def edges( self ):
+        """ Unique edges of the faces as pairs (i,j) with i < j, and for every corner the index of
+        the edge from it to the next corner """
+        a = self.corners
+        b = self.corners[self.next_corners]
+        num_vertices = int( self.corners.max() ) + 1 if len( self.corners ) > 0 else 0
+        keys, corner_edges = np.unique( np.minimum( a, b )*num_vertices + np.maximum( a, b ),
+                return_inverse=True )
+        edges = np.stack( (keys//num_vertices, keys%num_vertices), axis=1 ) if num_vertices > 0 \
+                else np.zeros( (0,2), dtype=np.int64 )
+        return edges, corner_edges.reshape( -1 )
+
+def normalized( vectors ):
+    lengths = np.linalg.norm( vectors, axis=1 )
+    with np.errstate( divide="ignore", invalid="ignore" ):
+        return np.where( lengths[:,np.newaxis] > 0, vectors/lengths[:,np.newaxis], 0 )
+
+def boolean_matrix( rows, cols, shape ):
+    return scipy.sparse.csr_matrix( (np.ones( len( rows ), dtype=np.int32 ), (rows, cols)),
+            shape=shape )
+
+def as_boolean( matrix ):
+    """ Set all stored entries of the (CSR) matrix to 1, so that products of these matrices only
+    tell whether there are paths between rows and columns """
+    matrix = matrix.tocsr()
+    matrix.data[:] = 1
+    return matrix
+
+def skip_connection_matrix( polygons, face_normals, num_vertices, ang_thresh=math.pi*0.07,
+        max_jumps=2 ):
+    """ Connect every vertex to all vertices of the faces around it (see
+    nav_mesh_factory.add_skip_connections): starting at the vertex's faces, neighboring faces
+    (faces sharing an edge) are added up to max_jumps times. Faces are only expanded further if
+    their normal is within ang_thresh of the face they were reached from.
+    Returns the connections as a sparse (V,V) matrix. """
+
+    num_faces = polygons.num_faces
+    corner_faces = polygons.corner_faces
+    edges, corner_edges = polygons.edges()
+
+    # Faces which share an edge (including each face itself):
+    face_edges = boolean_matrix( corner_faces, corner_edges, (num_faces, len( edges )) )
+    adjacent = as_boolean( face_edges @ face_edges.T ).tocoo()
+    similar = np.einsum( "ij,ij->i", face_normals[adjacent.row], face_normals[adjacent.col] ) > \
+            math.cos( ang_thresh )
+    adjacent_similar = boolean_matrix( adjacent.row[similar], adjacent.col[similar],
+            (num_faces, num_faces) )
+    adjacent = adjacent.tocsr()
+
+    # reached[i,j]: face j is selected when starting at face i. expandable holds the reached faces
+    # which may be expanded further:
+    reached = scipy.sparse.identity( num_faces, dtype=np.int32, format="csr" )
+    expandable = reached
+    for jump in range( max_jumps ):
+        reached = as_boolean( reached + expandable @ adjacent )
+        expandable = as_boolean( expandable @ adjacent_similar )
+
+    vertex_faces = boolean_matrix( polygons.corners, corner_faces, (num_vertices, num_faces) )
+    connections = as_boolean( vertex_faces @ reached @ vertex_faces.T )
+    connections = as_boolean( connections + connections.T )
+    connections.setdiag( 0 )
+    connections.eliminate_zeros()
+    return connections
+
+def adjacency( polygons, num_vertices, face_normals=None, skip_connections=True ):
+    """ Neighbors of every vertex in CSR form (offsets, neighbors), sorted by index: the vertices
+    connected by an edge of the faces, plus the skip connections """
+    edges, corner_edges = polygons.edges()
+    edges = edges[edges[:,0] != edges[:,1]]
+    matrix = boolean_matrix( np.concatenate( (edges[:,0], edges[:,1]) ),
+            np.concatenate( (edges[:,1], edges[:,0]) ), (num_vertices, num_vertices) )
+    if skip_connections:
+        matrix = matrix + skip_connection_matrix( polygons, face_normals, num_vertices )
+    matrix = as_boolean( matrix )
+    matrix.sort_indices()
+    return matrix.indptr.astype( np.int64 ), matrix.indices.astype( np.int64 )
+
+def find_entrances( zone_ids, offsets, neighbors, num_zones ):
+    """ Find the entrances between zones, like the NavZoneInterfaces in
+    nav_mesh_factory.create_nav_mesh do: the nodes of an interface between two zones are all nodes
+    of the two zones with a neighbor in the other zone. Each set of nodes of the interface
+    which are connected to each other is one entrance.
+    Returns the zone ids of each entrance (E,2), and its nodes in CSR form
+    (entrance_offsets, entrance_nodes). """
+
+    num_nodes = len( zone_ids )
+    zone_ids = np.asarray( zone_ids, dtype=np.int64 )
+    sources = np.repeat( np.arange( num_nodes ), np.diff( offsets ) )
+    zone_1 = zone_ids[sources]
+    zone_2 = zone_ids[neighbors]
+    border = zone_1 != zone_2
+
+    # Every node is a member of the interfaces of all zone pairs it borders on:
+    interfaces = np.minimum( zone_1, zone_2 )[border]*num_zones + \
+            np.maximum( zone_1, zone_2 )[border]
+    member_keys = np.unique( interfaces*num_nodes + sources[border] )
+    member_interfaces = member_keys//num_nodes
+    member_nodes = member_keys%num_nodes
+
+    # Members of the same interface are connected if their nodes are neighbors:
+    degrees = offsets[member_nodes + 1] - offsets[member_nodes]
+    member_sources = np.repeat( np.arange( len( member_keys ) ), degrees )
+    edges = np.repeat( offsets[member_nodes] - np.cumsum( degrees ) + degrees, degrees ) + \
+            np.arange( degrees.sum() )
+    neighbor_keys = np.repeat( member_interfaces, degrees )*num_nodes + neighbors[edges]
+    member_targets = np.minimum( np.searchsorted( member_keys, neighbor_keys ),
+            max( len( member_keys ) - 1, 0 ) )
+    connected = member_keys[member_targets] == neighbor_keys if len( member_keys ) > 0 else \
+            np.zeros( 0, dtype=bool )
+    matrix = boolean_matrix( member_sources[connected], member_targets[connected],
+            (len( member_keys ), len( member_keys )) )
+    num_entrances, labels = connected_components( matrix, directed=False )
+
+    # Members are sorted by interface, then node, so entrances are numbered in the same order:
+    order = np.argsort( labels, kind="stable" )
+    entrance_offsets = np.zeros( num_entrances + 1, dtype=np.int64 )
+    entrance_offsets[1:] = np.cumsum( np.bincount( labels, minlength=num_entrances ) )
+    entrance_nodes = member_nodes[order]
+    entrance_interfaces = member_interfaces[order][entrance_offsets[:-1]]
+    entrance_zone_ids = np.stack( (entrance_interfaces//num_zones,
+            entrance_interfaces%num_zones), axis=1 )
+    return entrance_zone_ids, entrance_offsets, entrance_nodes
+
+def split_edges( positions, zone_ids, offsets, neighbors ):
+    """ Split the edges into those within a zone and those into another zone, both in CSR form
+    with their lengths (like NodeArrays) """
+    num_nodes = len( zone_ids )
+    sources = np.repeat( np.arange( num_nodes ), np.diff( offsets ) )
+    lengths = np.linalg.norm( positions[neighbors] - positions[sources], axis=1 )
+    same_zone = zone_ids[sources] == zone_ids[neighbors]
+    csr = []
+    for mask in ( same_zone, ~same_zone ):
+        csr_offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+        csr_offsets[1:] = np.cumsum( np.bincount( sources[mask], minlength=num_nodes ) )
+        csr += [csr_offsets, neighbors[mask].astype( np.int32 ),
+                lengths[mask].astype( np.float32 )]
+    return csr
+
+def create_nav_mesh( positions, normals, heights, offsets, neighbors, zone_ids, zone_heights,
+        triangles=None ):
+    """ Array version of nav_mesh_factory.create_nav_mesh: create the NavMesh (with its zones,
+    entrances and high-level graph) from the per-node arrays and the neighbors in CSR form """
+
+    positions = np.asarray( positions, dtype=np.float64 )
+    zone_ids = np.asarray( zone_ids, dtype=np.int32 )
+    num_nodes = len( positions )
+    num_zones = len( zone_heights )
+    arrays = {}
+
+    node_arrays = [positions.astype( np.float32 ), np.asarray( normals, dtype=np.float32 ),
+            np.asarray( heights, dtype=np.float32 ), zone_ids] + \
+            split_edges( positions, zone_ids, offsets, neighbors )
+    for name, array in zip( nav_mesh_file.NODE_ARRAYS, node_arrays ):
+        arrays[f"nodes.{name}"] = array
+
+    entrance_zone_ids, entrance_offsets, entrance_nodes = find_entrances( zone_ids, offsets,
+            neighbors, num_zones )
+    num_entrances = len( entrance_zone_ids )
+
+    # High-level nodes: one per zone (at the mean of its nodes), followed by one per entrance (at
+    # the mean of its nodes, as high as the highest of them):
+    zone_sizes = np.bincount( zone_ids, minlength=num_zones )
+    zone_centers = np.zeros( (num_zones,3) )
+    np.add.at( zone_centers, zone_ids, positions )
+    zone_centers /= zone_sizes[:,np.newaxis]
+    entrance_of_node = np.repeat( np.arange( num_entrances ), np.diff( entrance_offsets ) )
+    entrance_centers = np.zeros( (num_entrances,3) )
+    np.add.at( entrance_centers, entrance_of_node, positions[entrance_nodes] )
+    entrance_centers /= np.diff( entrance_offsets )[:,np.newaxis]
+    entrance_heights = np.full( num_entrances, -np.inf )
+    np.maximum.at( entrance_heights, entrance_of_node,
+            np.asarray( heights, dtype=np.float64 )[entrance_nodes] )
+    high_level_positions = np.concatenate( (zone_centers, entrance_centers) )
+    num_high_level_nodes = num_zones + num_entrances
+
+    # Each zone node is connected to the nodes of the entrances of the zone, and the other way
+    # round:
+    entrance_node_indices = num_zones + np.arange( num_entrances )
+    sources = np.concatenate( (entrance_zone_ids.reshape( -1 ),
+            np.repeat( entrance_node_indices, 2 )) )
+    targets = np.concatenate( (np.repeat( entrance_node_indices, 2 ),
+            entrance_zone_ids.reshape( -1 )) )
+    matrix = scipy.sparse.csr_matrix( (np.ones( len( sources ) ), (sources, targets)),
+            shape=(num_high_level_nodes, num_high_level_nodes) )
+    matrix.sort_indices()
+    high_level_neighbors = matrix.indices.astype( np.int64 )
+    high_level_sources = np.repeat( np.arange( num_high_level_nodes ), np.diff( matrix.indptr ) )
+    high_level_lengths = np.linalg.norm( high_level_positions[high_level_neighbors] -
+            high_level_positions[high_level_sources], axis=1 )
+
+    high_level_arrays = [high_level_positions.astype( np.float32 ), None,
+            np.concatenate( (zone_heights, entrance_heights) ).astype( np.float32 ),
+            np.full( num_high_level_nodes, -1, dtype=np.int32 ),
+            matrix.indptr.astype( np.int64 ), high_level_neighbors.astype( np.int32 ),
+            high_level_lengths.astype( np.float32 ),
+            np.zeros( num_high_level_nodes + 1, dtype=np.int64 ), np.zeros( 0, dtype=np.int32 ),
+            np.zeros( 0, dtype=np.float32 )]
+    for name, array in zip( nav_mesh_file.NODE_ARRAYS, high_level_arrays ):
+        if array is not None:
+            arrays[f"high_level_nodes.{name}"] = array
+
+    arrays["zones.ids"] = np.arange( num_zones, dtype=np.int32 )
+    arrays["zones.node_indices"] = np.arange( num_zones, dtype=np.int32 )
+    arrays["zones.heights"] = np.asarray( zone_heights, dtype=np.float64 )
+    arrays["entrances.zone_ids"] = entrance_zone_ids.astype( np.int32 ).reshape( -1, 2 )
+    arrays["entrances.node_indices"] = entrance_node_indices.astype( np.int32 )
+    arrays["entrances.offsets"] = entrance_offsets
+    arrays["entrances.nodes"] = entrance_nodes.astype( np.int32 )
+    if triangles is not None:
+        arrays["triangles"] = np.asarray( triangles, dtype=np.int32 ).reshape( -1, 3 )
+
+    # The entrance costs and the high-level graph are calculated from the low-level graph:
+    return nav_mesh_file.nav_mesh_from_arrays( arrays )
+
+def node_heights( vertices, normals, triangles, smooth_radius=3, workers=None ):
+    """ Clearance above each vertex (see clearance.max_node_heights), lowered to the lowest
+    clearance within smooth_radius (see clearance.smooth_max_node_heights, None to skip) """
+    heights = clearance.max_node_heights( vertices, normals, triangles, workers )
+    if smooth_radius is not None:
+        heights = clearance.smooth_max_node_heights( vertices, heights, smooth_radius )
+    return heights
+
+def build_nav_mesh( vertices, faces, heights=None, skip_connections=True,
+        split_at=(1,3,5,7), max_radius=10, smooth_radius=3, workers=None ):
+    """ Build a NavMesh from the vertices (V,3) and faces (an integer array of shape (F,k), or a
+    list of vertex index lists) of the nav surface. Node i is vertex i.
+    heights are the max_heights of the nodes. If they are not given, they are found by casting
+    rays along the vertex normals against the faces (see clearance.max_node_heights), using
+    the given number of worker processes (None for the number of CPUs), and then lowered to the
+    lowest height within smooth_radius (see clearance.smooth_max_node_heights, None to skip).
+    The vertices are split into zones of at most max_radius with the same height level (see
+    zone_clustering.cluster_zones), also using the worker processes. """
+
+    start_time = time.time()
+    vertices = np.asarray( vertices, dtype=np.float64 ).reshape( -1, 3 )
+    polygons = Polygons.from_faces( faces )
+    triangles = polygons.triangles()
+    face_normals = polygons.face_normals( vertices )
+    normals = polygons.vertex_normals( vertices, face_normals )
+    print( f"Building nav mesh from {len( vertices )} vertices and {polygons.num_faces} faces" )
+
+    offsets, neighbors = adjacency( polygons, len( vertices ), face_normals, skip_connections )
+    print( f"\tfound {len( neighbors )//2} connections ({time.time() - start_time:.2f}s)" )
+
+    if heights is None:
+        heights = node_heights( vertices, normals, triangles, smooth_radius, workers )
+        print( f"\tcalculated node heights ({time.time() - start_time:.2f}s)" )
+    heights = np.asarray( heights, dtype=np.float64 )
+
+    zone_ids, zone_heights = zone_clustering.cluster_zones( vertices, normals, heights, offsets,
+            neighbors, split_at, max_radius, workers )
+    print( f"\tsplit mesh into {len( zone_heights )} navigation zones " +
+            f"({time.time() - start_time:.2f}s)" )
+    statistics = zone_clustering.zone_size_statistics( zone_ids, len( zone_heights ) )
+    print( "\tzone sizes: " + ", ".join( f"{key} {value:g}" for key, value in statistics.items() ) )
+
+    nav_mesh = create_nav_mesh( vertices, normals, heights, offsets, neighbors, zone_ids,
+            zone_heights, triangles )
+    print( f"\tcreated nav mesh with {len( nav_mesh.entrances )} entrances " +
+            f"({time.time() - start_time:.2f}s)" )
+    return nav_mesh
+
+def build_nav_mesh_from_file( filename, **kwargs ):
+    """ Build a NavMesh from the mesh in an OBJ or PLY file, see build_nav_mesh """
+    vertices, faces = mesh_io.load_mesh( filename )
+    return build_nav_mesh( vertices, faces, **kwargs )
+
+# Zone radii tried by tune_nav_mesh if no configurations are given:
+TUNING_RADII = (5, 10, 20, 40)
+
+def tune_nav_mesh( vertices, faces, configurations=None, queries=None, num_queries=500,
+        objective="p99", heights=None, smooth_radius=3, workers=None ):
+    """ Bake the mesh once for each configuration, replay the same query workload on every bake
+    and return the NavMesh with the fewest failed queries and, out of those, the lowest query
+    latency, together with a report.
+    - configurations: list of dicts of build_nav_mesh arguments (max_radius, split_at,
+        skip_connections). Defaults to one configuration per radius in TUNING_RADII.
+    - queries: the workload, rows of (start_index, end_index) or (start_index, end_index,
+        min_height) where the indices are vertex indices. Should be representative of the
+        queries the game runs on this map. Defaults to num_queries random pairs of vertices.
+    - objective: the latency statistic which is compared, "p50", "p99" or "mean". Only the
+        queries which found a path count towards the latencies (see
+        benchmark.benchmark_path_queries).
+    The node heights are only calculated once (unless they are given, see build_nav_mesh).
+    The report holds, for each configuration, the number of zones and entrances, the build time,
+    the latency statistics (see benchmark.latency_statistics) and the number of failed queries.
+    """
+    if objective not in ( "p50", "p99", "mean" ):
+        raise ValueError( f"Unknown objective '{objective}', use 'p50', 'p99' or 'mean'!" )
+    if configurations is None:
+        configurations = [{ "max_radius": radius } for radius in TUNING_RADII]
+
+    vertices = np.asarray( vertices, dtype=np.float64 ).reshape( -1, 3 )
+    if heights is None:
+        polygons = Polygons.from_faces( faces )
+        normals = polygons.vertex_normals( vertices, polygons.face_normals( vertices ) )
+        heights = node_heights( vertices, normals, polygons.triangles(), smooth_radius, workers )
+    if queries is None:
+        queries = benchmark.random_path_queries( len( vertices ), num_queries )
+
+    report = []
+    best_nav_mesh = None
+    best_rank = None
+    for configuration in configurations:
+        start_time = time.time()
+        nav_mesh = build_nav_mesh( vertices, faces, heights=heights, workers=workers,
+                **configuration )
+        build_time = time.time() - start_time
+        latencies, failed = benchmark.benchmark_path_queries( nav_mesh, queries )
+        result = { "configuration": configuration, "zones": len( nav_mesh.zones ),
+                "entrances": len( nav_mesh.entrances ), "build_time": build_time,
+                "failed": failed }
+        result.update( benchmark.latency_statistics( latencies ) )
+        report.append( result )
+        rank = tuning_rank( result, objective )
+        if best_rank is None or rank < best_rank:
+            best_nav_mesh = nav_mesh
+            best_rank = rank
+
+    print_tuning_report( report, objective )
+    return best_nav_mesh, report
+
+def tuning_rank( result, objective ):
+    """ Configurations which fail fewer queries are better, then those with lower latency """
+    return ( result["failed"], result[objective] )
+
+def print_tuning_report( report, objective="p99" ):
+    best = min( report, key=lambda r: tuning_rank( r, objective ) ) if len( report ) > 0 else None
+    for r in report:
+        line = f"{str( r['configuration'] ):>40}: {r['zones']:6d} zones, " + \
+                f"{r['entrances']:6d} entrances, p50 {1000*r['p50']:8.3f} ms, " + \
+                f"p99 {1000*r['p99']:8.3f} ms, mean {1000*r['mean']:8.3f} ms, " + \
+                f"built in {r['build_time']:.2f} s"
+        if r["failed"] > 0:
+            line += f" ({r['failed']} queries failed)"
+        if r is best:
+            line += f" <- best {objective}"
+        print( line )
+
+if __name__ == "__main__":
+    tune = "--tune" in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != "--tune"]
+    if len( args ) != 2:
+        print( "Usage: python -m nav_mesh.nav_mesh_builder [--tune] <mesh.obj|mesh.ply> " +
+                "<output.navmesh>" )
+        sys.exit( 1 )
+    if tune:
+        vertices, faces = mesh_io.load_mesh( args[0] )
+        nav_mesh, report = tune_nav_mesh( vertices, faces )
+    else:
+        nav_mesh = build_nav_mesh_from_file( args[0] )
+    nav_mesh.save_to_binary_file( args[1] )
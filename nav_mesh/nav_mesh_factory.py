@@ -27,7 +27,7 @@ if not dir in sys.path:
     sys.path.append( dir )
     
 #from . import cube_clustering
-from . import size_clustering
+from . import zone_clustering
 from . import clustering_utils
 from . import nav_mesh
 from . import nav_node
@@ -40,7 +40,7 @@ from . import nav_mesh_factory_utils
 # changed since the last run. The 'import' statements above aren't sufficient for this,
 # because python/blender caches the modules.
 import importlib
-importlib.reload(size_clustering)
+importlib.reload(zone_clustering)
 importlib.reload(clustering_utils)
 importlib.reload(nav_mesh)
 importlib.reload(nav_node)
@@ -140,9 +140,11 @@ class NavZoneInterface():
 #            return NavZoneInterface.all_interfaces[interface_id]
 #        else:
 #            return NavZoneInterface( zone_id_1, zone_id_2 )
-def create_nav_mesh( nodes, num_zones, zone_heights ):
+def create_nav_mesh( nodes, num_zones, zone_heights, triangles=None ):
     
     nav = nav_mesh.NavMesh( nodes, num_zones )
+    if triangles is not None:
+        nav.set_triangles( triangles )
     
     # Create list of nodes for each "zone":
     zone_nodes = {}
@@ -165,7 +167,7 @@ def create_nav_mesh( nodes, num_zones, zone_heights ):
         zone = nav_zone.NavZone( zone_id=zone_id, nodes=zone_nodes[zone_id], height=zone_heights[zone_id] )
         nav.add_zone( zone )
         
-        zone.create_center_node( index=high_level_node_index )
+        zone.create_center_node( index=high_level_node_index, registry=nav.registry )
         high_level_node_index += 1
     
     # List of interfaces between zones. All touching "zones" make up exactly one interface
@@ -194,7 +196,7 @@ def create_nav_mesh( nodes, num_zones, zone_heights ):
             zone_1.add_entrance( entrance )
             zone_2.add_entrance( entrance )
             # Create a node at the center of this entrance
-            entrance.create_center_node( index=high_level_node_index )
+            entrance.create_center_node( index=high_level_node_index, registry=nav.registry )
             high_level_node_index += 1
             
             # Connect the zone nodes to the new entrance node:
@@ -205,6 +207,9 @@ def create_nav_mesh( nodes, num_zones, zone_heights ):
             
             nav.add_entrance( entrance )
             nav_mesh_factory_utils.entrance_to_mesh(entrance)
+    
+    # Build the array-backed graphs used for searching:
+    nav.init_graphs()
             
     return nav
 
@@ -351,6 +356,11 @@ def verts_to_nodes( verts, assigned_zone_ids, heights ):
     return nodes
 
 
+def faces_to_triangles( bm ):
+    # Triangulate the faces, each triangle is given by the indices of its vertices (which are the
+    # indices of the corresponding nodes, see verts_to_nodes):
+    triangles = [[loop.vert.index for loop in tri] for tri in bm.calc_loop_triangles()]
+    return np.asarray( triangles, dtype=np.int32 ).reshape( -1, 3 )
     
 def nav_mesh_from_object( obj ):
     
@@ -369,18 +379,24 @@ def nav_mesh_from_object( obj ):
     heights = nav_mesh_factory_utils.calculate_max_node_heights( bm )
     #nav_mesh_factory_utils.visualize_max_node_heights( bm, heights )
     
-    #heights = nav_mesh_factory_utils.smooth_max_node_heights( bm, heights )
+    heights = nav_mesh_factory_utils.smooth_max_node_heights( bm, heights )
     #nav_mesh_factory_utils.visualize_max_node_heights( bm, heights, "MaxNodeHeights_Smooth" )
     
-    assigned_zone_ids, zone_heights = size_clustering.split_zones_by_height( bm, heights )
+    # Processes can't be started from within blender, so cluster in this process:
+    positions, normals, offsets, neighbors = nav_mesh_factory_utils.vertex_arrays( bm )
+    assigned_zone_ids, zone_heights = zone_clustering.cluster_zones( positions, normals, heights,
+            offsets, neighbors, workers=1 )
+    assigned_zone_ids = assigned_zone_ids.tolist()
     num_zones = len(zone_heights)
     print(f"Split mesh into {num_zones} navigation zones.")
+    print("Zone sizes:", zone_clustering.zone_size_statistics( assigned_zone_ids, num_zones ))
     
     #assigned_zones, num_zones = cube_clustering.split_non_connected_zones( bm, assigned_zones )
     
     nodes = verts_to_nodes( bm.verts, assigned_zone_ids, heights )
+    triangles = faces_to_triangles( bm )
     
-    nav_mesh = create_nav_mesh( nodes, num_zones, zone_heights )
+    nav_mesh = create_nav_mesh( nodes, num_zones, zone_heights, triangles )
     create_high_level_mesh( nav_mesh )
     
     #visualize_max_node_heights( nav_mesh )
@@ -23,21 +23,17 @@ import random
 import numpy as np
 from scipy.spatial import KDTree
 from . import nav_node
+from . import clearance
 
-def smooth_max_node_heights( bm, heights ):
+def smooth_max_node_heights( bm, heights, radius=3 ):
     positions = np.empty( (len(bm.verts),3) )
     for i,v in enumerate(bm.verts):
         positions[i,:] = (v.co.x, v.co.y, v.co.z)
     
-    tree = KDTree( positions )
-
-    smooth_heights = []
-    for i, v in enumerate( bm.verts ):
-        indices = tree.query_ball_point( v.co, r=3 )
-        new_height = min( [heights[j] for j in indices] )
-        smooth_heights.append( new_height )
+    # Each vertex gets the lowest height within radius, see clearance.smooth_max_node_heights:
+    smooth_heights = clearance.smooth_max_node_heights( positions, heights, radius )
     
-    return smooth_heights
+    return smooth_heights.tolist()
 
 def calculate_max_node_heights( bm ):
     
@@ -113,6 +109,20 @@ def get_neighbor_verts( v ):
 
     neighbors = [ e.other_vert( v ) for e in v.link_edges]
     return neighbors
+
+def vertex_arrays( bm ):
+    # Positions, normals and the neighbors of all vertices (as CSR arrays, the neighbors of vertex
+    # i are neighbors[offsets[i]:offsets[i+1]]), for the array based zone clustering:
+    positions = np.array( [v.co for v in bm.verts], dtype=np.float64 ).reshape( -1, 3 )
+    normals = np.array( [v.normal for v in bm.verts], dtype=np.float64 ).reshape( -1, 3 )
+    edges = np.array( [(e.verts[0].index, e.verts[1].index) for e in bm.edges],
+            dtype=np.int64 ).reshape( -1, 2 )
+    sources = np.concatenate( (edges[:,0], edges[:,1]) )
+    targets = np.concatenate( (edges[:,1], edges[:,0]) )
+    order = np.lexsort( (targets, sources) )
+    offsets = np.zeros( len( positions ) + 1, dtype=np.int64 )
+    offsets[1:] = np.cumsum( np.bincount( sources, minlength=len( positions ) ) )
+    return positions, normals, offsets, targets[order]
  
 def duplicate_object( orig_obj, new_name ):
     new_obj = orig_obj.copy()
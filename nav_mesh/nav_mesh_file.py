@@ -0,0 +1,266 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+# Binary, versioned file format for NavMeshes, which can be opened via np.memmap without
+# unpickling any python objects.
+#
+# Layout:
+#   - 8 bytes magic (MAGIC)
+#   - uint32 format version, uint32 length of the header (little endian)
+#   - header: utf-8 encoded JSON, holding the dtype, shape and offset of every array
+#   - the arrays, each one starting at a multiple of ALIGNMENT bytes. Offsets in the header are
+#     relative to the start of the first array, which is the first multiple of ALIGNMENT after
+#     the header.
+#
+# Convert an existing pickled mesh with:
+#   python -m nav_mesh.nav_mesh_file nav_mesh.pickle nav_mesh.navmesh
+
+import sys
+import json
+import struct
+import numpy as np
+
+from . import nav_mesh
+from . import nav_graph
+from . import nav_zone
+from . import nav_zone_entrance
+from . import node_registry
+from . import landmarks
+from . import high_level_table
+from . import entrance_costs
+
+MAGIC = b"NAVMESH\0"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# Arrays of node_registry.NodeArrays, stored for both levels:
+NODE_ARRAYS = ( "positions", "normals", "max_heights", "zone_ids", "offsets", "neighbors",
+        "lengths", "next_level_offsets", "next_level_neighbors", "next_level_lengths" )
+LEVEL_PREFIXES = ( "nodes", "high_level_nodes" )
+
+def align( offset ):
+    return (offset + ALIGNMENT - 1)//ALIGNMENT*ALIGNMENT
+
+def nav_mesh_to_arrays( nav_mesh, include_blocked=False ):
+    """ Return all the data of the mesh (which is needed for searching) as a dict of flat
+    numpy arrays. Blocked nodes are runtime state and only included if include_blocked is set. """
+
+    registry = nav_mesh.registry
+    registry.compact()
+
+    arrays = {}
+    for level, prefix in enumerate( LEVEL_PREFIXES ):
+        for name in NODE_ARRAYS:
+            array = getattr( registry.arrays[level], name )
+            if array is not None:
+                arrays[f"{prefix}.{name}"] = array
+
+    zone_ids = sorted( nav_mesh.zones.keys() )
+    arrays["zones.ids"] = np.asarray( zone_ids, dtype=np.int32 )
+    arrays["zones.node_indices"] = np.asarray( [nav_mesh.zones[z].node.index for z in zone_ids],
+            dtype=np.int32 )
+    arrays["zones.heights"] = np.asarray( [nav_mesh.zones[z].height for z in zone_ids],
+            dtype=np.float64 )
+    # Low-level node indices sorted by zone (see NavGraph.zone_node_indices), so that the nodes of
+    # a zone can be looked up without touching the data of all other nodes:
+    graph = nav_mesh.graph
+    graph.zone_node_indices( 0 )
+    arrays["zones.nodes"] = graph.zone_nodes
+    arrays["zones.node_offsets"] = graph.zone_offsets
+
+    # Entrances, with the (low-level) nodes of entrance i in
+    # nodes[offsets[i]:offsets[i+1]]:
+    entrances = nav_mesh.entrances
+    arrays["entrances.zone_ids"] = np.asarray(
+            [(e.zone_id_1, e.zone_id_2) for e in entrances], dtype=np.int32 ).reshape( -1, 2 )
+    arrays["entrances.node_indices"] = np.asarray( [e.node.index for e in entrances],
+            dtype=np.int32 )
+    arrays["entrances.offsets"] = np.cumsum( [0] + [len( e.nodes ) for e in entrances],
+            dtype=np.int64 )
+    arrays["entrances.nodes"] = np.asarray( [n.index for e in entrances for n in e.nodes],
+            dtype=np.int32 )
+
+    costs = [(zone_id, index_1, index_2, cost)
+            for zone_id, zone_costs in nav_mesh.entrance_costs.items()
+            for index_1, index_2, cost in zone_costs]
+    arrays["entrance_costs.zone_ids"] = np.asarray( [c[0] for c in costs], dtype=np.int32 )
+    arrays["entrance_costs.entrances"] = np.asarray( [c[1:3] for c in costs],
+            dtype=np.int32 ).reshape( -1, 2 )
+    arrays["entrance_costs.costs"] = np.asarray( [c[3] for c in costs], dtype=np.float64 )
+
+    # The other per-node arrays of the high-level graph are the same as those of the high-level
+    # nodes:
+    high_level_graph = nav_mesh.high_level_graph
+    arrays["high_level_graph.offsets"] = high_level_graph.offsets
+    arrays["high_level_graph.neighbors"] = high_level_graph.neighbors
+    arrays["high_level_graph.lengths"] = high_level_graph.lengths
+
+    # Optional precomputed data:
+    if nav_mesh.graph.landmarks is not None:
+        arrays["landmarks.landmarks"] = nav_mesh.graph.landmarks.landmarks
+        arrays["landmarks.distances"] = nav_mesh.graph.landmarks.distances
+    table = nav_mesh.get_high_level_table()
+    if table is not None:
+        for name in ( "rows", "nodes", "dist", "next_hop" ):
+            arrays[f"high_level_table.{name}"] = getattr( table, name )
+    if nav_mesh.triangle_mesh is not None:
+        arrays["triangles"] = nav_mesh.triangle_mesh.triangles
+    if include_blocked and nav_mesh.graph.blocked is not None:
+        arrays["graph.blocked"] = nav_mesh.graph.blocked
+
+    return arrays
+
+def nav_mesh_from_arrays( arrays ):
+    """ Create a NavMesh from the arrays returned by nav_mesh_to_arrays. The arrays are used as
+    they are (not copied). The low-level nodes are only created once they are accessed. """
+
+    level_arrays = [node_registry.NodeArrays( *[arrays.get( f"{prefix}.{name}" )
+            for name in NODE_ARRAYS] ) for prefix in LEVEL_PREFIXES]
+    registry = node_registry.NodeRegistry.from_arrays( level_arrays )
+    nodes = registry.levels[0]
+    high_level_nodes = registry.levels[1]
+
+    zone_ids = arrays["zones.ids"].tolist()
+    mesh = nav_mesh.NavMesh( nodes, len( zone_ids ), registry=registry )
+    mesh.graph = nav_graph.NavGraph.from_node_arrays( level_arrays[0], nodes )
+    if "zones.nodes" in arrays:
+        mesh.graph.zone_nodes = arrays["zones.nodes"]
+        mesh.graph.zone_offsets = arrays["zones.node_offsets"]
+
+    for zone_id, node_index, height in zip( zone_ids, arrays["zones.node_indices"].tolist(),
+            arrays["zones.heights"].tolist() ):
+        zone_nodes = node_registry.NodeSubset( nodes, mesh.graph.zone_node_indices( zone_id ) )
+        zone = nav_zone.NavZone( zone_id=zone_id, nodes=zone_nodes, height=height )
+        zone.node = high_level_nodes[node_index]
+        mesh.add_zone( zone )
+
+    offsets = arrays["entrances.offsets"]
+    entrance_nodes = arrays["entrances.nodes"]
+    high_level_max_heights = level_arrays[1].max_heights.tolist()
+    for i, ((zone_id_1, zone_id_2), node_index) in enumerate( zip(
+            arrays["entrances.zone_ids"].tolist(), arrays["entrances.node_indices"].tolist() ) ):
+        entrance = nav_zone_entrance.NavZoneEntrance( zone_id_1, zone_id_2,
+                node_registry.NodeSubset( nodes, entrance_nodes[offsets[i]:offsets[i+1]] ),
+                validate=False, max_height=high_level_max_heights[node_index] )
+        entrance.node = high_level_nodes[node_index]
+        entrance.node.entrance = entrance
+        # Same order as in nav_mesh_factory.create_nav_mesh:
+        mesh.zones[zone_id_1].add_entrance( entrance )
+        mesh.zones[zone_id_2].add_entrance( entrance )
+        mesh.add_entrance( entrance )
+
+    if "entrance_costs.costs" not in arrays:
+        # Freshly built meshes (see nav_mesh_builder) don't have the costs and the high-level
+        # graph yet:
+        mesh.entrance_costs = entrance_costs.calculate_entrance_costs( mesh )
+        mesh.high_level_graph = entrance_costs.build_high_level_graph( mesh, mesh.entrance_costs )
+    else:
+        mesh.entrance_costs = { zone_id: [] for zone_id in zone_ids }
+        for zone_id, (index_1, index_2), cost in zip( arrays["entrance_costs.zone_ids"].tolist(),
+                arrays["entrance_costs.entrances"].tolist(),
+                arrays["entrance_costs.costs"].tolist() ):
+            mesh.entrance_costs[zone_id].append( (index_1, index_2, cost) )
+
+        high_level_arrays = level_arrays[1]
+        num_high_level_nodes = len( high_level_arrays.zone_ids )
+        mesh.high_level_graph = nav_graph.NavGraph( high_level_arrays.positions,
+                high_level_arrays.zone_ids, high_level_arrays.max_heights,
+                arrays["high_level_graph.offsets"], arrays["high_level_graph.neighbors"],
+                arrays["high_level_graph.lengths"],
+                np.zeros( num_high_level_nodes + 1, dtype=np.int64 ),
+                np.zeros( 0, dtype=np.int32 ), nodes=high_level_nodes )
+
+    if "landmarks.distances" in arrays:
+        mesh.graph.landmarks = landmarks.Landmarks( arrays["landmarks.landmarks"],
+                arrays["landmarks.distances"] )
+    if "high_level_table.dist" in arrays:
+        mesh.high_level_table = high_level_table.HighLevelTable(
+                *[arrays[f"high_level_table.{name}"] for name in ( "rows", "nodes", "dist",
+                    "next_hop" )] )
+    if "triangles" in arrays:
+        mesh.set_triangles( arrays["triangles"] )
+    if "graph.blocked" in arrays:
+        # Copied, so that every user of the arrays can block nodes on its own:
+        mesh.graph.blocked = np.array( arrays["graph.blocked"] )
+
+    return mesh
+
+def layout( arrays ):
+    """ Make the arrays contiguous and determine where each of them is placed.
+    Returns the encoded header, the offset of the first array and the total size in bytes. """
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray( array )
+        arrays[name] = array
+        entries[name] = { "dtype": array.dtype.str, "shape": list( array.shape ),
+                "offset": offset }
+        offset = align( offset + array.nbytes )
+    header = json.dumps( { "arrays": entries } ).encode( "utf-8" )
+    data_start = align( len( MAGIC ) + 8 + len( header ) )
+    return header, data_start, data_start + offset
+
+def write_arrays( data, arrays, header, data_start ):
+    """ Write the magic, header and arrays (see layout) into the uint8 array data """
+    data[:len( MAGIC )] = np.frombuffer( MAGIC, dtype=np.uint8 )
+    prefix = struct.pack( "<II", FORMAT_VERSION, len( header ) ) + header
+    data[len( MAGIC ):len( MAGIC ) + len( prefix )] = np.frombuffer( prefix, dtype=np.uint8 )
+    entries = json.loads( header.decode( "utf-8" ) )["arrays"]
+    for name, array in arrays.items():
+        begin = data_start + entries[name]["offset"]
+        data[begin:begin + array.nbytes] = array.reshape( -1 ).view( np.uint8 )
+
+def arrays_from_buffer( data, name="buffer" ):
+    """ Return a dict of the arrays stored in data (a uint8 array holding a whole NavMesh file).
+    The arrays are views into data, nothing is copied. """
+    if bytes( data[:len( MAGIC )] ) != MAGIC:
+        raise ValueError( f"{name} is not a NavMesh file!" )
+    version, header_length = struct.unpack( "<II", bytes( data[len( MAGIC ):len( MAGIC ) + 8] ) )
+    if version > FORMAT_VERSION:
+        raise ValueError( f"{name} has format version {version}, but only versions up " +
+                f"to {FORMAT_VERSION} are supported. Please update!" )
+    header_start = len( MAGIC ) + 8
+    header = json.loads( bytes( data[header_start:header_start + header_length] ).decode( "utf-8" ) )
+    data_start = align( header_start + header_length )
+
+    arrays = {}
+    for array_name, entry in header["arrays"].items():
+        dtype = np.dtype( entry["dtype"] )
+        shape = tuple( entry["shape"] )
+        begin = data_start + entry["offset"]
+        end = begin + dtype.itemsize*int( np.prod( shape ) )
+        arrays[array_name] = data[begin:end].view( dtype ).reshape( shape )
+    return arrays
+
+def save( nav_mesh, filename ):
+    arrays = nav_mesh_to_arrays( nav_mesh )
+    header, data_start, size = layout( arrays )
+    data = np.memmap( filename, dtype=np.uint8, mode="w+", shape=size )
+    write_arrays( data, arrays, header, data_start )
+    data.flush()
+    del data
+
+def is_nav_mesh_file( filename ):
+    """ Check whether the file is in the binary format (as opposed to, for example, a pickle) """
+    with open( filename, "rb" ) as f:
+        return f.read( len( MAGIC ) ) == MAGIC
+
+def load_arrays( filename, mode="r" ):
+    """ Memory-map the file and return a dict of the arrays in it. The arrays are views into the
+    mapped file, nothing is read until it is accessed.
+    With mode "r", the arrays are read-only. Use "c" (copy-on-write) to be able to modify them
+    without changing the file. """
+    return arrays_from_buffer( np.memmap( filename, dtype=np.uint8, mode=mode ), filename )
+
+def load( filename, mode="r" ):
+    return nav_mesh_from_arrays( load_arrays( filename, mode ) )
+
+def convert_pickle_file( pickle_filename, filename ):
+    """ Convert a pickled NavMesh (see NavMesh.save_to_file) to the binary format """
+    save( nav_mesh.NavMesh.load_from_file( pickle_filename ), filename )
+
+if __name__ == "__main__":
+    convert_pickle_file( sys.argv[1], sys.argv[2] )
+    print( "Saved nav_mesh as:", sys.argv[2] )
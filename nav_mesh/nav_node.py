@@ -7,11 +7,39 @@ import numpy as np
 import math
 
 class SimpleNavNode():
+
+    __slots__ = ( "_pos", "_normal", "_max_height", "blocked" )
+
     def __init__( self, pos, normal=None, max_height=0):
-        self.pos = np.asarray(pos)
-        self.normal = normal
-        self.max_height = max_height
+        self._pos = np.asarray(pos)
+        self._normal = normal
+        self._max_height = max_height
         self.blocked = False
+
+    @property
+    def pos( self ):
+        return self._pos
+
+    @pos.setter
+    def pos( self, pos ):
+        self._pos = np.asarray( pos )
+
+    @property
+    def normal( self ):
+        return self._normal
+
+    @normal.setter
+    def normal( self, normal ):
+        self._normal = normal
+
+    @property
+    def max_height( self ):
+        return self._max_height
+
+    @max_height.setter
+    def max_height( self, max_height ):
+        self._max_height = max_height
+
     def get_pos_above( self, height, normal=None ):
         if normal:
             return self.pos + normal*height
@@ -19,13 +47,21 @@ class SimpleNavNode():
             return self.pos + self.normal*height
 
 class NavNode( SimpleNavNode ):
+
+    # While a mesh is being built, every node holds its own data (position, neighbors, ...).
+    # Once the mesh is complete, its NodeRegistry moves this data into arrays (see
+    # NodeRegistry.compact) and the nodes become lightweight views into these arrays, which
+    # only know their index. A node is a view if its _pos is None.
+    __slots__ = ( "index", "level", "registry", "entrance", "_zone_id",
+            "__direct_neighbors", "__next_level_neighbors", "__neighbor_dists", "__weakref__" )
+
+    # Attributes which are pickled:
+    state_attributes = ( "_pos", "_normal", "_max_height", "blocked", "index", "level",
+            "registry", "entrance", "_zone_id", "_NavNode__direct_neighbors",
+            "_NavNode__next_level_neighbors", "_NavNode__neighbor_dists" )
     
-    # List of all nodes.
-    # First dictionary holds all low-level nodes by index,
-    # second dictionary holds all high-level nodes by index
-    node_list = [{},{}]
-    
-    def __init__( self, pos, index, zone_id=None, level=0, normal=None, max_height=0):
+    def __init__( self, pos, index, zone_id=None, level=0, normal=None, max_height=0,
+            registry=None ):
         SimpleNavNode.__init__( self, pos, normal, max_height )
 
         # Neighbors of this node which are on the same "level"
@@ -38,32 +74,99 @@ class NavNode( SimpleNavNode ):
         self.__neighbor_dists = {}
         
         self.index = index
-        self.zone_id = zone_id
-        self.pos = pos
-        self.normal = normal
-        self.max_height = max_height
-        
-        self.parent_node_id = -1
-        self.g = 0
-        self.h = None
+        self._zone_id = zone_id
         
         # Only set when this is a high-level node representing an entrance between two zones:
         self.entrance = None
         
         self.level = level
-        NavNode.node_list[self.level][index] = self
-        
-    def set_heuristic( self, heuristic ):
-        self.h = heuristic
-    
-    def set_parent( self, parent_node, angle_penalty=0 ):
-        if parent_node:
-            self.g = parent_node.g + np.linalg.norm(parent_node.pos - self.pos) + angle_penalty
-            self.parent_node_id = parent_node.index
+
+        # NodeRegistry through which the neighbors are looked up. Nodes created without a
+        # registry get one once they are added to a NavMesh:
+        self.registry = None
+        if registry is not None:
+            registry.add( self )
+
+    @staticmethod
+    def view( registry, level, index ):
+        """ Create a node which is a view into the (compacted) registry's arrays """
+        node = NavNode.__new__( NavNode )
+        node._pos = None
+        node._normal = None
+        node._max_height = None
+        node.blocked = False
+        node.index = index
+        node.level = level
+        node.registry = registry
+        node.entrance = None
+        node._zone_id = None
+        node.__direct_neighbors = None
+        node.__next_level_neighbors = None
+        node.__neighbor_dists = None
+        return node
+
+    @property
+    def is_view( self ):
+        return self._pos is None
+
+    @property
+    def arrays( self ):
+        """ The NodeArrays holding this node's data (only for views) """
+        return self.registry.arrays[self.level]
+
+    @property
+    def pos( self ):
+        if self._pos is None:
+            return self.registry.arrays[self.level].positions[self.index]
+        return self._pos
+
+    @pos.setter
+    def pos( self, pos ):
+        if self._pos is None:
+            self.arrays.positions[self.index] = pos
         else:
-            self.g = 0      # Distance from start node
-            self.parent_node_id = -1
+            self._pos = np.asarray( pos )
+
+    @property
+    def normal( self ):
+        if self._pos is None and self.arrays.normals is not None:
+            return self.arrays.normals[self.index]
+        return self._normal
+
+    @normal.setter
+    def normal( self, normal ):
+        if self._pos is None and self.arrays.normals is not None:
+            self.arrays.normals[self.index] = normal
+        else:
+            self._normal = normal
+
+    @property
+    def max_height( self ):
+        if self._pos is None:
+            return float( self.arrays.max_heights[self.index] )
+        return self._max_height
 
+    @max_height.setter
+    def max_height( self, max_height ):
+        if self._pos is None:
+            self.arrays.max_heights[self.index] = max_height
+        else:
+            self._max_height = max_height
+
+    @property
+    def zone_id( self ):
+        if self._pos is None:
+            zone_id = int( self.arrays.zone_ids[self.index] )
+            return zone_id if zone_id >= 0 else None
+        return self._zone_id
+
+    @zone_id.setter
+    def zone_id( self, zone_id ):
+        if self._pos is None:
+            self.arrays.zone_ids[self.index] = zone_id if zone_id is not None else -1
+        else:
+            self._zone_id = zone_id
+        
     def get_node_on_other_side( self, entrance ):
         # Return the node "opposite" of this node, i.e. the connected node which leads
         # through the given entrance.
@@ -82,54 +185,89 @@ class NavNode( SimpleNavNode ):
                     
         return closest_node
         
-    @property    
-    def f( self ):
-        #f = self.g + math.sqrt(self.h)       # Total cost
-        f = self.g + self.h      # Total cost
-        return f
-    
-    def __lt__( self, other ):
-        return self.f < other.f
-    
     def add_direct_neighbor( self, n ):
         assert self.index != n.index, "Error: Cannot add node with same index as neighbor!"
+        if self._pos is None:
+            raise RuntimeError( "Cannot add neighbors to a compacted node, " +
+                    "call NodeRegistry.expand first!" )
         self.__direct_neighbors.add( n.index )
         self.__neighbor_dists[n.index] = np.linalg.norm( self.pos - n.pos )
         
     @property
     def direct_neighbors( self ):
-        for index in self.__direct_neighbors:
-            yield NavNode.node_list[self.level][index]
+        nodes = self.registry.levels[self.level]
+        for index in self.direct_neighbor_indices():
+            yield nodes[index]
+
+    def direct_neighbor_indices( self ):
+        if self._pos is None:
+            arrays = self.arrays
+            return arrays.neighbors[arrays.offsets[self.index]:arrays.offsets[self.index+1]].tolist()
+        return self.__direct_neighbors
     
     def add_next_level_neighbor( self, n ):
         assert self.index != n.index, "Error: Cannot add node with same index as neighbor!"
+        if self._pos is None:
+            raise RuntimeError( "Cannot add neighbors to a compacted node, " +
+                    "call NodeRegistry.expand first!" )
         self.__next_level_neighbors.add( n.index )
         self.__neighbor_dists[n.index] = np.linalg.norm( self.pos - n.pos )
         
     @property
     def next_level_neighbors( self ):
-        for index in self.__next_level_neighbors:
-            yield NavNode.node_list[self.level][index]
-        
-    @property
-    def parent_node( self ):
-        if self.parent_node_id in NavNode.node_list[self.level]:
-            return NavNode.node_list[self.level][self.parent_node_id]
-        return None
+        nodes = self.registry.levels[self.level]
+        for index in self.next_level_neighbor_indices():
+            yield nodes[index]
 
+    def next_level_neighbor_indices( self ):
+        if self._pos is None:
+            arrays = self.arrays
+            begin = arrays.next_level_offsets[self.index]
+            end = arrays.next_level_offsets[self.index+1]
+            return arrays.next_level_neighbors[begin:end].tolist()
+        return self.__next_level_neighbors
+        
     def dist_to_neighbor( self, other ):
+        if self._pos is None:
+            return self.arrays.dist_to_neighbor( self.index, other.index )
         return self.__neighbor_dists[other.index]
 
+    def to_view( self ):
+        """ Drop the data held by the node itself. Only call once the registry's arrays hold it
+        (see NodeRegistry.compact). """
+        if self.arrays.normals is not None:
+            self._normal = None
+        self._pos = None
+        self._max_height = None
+        self._zone_id = None
+        self.__direct_neighbors = None
+        self.__next_level_neighbors = None
+        self.__neighbor_dists = None
+
+    def to_standalone( self ):
+        """ Copy the node's data out of the registry's arrays back into the node (see
+        NodeRegistry.expand) """
+        if self._pos is not None:
+            return
+        pos = np.array( self.pos, dtype=np.float64 )
+        if self.arrays.normals is not None:
+            self._normal = np.array( self.normal, dtype=np.float64 )
+        self._max_height = self.max_height
+        self._zone_id = self.zone_id
+        direct = set( self.direct_neighbor_indices() )
+        next_level = set( self.next_level_neighbor_indices() )
+        dists = { i: self.arrays.dist_to_neighbor( self.index, i ) for i in direct | next_level }
+        self.__direct_neighbors = direct
+        self.__next_level_neighbors = next_level
+        self.__neighbor_dists = dists
+        self._pos = pos
+
     def angle_penalty( self, other, max_ang = 0.5*math.pi, initial_dir = np.asarray((0,0,0)) ):
-        """ If we have a parent, penalize tight angles in the path parent->self->other """
+        """ Penalize tight angles in the path parent->self->other. initial_dir is the direction
+        in which the path arrives at this node (i.e. the direction from the parent to self). """
 
-        # Determine the incoming direction. If we have a parent, use that direction.
-        # Otherwise, use the given initial_dir.
-        pn = self.parent_node
-        if pn:
-            from_parent = (self.pos - pn.pos)
-        else:
-            from_parent = initial_dir
+        # Determine the incoming direction:
+        from_parent = initial_dir
 
         # The direction in which we are considering leaving this node:
         to_other = (other.pos - self.pos)
@@ -137,7 +275,6 @@ class NavNode( SimpleNavNode ):
         # Let the angle between these determine the penalty: Small angles are penalized most:
         dist_from_parent = np.linalg.norm( from_parent )
         dist_to_other = np.linalg.norm( to_other )
-        assert dist_from_parent > 0, initial_dir
         if dist_from_parent > 0 and dist_to_other > 0:
             dot = np.dot( from_parent, to_other )/(dist_from_parent*dist_to_other)
             dot = max( -1, min( dot, 1 ) )  # Only necessary for the occasional numerical imprecision
@@ -152,18 +289,22 @@ class NavNode( SimpleNavNode ):
         next_level_neighbors = [n for n in self.next_level_neighbors]
         return f"Node: {self.index}, zone ID: {self.zone_id}, ({self.pos}), (direct: {len(direct_neighbors)}, next-level: {len(next_level_neighbors)})"
     
-    def __setstate__( self, state ):
-        self.__dict__ = state
+    def __getstate__( self ):
+        return { name: getattr( self, name ) for name in NavNode.state_attributes }
 
-        self.blocked = False        # May not have been set by cave generator
+    def __setstate__( self, state ):
+        # Nodes saved before __slots__ were introduced have their attributes under other names,
+        # and may not have all of them:
+        for old_name in ( "pos", "normal", "max_height", "zone_id" ):
+            if old_name in state:
+                state["_" + old_name] = state.pop( old_name )
+        if state["_pos"] is not None:
+            state["_pos"] = np.asarray( state["_pos"] )
 
-#        p = state["pos"]
-#        self.__dict__["pos"] = LVector3f( p[0], p[1], p[2] )
-#        n = state["normal"]
-#        if type(n) == np.ndarray:
-#            self.__dict__["normal"] = LVector3f( n[0], n[1], n[2] )
-        NavNode.node_list[self.level][self.index] = self
-        #print("self.level", self.level, self.index,
-        #        len(NavNode.node_list[self.level]), max(NavNode.node_list[self.level]))
+        for name in NavNode.state_attributes:
+            setattr( self, name, state.get( name ) )
 
+        self.blocked = False        # May not have been set by cave generator
 
+        # Nodes saved before registries were introduced are added to their mesh's registry
+        # in NavMesh.__setstate__.
@@ -53,7 +53,8 @@ class NavZone():
         if not self.center_vert:
             self.center_vert = bm.verts.new( self.center )
         
-    def create_center_node( self, index ):
+    def create_center_node( self, index, registry=None ):
         if not self.node:
-            self.node = nav_node.NavNode( self.center, index, level=1, max_height=self.height )
+            self.node = nav_node.NavNode( self.center, index, level=1, max_height=self.height,
+                    registry=registry )
           
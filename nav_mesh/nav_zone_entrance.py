@@ -24,33 +24,38 @@ class NavZoneEntrance():
     
     all_entrances = {}
     
-    def __init__( self, zone_id_1, zone_id_2, nodes ):
+    def __init__( self, zone_id_1, zone_id_2, nodes, validate=True, max_height=None ):
         self.zone_id_1 = zone_id_1
         self.zone_id_2 = zone_id_2
         
         self.nodes = nodes
         
-        self.max_height = max( [n.max_height for n in nodes] )
+        # The highest of the nodes, unless known already (for entrances restored from arrays):
+        if max_height is None:
+            max_height = max( [n.max_height for n in nodes] )
+        self.max_height = max_height
         
-        print("Building entrance:", [n.zone_id for n in nodes] )
-        
-        # Ensure all verts are connected:
-        nodes_copy = nodes.copy()
-        front = [nodes_copy.pop()]
-        while len( front ) > 0:
-            node = front.pop()
-            for neighbor in node.direct_neighbors:
-                if neighbor in nodes_copy:
-                    nodes_copy.remove( neighbor )
-                    front.append( neighbor )
+        # Entrances which are restored from a saved mesh have been checked when they were built:
+        if validate:
+            print("Building entrance:", [n.zone_id for n in nodes] )
             
-            for neighbor in node.next_level_neighbors:
-                if neighbor in nodes_copy:
-                    nodes_copy.remove( neighbor )
-                    front.append( neighbor )
-        
-        if len( nodes_copy ) > 0:
-            raise ValueError("All verts in a NavZoneEntrance should be connected, but they aren't!")
+            # Ensure all verts are connected:
+            nodes_copy = nodes.copy()
+            front = [nodes_copy.pop()]
+            while len( front ) > 0:
+                node = front.pop()
+                for neighbor in node.direct_neighbors:
+                    if neighbor in nodes_copy:
+                        nodes_copy.remove( neighbor )
+                        front.append( neighbor )
+                
+                for neighbor in node.next_level_neighbors:
+                    if neighbor in nodes_copy:
+                        nodes_copy.remove( neighbor )
+                        front.append( neighbor )
+            
+            if len( nodes_copy ) > 0:
+                raise ValueError("All verts in a NavZoneEntrance should be connected, but they aren't!")
         
         self.mean_point = None
         self.center_vert = None
@@ -75,9 +80,10 @@ class NavZoneEntrance():
         if not self.center_vert:
             self.center_vert = bm.verts.new( self.center )
             
-    def create_center_node( self, index ):
+    def create_center_node( self, index, registry=None ):
         if not self.node:
-            self.node = nav_node.NavNode( self.center, index, level=1, max_height=self.max_height )
+            self.node = nav_node.NavNode( self.center, index, level=1, max_height=self.max_height,
+                    registry=registry )
             self.node.entrance = self
             
     def __str__( self ):
@@ -0,0 +1,228 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import numpy as np
+import weakref
+from collections.abc import Sequence
+
+class NodeArrays():
+    """ Data of all nodes of one level, indexed by node index.
+
+    The neighbors are stored in compressed sparse row (CSR) form: the direct neighbors of node i
+    are neighbors[offsets[i]:offsets[i+1]], with the distances lengths[offsets[i]:offsets[i+1]].
+    The same goes for the next-level neighbors. This is the same layout as NavGraph uses, so
+    the arrays can be shared with the graph (see NavGraph.from_node_arrays).
+    normals is None if not all nodes have a normal (like the high-level nodes), in that case
+    the nodes keep their normal themselves. """
+
+    def __init__( self, positions, normals, max_heights, zone_ids, offsets, neighbors, lengths,
+            next_level_offsets, next_level_neighbors, next_level_lengths ):
+        self.positions = positions
+        self.normals = normals
+        self.max_heights = max_heights
+        self.zone_ids = zone_ids
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.lengths = lengths
+        self.next_level_offsets = next_level_offsets
+        self.next_level_neighbors = next_level_neighbors
+        self.next_level_lengths = next_level_lengths
+
+    @staticmethod
+    def from_nodes( nodes ):
+        """ Gather the data of the (not yet compacted) nodes. Node i must have index i. """
+
+        num_nodes = len( nodes )
+        positions = np.empty( (num_nodes,3), dtype=np.float32 )
+        max_heights = np.empty( num_nodes, dtype=np.float32 )
+        zone_ids = np.empty( num_nodes, dtype=np.int32 )
+        has_normals = all( n.normal is not None for n in nodes )
+        normals = np.empty( (num_nodes,3), dtype=np.float32 ) if has_normals else None
+
+        offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+        next_level_offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+        neighbors = []
+        lengths = []
+        next_level_neighbors = []
+        next_level_lengths = []
+
+        for i, n in enumerate( nodes ):
+            assert n is not None and n.index == i, "Node indices must run from 0 to N-1!"
+            positions[i,:] = n.pos
+            if has_normals:
+                normals[i,:] = n.normal
+            max_heights[i] = n.max_height
+            zone_ids[i] = n.zone_id if n.zone_id is not None else -1
+
+            for index in n.direct_neighbor_indices():
+                neighbors.append( index )
+                lengths.append( n.dist_to_neighbor( nodes[index] ) )
+            offsets[i+1] = len( neighbors )
+
+            for index in n.next_level_neighbor_indices():
+                next_level_neighbors.append( index )
+                next_level_lengths.append( n.dist_to_neighbor( nodes[index] ) )
+            next_level_offsets[i+1] = len( next_level_neighbors )
+
+        return NodeArrays( positions, normals, max_heights, zone_ids,
+                offsets, np.asarray( neighbors, dtype=np.int32 ),
+                np.asarray( lengths, dtype=np.float32 ),
+                next_level_offsets, np.asarray( next_level_neighbors, dtype=np.int32 ),
+                np.asarray( next_level_lengths, dtype=np.float32 ) )
+
+    @property
+    def nbytes( self ):
+        return sum( a.nbytes for a in self.__dict__.values() if a is not None )
+
+    def dist_to_neighbor( self, index, neighbor_index ):
+        for offsets, neighbors, lengths in (
+                (self.offsets, self.neighbors, self.lengths),
+                (self.next_level_offsets, self.next_level_neighbors, self.next_level_lengths) ):
+            begin, end = offsets[index], offsets[index+1]
+            found = np.flatnonzero( neighbors[begin:end] == neighbor_index )
+            if len( found ) > 0:
+                return float( lengths[begin + found[0]] )
+        raise KeyError( neighbor_index )
+
+class LazyNodeList( Sequence ):
+    """ List of all nodes of one (compacted) level of a registry, which only creates the NavNode
+    views once they are accessed. Used for meshes which are loaded from arrays (see
+    nav_mesh_file), so that no per-node python objects have to be created up front.
+    Views are only kept while they are in use elsewhere, so the memory used by the list does not
+    grow with the number of nodes which were accessed at some point. """
+
+    def __init__( self, registry, level, num_nodes ):
+        self.registry = registry
+        self.level = level
+        self.num_nodes = num_nodes
+        self.created = weakref.WeakValueDictionary()
+
+    def __len__( self ):
+        return self.num_nodes
+
+    def __getitem__( self, index ):
+        if isinstance( index, slice ):
+            return [self[i] for i in range( *index.indices( len( self ) ) )]
+        index = int( index )
+        if index < 0:
+            index += self.num_nodes
+        if index < 0 or index >= self.num_nodes:
+            raise IndexError( "node index out of range" )
+        node = self.created.get( index )
+        if node is None:
+            from .nav_node import NavNode
+            node = NavNode.view( self.registry, self.level, index )
+            self.created[index] = node
+        return node
+
+    def __getstate__( self ):
+        # The views are re-created when they are accessed:
+        return { "registry": self.registry, "level": self.level, "num_nodes": self.num_nodes }
+
+    def __setstate__( self, state ):
+        self.__init__( state["registry"], state["level"], state["num_nodes"] )
+
+class NodeSubset( Sequence ):
+    """ The nodes with the given indices out of a (lazy) list of nodes, for example the nodes of
+    a zone. """
+
+    def __init__( self, nodes, indices ):
+        self.nodes = nodes
+        self.indices = indices
+
+    def __len__( self ):
+        return len( self.indices )
+
+    def __getitem__( self, i ):
+        if isinstance( i, slice ):
+            return [self.nodes[int(index)] for index in self.indices[i]]
+        return self.nodes[int(self.indices[i])]
+
+class NodeRegistry():
+    """ Looks up the NavNodes of one NavMesh by level and index.
+
+    NavNodes only store the indices of their neighbors, and resolve them through the registry
+    they belong to. Every NavMesh has its own registry, so multiple meshes can be held in memory
+    at the same time without their node indices clashing.
+    levels[0] holds the low-level nodes, levels[1] the high-level nodes (zone and entrance
+    nodes), each as a list indexed by node index (None where there is no node with that index).
+
+    Once a level is complete, compact moves the data of its nodes into a NodeArrays object
+    (arrays[level]) and turns the nodes into views into these arrays. This takes far less
+    memory than every node keeping its own numpy arrays, sets and dicts.
+    """
+
+    def __init__( self ):
+        self.levels = [[], []]
+        self.arrays = [None, None]
+
+    @staticmethod
+    def for_nodes( nodes ):
+        """ Create a registry holding the given nodes, and make the nodes use it """
+        registry = NodeRegistry()
+        for n in nodes:
+            registry.add( n )
+        return registry
+
+    def add( self, node ):
+        assert self.arrays[node.level] is None, "Cannot add nodes to a compacted level!"
+        nodes = self.levels[node.level]
+        if node.index >= len( nodes ):
+            nodes.extend( [None]*(node.index + 1 - len( nodes )) )
+        nodes[node.index] = node
+        node.registry = self
+
+    def get( self, level, index ):
+        return self.levels[level][index]
+
+    @staticmethod
+    def from_arrays( arrays ):
+        """ Create a compacted registry from one NodeArrays object per level. The nodes of the
+        first level are created lazily (see LazyNodeList), the nodes of the other (much smaller)
+        levels right away. """
+        registry = NodeRegistry()
+        registry.arrays = list( arrays )
+        for level, level_arrays in enumerate( arrays ):
+            num_nodes = len( level_arrays.zone_ids )
+            if level == 0:
+                registry.levels[level] = LazyNodeList( registry, level, num_nodes )
+            else:
+                from .nav_node import NavNode
+                registry.levels[level] = [NavNode.view( registry, level, i )
+                        for i in range( num_nodes )]
+        return registry
+
+    def nodes( self, level ):
+        """ All nodes of the given level, sorted by index """
+        return [n for n in self.levels[level] if n is not None]
+
+    def compact( self, level=None ):
+        """ Move the data of all nodes of the level (or of all levels) into arrays """
+        levels = range( len( self.levels ) ) if level is None else [level]
+        for level in levels:
+            if self.arrays[level] is not None or len( self.levels[level] ) == 0:
+                continue
+            self.arrays[level] = NodeArrays.from_nodes( self.levels[level] )
+            for n in self.levels[level]:
+                n.to_view()
+
+    def expand( self, level=None ):
+        """ Undo compact: every node holds its own data again and can be modified """
+        levels = range( len( self.levels ) ) if level is None else [level]
+        for level in levels:
+            if self.arrays[level] is None:
+                continue
+            # A LazyNodeList only keeps the views which are in use, and can't create new ones
+            # once the arrays are gone. Hold on to all nodes in a plain list instead:
+            nodes = list( self.levels[level] )
+            for n in nodes:
+                n.to_standalone()
+            self.levels[level] = nodes
+            self.arrays[level] = None
+
+    def __setstate__( self, state ):
+        self.__dict__ = state
+        # Registries saved before node data could be compacted:
+        self.__dict__.setdefault( "arrays", [None]*len( self.levels ) )
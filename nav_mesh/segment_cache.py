@@ -0,0 +1,116 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Rough estimate of the memory used by a cache entry on top of its path (key, dict entry, ...):
+ENTRY_OVERHEAD_BYTES = 200
+
+def segment_key( start_index, entrance_index, min_height, initial_dir=None ):
+    """ Key under which the low-level path segment from a start node to an entrance is stored.
+    The direction in which the path arrives at the start node changes the angle penalties along
+    the segment, so it is part of the key as well. """
+    if initial_dir is None:
+        direction = None
+    else:
+        direction = tuple( np.round( np.asarray( initial_dir, dtype=np.float64 ), 4 ).tolist() )
+    return (int(start_index), int(entrance_index), float(min_height), direction)
+
+class SegmentCache():
+    """ Bounded LRU cache of refined low-level path segments (lists of node indices).
+
+    Each segment belongs to the zone it runs through, so that all segments of a zone can be
+    dropped once nodes in that zone are blocked or otherwise modified (see invalidate_zone).
+    The least recently used segments are evicted once either max_segments or max_bytes (an
+    estimate of the memory used by the cached segments) is exceeded.
+    Can be shared by multiple threads. """
+
+    def __init__( self, max_segments=10000, max_bytes=16*1024*1024 ):
+        self.max_segments = max_segments
+        self.max_bytes = max_bytes
+
+        # key -> (zone_id, path as int32 array), least recently used first:
+        self.segments = OrderedDict()
+        # zone_id -> set of keys of the segments in that zone:
+        self.zone_keys = {}
+        self.num_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self.lock = threading.Lock()
+
+    def get( self, key ):
+        """ Return the cached path (list of node indices), or None if it is not in the cache """
+        with self.lock:
+            entry = self.segments.get( key )
+            if entry is None:
+                self.misses += 1
+                return None
+            self.segments.move_to_end( key )
+            self.hits += 1
+            return entry[1].tolist()
+
+    def put( self, key, zone_id, path ):
+        path = np.asarray( path, dtype=np.int32 )
+        size = path.nbytes + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes or self.max_segments < 1:
+            return
+        with self.lock:
+            if key in self.segments:
+                self._remove( key )
+            self.segments[key] = (zone_id, path)
+            self.zone_keys.setdefault( zone_id, set() ).add( key )
+            self.num_bytes += size
+            while len( self.segments ) > self.max_segments or self.num_bytes > self.max_bytes:
+                self._remove( next( iter( self.segments ) ) )
+                self.evictions += 1
+
+    def _remove( self, key ):
+        zone_id, path = self.segments.pop( key )
+        self.zone_keys[zone_id].discard( key )
+        self.num_bytes -= path.nbytes + ENTRY_OVERHEAD_BYTES
+
+    def invalidate_zone( self, zone_id ):
+        """ Drop all segments which run through the given zone """
+        with self.lock:
+            keys = self.zone_keys.pop( zone_id, set() )
+            for key in keys:
+                zone_id, path = self.segments.pop( key )
+                self.num_bytes -= path.nbytes + ENTRY_OVERHEAD_BYTES
+            self.invalidations += len( keys )
+
+    def clear( self ):
+        with self.lock:
+            self.segments.clear()
+            self.zone_keys.clear()
+            self.num_bytes = 0
+
+    def stats( self ):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                    "segments": len( self.segments ),
+                    "bytes": self.num_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits/lookups if lookups > 0 else 0,
+                    "evictions": self.evictions,
+                    "invalidations": self.invalidations,
+                    }
+
+    def __len__( self ):
+        return len( self.segments )
+
+    def __getstate__( self ):
+        # Only the settings are saved, the cache starts out empty after loading:
+        return { "max_segments": self.max_segments, "max_bytes": self.max_bytes }
+
+    def __setstate__( self, state ):
+        self.__init__( state["max_segments"], state["max_bytes"] )
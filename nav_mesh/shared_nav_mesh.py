@@ -0,0 +1,112 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+# Publish a NavMesh into shared memory once, so that worker processes can attach to it instead
+# of each unpickling their own copy. The shared memory holds the same layout as a NavMesh file
+# (see nav_mesh_file), and attached meshes use the arrays in it without copying them.
+#
+# Usage:
+#   with SharedNavMesh.publish( nav_mesh ) as shared:
+#       with ProcessPoolExecutor( initializer=init_worker, initargs=(shared.name,) ) as pool:
+#           ...     # In the workers, worker_nav_mesh() returns the attached NavMesh.
+# or, to keep the shared mesh and the processes around for many batches (see
+# NavMesh.find_paths_batch):
+#   shared = SharedNavMesh.publish( nav_mesh )
+#   pool = worker_pool( shared )
+#   results = nav_mesh.find_paths_batch( requests, executor="process", pool=pool )
+
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from . import nav_mesh_file
+
+class SharedNavMesh():
+    """ Handle to a NavMesh which lives in shared memory.
+
+    The process which publishes the mesh owns the shared memory block and removes it in close.
+    Other processes attach (read-only) by name. Pickling a handle only sends the name, and
+    unpickling it attaches, so handles can be passed to worker processes directly. """
+
+    def __init__( self, block, owner ):
+        self.block = block
+        self.owner = owner
+        data = np.ndarray( block.size, dtype=np.uint8, buffer=block.buf )
+        arrays = nav_mesh_file.arrays_from_buffer( data, block.name )
+        # Any change would be seen by all processes, so nobody may write:
+        for array in arrays.values():
+            array.flags.writeable = False
+        self.nav_mesh = nav_mesh_file.nav_mesh_from_arrays( arrays )
+
+    @staticmethod
+    def publish( nav_mesh, name=None ):
+        """ Copy the mesh's arrays (including the currently blocked nodes) into a new shared
+        memory block. The mesh itself is not changed. """
+        arrays = nav_mesh_file.nav_mesh_to_arrays( nav_mesh, include_blocked=True )
+        header, data_start, size = nav_mesh_file.layout( arrays )
+        block = shared_memory.SharedMemory( name=name, create=True, size=size )
+        data = np.ndarray( size, dtype=np.uint8, buffer=block.buf )
+        nav_mesh_file.write_arrays( data, arrays, header, data_start )
+        del data
+        return SharedNavMesh( block, owner=True )
+
+    @staticmethod
+    def attach( name ):
+        try:
+            # Only the owner may remove the block, so don't let this process's resource tracker
+            # clean it up (only possible from python 3.13 on):
+            block = shared_memory.SharedMemory( name=name, track=False )
+        except TypeError:
+            block = shared_memory.SharedMemory( name=name )
+        return SharedNavMesh( block, owner=False )
+
+    @property
+    def name( self ):
+        return self.block.name
+
+    @property
+    def nbytes( self ):
+        return self.block.size
+
+    def close( self ):
+        """ Detach from the shared memory. The owner also removes the block, after which no new
+        process can attach anymore. The mesh must not be used after this. """
+        if self.block is None:
+            return
+        self.nav_mesh = None
+        block = self.block
+        self.block = None
+        try:
+            block.close()
+        except BufferError:
+            pass    # Arrays of the mesh are still referenced, the mapping stays until they're gone
+        if self.owner:
+            block.unlink()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *args ):
+        self.close()
+
+    def __reduce__( self ):
+        return ( SharedNavMesh.attach, (self.name,) )
+
+# Handle to the shared NavMesh used by a worker process (see init_worker):
+worker_shared_nav_mesh = None
+
+def init_worker( name ):
+    """ Initializer for worker pools: attach to the shared NavMesh with the given name """
+    global worker_shared_nav_mesh
+    worker_shared_nav_mesh = SharedNavMesh.attach( name )
+
+def worker_nav_mesh():
+    return worker_shared_nav_mesh.nav_mesh
+
+def worker_pool( shared, workers=None ):
+    """ Process pool whose workers attach to the shared NavMesh (None for the number of CPUs).
+    Shut it down before closing the shared mesh. """
+    return ProcessPoolExecutor( max_workers=workers, initializer=init_worker,
+            initargs=(shared.name,) )
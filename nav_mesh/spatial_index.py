@@ -0,0 +1,177 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.spatial import KDTree
+
+class HeightClasses():
+    """ KD-trees over the low-level nodes which are high enough for an agent, one per min_height
+    (a "height class"). Agents usually come in a handful of sizes, so there are few classes,
+    and queries for a class don't have to skip over nodes which are too low.
+    Trees are built on first use, only the max_classes most recently used ones are kept. """
+
+    def __init__( self, max_classes=8 ):
+        self.max_classes = max_classes
+        # min_height -> (KDTree, indices of the nodes in the tree), least recently used first:
+        self.classes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get( self, graph, min_height ):
+        """ Return the tree for the min_height and the node indices of its points. Returns None
+        if all nodes are high enough (use the mesh's tree over all nodes then). """
+        min_height = float( min_height )
+        with self.lock:
+            entry = self.classes.get( min_height )
+            if entry is not None:
+                self.classes.move_to_end( min_height )
+                return entry
+
+        node_indices = np.flatnonzero( graph.max_heights >= min_height )
+        if len( node_indices ) == graph.num_nodes:
+            entry = None
+        else:
+            entry = ( KDTree( np.asarray( graph.positions[node_indices], dtype=np.float64 ) ),
+                    node_indices )
+
+        with self.lock:
+            self.classes[min_height] = entry
+            while len( self.classes ) > self.max_classes:
+                self.classes.popitem( last=False )
+        return entry
+
+    def __getstate__( self ):
+        # The trees are built again when needed:
+        return { "max_classes": self.max_classes }
+
+    def __setstate__( self, state ):
+        self.__init__( state["max_classes"] )
+
+def query_tree( tree, node_indices, points, k ):
+    """ Query the k nearest points of the tree. node_indices maps the tree's points to node
+    indices (None if point i is node i). Returns distances and node indices of shape (N,k),
+    inf and -1 where the tree has fewer than k points. """
+    k_query = min( k, tree.n )
+    distances = np.full( (len( points ), k), np.inf )
+    indices = np.full( (len( points ), k), -1, dtype=np.int64 )
+    if k_query == 0 or len( points ) == 0:
+        return distances, indices
+    dist, local = tree.query( points, k=k_query )
+    dist = dist.reshape( len( points ), k_query )
+    local = local.reshape( len( points ), k_query )
+    distances[:,:k_query] = dist
+    indices[:,:k_query] = local if node_indices is None else node_indices[local]
+    return distances, indices
+
+def query_nodes( positions, candidates, points, k ):
+    """ Brute force version of query_tree, for small sets of candidate nodes (like the nodes of
+    a zone) """
+    distances = np.full( (len( points ), k), np.inf )
+    indices = np.full( (len( points ), k), -1, dtype=np.int64 )
+    k_found = min( k, len( candidates ) )
+    if k_found == 0 or len( points ) == 0:
+        return distances, indices
+    candidate_positions = np.asarray( positions[candidates], dtype=np.float64 )
+    dist = np.linalg.norm( points[:,np.newaxis,:] - candidate_positions[np.newaxis,:,:], axis=2 )
+    if k_found < len( candidates ):
+        closest = np.argpartition( dist, k_found - 1, axis=1 )[:,:k_found]
+    else:
+        closest = np.broadcast_to( np.arange( k_found ), (len( points ), k_found) )
+    closest_dist = np.take_along_axis( dist, closest, axis=1 )
+    order = np.argsort( closest_dist, axis=1, kind="stable" )
+    distances[:,:k_found] = np.take_along_axis( closest_dist, order, axis=1 )
+    indices[:,:k_found] = candidates[np.take_along_axis( closest, order, axis=1 )]
+    return distances, indices
+
+class ZoneGrid():
+    """ Uniform grid which tells which zone a point lies in.
+
+    Every grid cell which holds low-level nodes or is next to a cell holding nodes (so that
+    points slightly above or below the surface are found as well) is stored. It is assigned to
+    a zone if all nodes in it and in its neighboring cells belong to that zone, and marked as
+    MIXED otherwise (at the border between zones). Only these cells are kept (sorted by their
+    key), so the memory used grows with the size of the surface, not of the world.
+
+    The closest node to a point in an assigned cell is not always one of the nodes in the cell's
+    neighborhood: the point may be far away from all of them. So every cell also keeps one of
+    its nodes (the one closest to the cell's center), and the cell is only trusted for points
+    which are closer to that node than to the border of the neighborhood. The closest node is
+    then inside the neighborhood, and its zone is the cell's zone (see lookup). """
+
+    MIXED = -2
+    NONE = -1
+
+    # Bits per axis in a cell key:
+    KEY_BITS = 21
+
+    def __init__( self, origin, cell_size, keys, zone_ids, nodes ):
+        self.origin = origin
+        self.cell_size = cell_size
+        self.keys = keys
+        self.zone_ids = zone_ids
+        # Index of the node of each cell which is closest to the cell's center:
+        self.nodes = nodes
+
+    @staticmethod
+    def from_graph( graph, cell_size=None ):
+        """ Build the grid over the nodes of the (low-level) graph. By default, cells are twice
+        as large as the median distance between neighboring nodes. """
+        positions = np.asarray( graph.positions, dtype=np.float64 )
+        if cell_size is None:
+            cell_size = 2*float( np.median( graph.lengths ) ) if len( graph.lengths ) > 0 else 1
+        # Leave room for the neighbors of the outermost cells:
+        origin = positions.min( axis=0 ) - 2*cell_size
+        cells = np.floor( (positions - origin)/cell_size ).astype( np.int64 )
+        assert (cells < 2**ZoneGrid.KEY_BITS - 1).all(), \
+                "Too many grid cells, use a larger cell_size!"
+
+        # Every node "spreads" its zone to its cell and the neighboring cells. A cell is owned
+        # by a zone if only that zone reaches it:
+        offsets = np.stack( np.meshgrid( [-1, 0, 1], [-1, 0, 1], [-1, 0, 1],
+                indexing="ij" ), axis=-1 ).reshape( -1, 3 )
+        spread_cells = (cells[:,np.newaxis,:] + offsets).reshape( -1, 3 )
+        keys = ZoneGrid.cell_keys( spread_cells )
+        zone_ids = np.repeat( np.asarray( graph.zone_ids, dtype=np.int64 ), len( offsets ) )
+        nodes = np.repeat( np.arange( len( positions ) ), len( offsets ) )
+        centers = origin + (spread_cells + 0.5)*cell_size
+        dist2 = ((np.repeat( positions, len( offsets ), axis=0 ) - centers)**2).sum( axis=1 )
+        # Sorted by distance to the center within each cell, so the first node is the closest:
+        order = np.lexsort( (dist2, keys) )
+        keys, zone_ids, nodes = keys[order], zone_ids[order], nodes[order]
+        first = np.flatnonzero( np.concatenate( ([True], keys[1:] != keys[:-1]) ) )
+        min_zones = np.minimum.reduceat( zone_ids, first )
+        max_zones = np.maximum.reduceat( zone_ids, first )
+        cell_zones = np.where( min_zones == max_zones, min_zones, ZoneGrid.MIXED )
+        return ZoneGrid( origin, cell_size, keys[first], cell_zones.astype( np.int32 ),
+                nodes[first].astype( np.int32 ) )
+
+    @staticmethod
+    def cell_keys( cells ):
+        bits = ZoneGrid.KEY_BITS
+        return (cells[:,0] << (2*bits)) | (cells[:,1] << bits) | cells[:,2]
+
+    @property
+    def nbytes( self ):
+        return self.keys.nbytes + self.zone_ids.nbytes + self.nodes.nbytes
+
+    def lookup( self, points, positions ):
+        """ Return the zone id of the cell of each point, MIXED for cells at zone borders and
+        NONE for cells without nodes or if the point may be closer to a node outside of the
+        cell's neighborhood (see the class description). positions are the positions of the
+        low-level nodes. """
+        points = np.asarray( points, dtype=np.float64 ).reshape( -1, 3 )
+        cells = np.floor( (points - self.origin)/self.cell_size )
+        inside = ((cells >= 0) & (cells < 2**ZoneGrid.KEY_BITS - 1)).all( axis=1 )
+        keys = ZoneGrid.cell_keys( np.where( inside[:,np.newaxis], cells, 0 ).astype( np.int64 ) )
+        found = np.minimum( np.searchsorted( self.keys, keys ), len( self.keys ) - 1 )
+        hit = inside & (self.keys[found] == keys)
+
+        # Distance to the border of the neighborhood (the 3x3x3 cells around the point's cell):
+        low = self.origin + (cells - 1)*self.cell_size
+        margin = np.minimum( points - low, low + 3*self.cell_size - points ).min( axis=1 )
+        node_dist2 = ((points - positions[self.nodes[found]])**2).sum( axis=1 )
+        hit &= node_dist2 < margin**2
+        return np.where( hit, self.zone_ids[found], ZoneGrid.NONE )
@@ -0,0 +1,134 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import threading
+import numpy as np
+from scipy.spatial import KDTree
+
+from . import clearance
+
+# Number of points which are projected at once (limits the memory used for the candidates):
+PROJECT_CHUNK_SIZE = 4096
+
+def closest_points_on_triangles( points, a, b, c ):
+    """ Closest point on each triangle (a[i], b[i], c[i]) to points[i], as barycentric coordinates
+    (u, v, w) with closest point = u*a + v*b + w*c, shape (N,3). Vectorized version of the
+    region-based method from Ericson, "Real-Time Collision Detection", 5.1.5. """
+    def dot( x, y ):
+        return np.einsum( "ij,ij->i", x, y )
+
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+    d1, d2 = dot( ab, ap ), dot( ac, ap )
+    d3, d4 = dot( ab, bp ), dot( ac, bp )
+    d5, d6 = dot( ab, cp ), dot( ac, cp )
+    va = d3*d6 - d5*d4
+    vb = d5*d2 - d1*d6
+    vc = d1*d4 - d3*d2
+
+    with np.errstate( divide="ignore", invalid="ignore" ):
+        # Inside the triangle (the default):
+        denom = va + vb + vc
+        v = vb/denom
+        w = vc/denom
+        bary = np.stack( (1 - v - w, v, w), axis=1 )
+
+        # The regions are checked in this order, the first one which matches wins. So they are
+        # applied in reverse order here:
+        t = (d4 - d3)/((d4 - d3) + (d5 - d6))
+        edge_bc = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        bary[edge_bc] = np.stack( (np.zeros_like( t ), 1 - t, t), axis=1 )[edge_bc]
+        t = d2/(d2 - d6)
+        edge_ac = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        bary[edge_ac] = np.stack( (1 - t, np.zeros_like( t ), t), axis=1 )[edge_ac]
+        bary[(d6 >= 0) & (d5 <= d6)] = (0, 0, 1)
+        t = d1/(d1 - d3)
+        edge_ab = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        bary[edge_ab] = np.stack( (1 - t, t, np.zeros_like( t )), axis=1 )[edge_ab]
+        bary[(d3 >= 0) & (d4 <= d3)] = (0, 1, 0)
+        bary[(d1 <= 0) & (d2 <= 0)] = (1, 0, 0)
+
+    # Degenerate triangles, use their first corner:
+    bary[~np.isfinite( bary ).all( axis=1 )] = (1, 0, 0)
+    return bary
+
+class TriangleMesh():
+    """ The triangles of the nav surface, given as indices of low-level nodes (the corners), with
+    a spatial index to find the triangle closest to a point.
+
+    The index is a KD-tree over the triangle centroids plus a bounding volume hierarchy over the
+    triangles (see clearance.TriangleBVH). The closest triangle to a point can't be farther away
+    than the closest centroid, so only the triangles in the BVH leaves whose boxes lie within
+    that distance have to be checked exactly. Unlike a single radius for all triangles, the
+    boxes stay tight where the triangles are small, even if some other triangles are large. """
+
+    def __init__( self, triangles ):
+        self.triangles = np.asarray( triangles, dtype=np.int32 ).reshape( -1, 3 )
+        self.centroid_tree = None
+        self.bvh = None
+        self.lock = threading.Lock()
+
+    @property
+    def num_triangles( self ):
+        return len( self.triangles )
+
+    def init_index( self, positions ):
+        corners = np.asarray( positions, dtype=np.float64 )[self.triangles]
+        self.bvh = clearance.TriangleBVH( corners )
+        self.centroid_tree = KDTree( corners.mean( axis=1 ) )
+
+    def project( self, positions, points ):
+        """ Find the closest point on the surface for each point.
+        - positions: positions of the low-level nodes
+        - points: array of shape (N,3)
+        Returns the projected points (N,3), the indices of the triangles they lie on (N,), their
+        barycentric coordinates within these triangles (N,3) and the distances to the original
+        points (N,). """
+        assert self.num_triangles > 0, "The mesh has no triangles!"
+        if self.centroid_tree is None:
+            with self.lock:
+                if self.centroid_tree is None:
+                    self.init_index( positions )
+
+        points = np.asarray( points, dtype=np.float64 ).reshape( -1, 3 )
+        projected = np.empty( (len( points ), 3) )
+        triangle_indices = np.empty( len( points ), dtype=np.int64 )
+        barycentric = np.empty( (len( points ), 3) )
+        distances = np.empty( len( points ) )
+        for begin in range( 0, len( points ), PROJECT_CHUNK_SIZE ):
+            end = begin + PROJECT_CHUNK_SIZE
+            projected[begin:end], triangle_indices[begin:end], barycentric[begin:end], \
+                    distances[begin:end] = self.project_chunk( positions, points[begin:end] )
+        return projected, triangle_indices, barycentric, distances
+
+    def project_chunk( self, positions, points ):
+        # Gather all candidate triangles of all points into flat arrays:
+        closest_centroid_dist, _ = self.centroid_tree.query( points )
+        point_indices, triangle_indices = self.bvh.triangles_near( points,
+                closest_centroid_dist + 1e-6 )
+        counts = np.bincount( point_indices, minlength=len( points ) )
+
+        corners = np.asarray( positions[self.triangles[triangle_indices].reshape( -1 )],
+                dtype=np.float64 ).reshape( -1, 3, 3 )
+        candidate_points = points[point_indices]
+        bary = closest_points_on_triangles( candidate_points,
+                corners[:,0], corners[:,1], corners[:,2] )
+        closest = np.einsum( "ij,ijk->ik", bary, corners )
+        dist = np.linalg.norm( closest - candidate_points, axis=1 )
+
+        # Keep the closest candidate of each point:
+        order = np.lexsort( (dist, point_indices) )
+        first = order[np.concatenate( ([0], np.cumsum( counts )[:-1]) )]
+        return closest[first], triangle_indices[first], bary[first], dist[first]
+
+    def __getstate__( self ):
+        # The index is built again when needed:
+        return { "triangles": self.triangles }
+
+    def __setstate__( self, state ):
+        self.__init__( state["triangles"] )
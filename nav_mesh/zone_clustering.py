@@ -0,0 +1,212 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+# Split the nav surface into zones, working on the vertex positions, normals, heights and the
+# adjacency of the vertices as CSR arrays (offsets, neighbors), without needing blender.
+# Replaces the flood fill of size_clustering.split_zones_by_height:
+#   - Vertices are only connected to neighbors with the same height level, and the connected
+#     components of the remaining graph are found (see constrained_components). No zone crosses
+#     the border of a component, so components can be split into zones independently, in
+#     parallel worker processes.
+#   - Each component is split by seeded region growing (see grow_zones): seeds are spread out
+#     on a grid, and all zones are grown from their seeds at the same time, one ring of
+#     neighbors after another. As before, a vertex only joins a zone if it is closer than
+#     max_radius to the zone's seed and its normal is less than 0.3*pi away from the seed's
+#     normal. Vertices which can't join any zone are seeds for the next round.
+#
+# Usage:
+#   zone_ids, zone_heights = cluster_zones( positions, normals, heights, offsets, neighbors )
+#   print( zone_size_statistics( zone_ids, len( zone_heights ) ) )
+
+import os
+import math
+import numpy as np
+import scipy.sparse
+from scipy.sparse.csgraph import connected_components
+from concurrent.futures import ProcessPoolExecutor
+
+# Maximum angle between the normals of a zone's seed and the zone's vertices:
+MAX_NORMAL_ANGLE = math.pi*0.3
+
+# Seeds are spread out on a grid with this cell size (relative to max_radius). On a flat surface
+# every vertex is then closer than max_radius to the center of its cell, so most zones can grow
+# up to their neighbors without running into the radius limit:
+SEED_CELL_SIZE = math.sqrt( 2 )
+
+def level_for_heights( heights, split_at ):
+    """ Index of the first split_at value above each height (the last one if there is none) """
+    return np.minimum( np.searchsorted( split_at, heights, side="right" ), len( split_at ) - 1 )
+
+def csr_edges( offsets, nodes ):
+    """ The source node and the index into the neighbors array of all edges of the given nodes """
+    starts = offsets[nodes]
+    counts = offsets[nodes + 1] - starts
+    first = np.cumsum( counts ) - counts
+    edges = np.arange( counts.sum(), dtype=np.int64 ) + np.repeat( starts - first, counts )
+    return np.repeat( nodes, counts ), edges
+
+def constrained_graph( levels, offsets, neighbors ):
+    """ Remove all edges between vertices with different height levels. Returns the offsets and
+    neighbors of the remaining graph. """
+    sources = np.repeat( np.arange( len( levels ) ), np.diff( offsets ) )
+    keep = levels[sources] == levels[neighbors]
+    counts = np.bincount( sources[keep], minlength=len( levels ) )
+    constrained_offsets = np.zeros( len( levels ) + 1, dtype=np.int64 )
+    constrained_offsets[1:] = np.cumsum( counts )
+    return constrained_offsets, neighbors[keep]
+
+def constrained_components( levels, offsets, neighbors ):
+    """ Label the connected components of the graph in which only vertices with the same height
+    level are connected. Returns the number of components, the label of every vertex and the
+    offsets and neighbors of the graph without the edges between levels. """
+    offsets, neighbors = constrained_graph( levels, offsets, neighbors )
+    matrix = scipy.sparse.csr_matrix(
+            (np.ones( len( neighbors ), dtype=np.int8 ), neighbors, offsets),
+            shape=(len( levels ), len( levels )) )
+    num_components, labels = connected_components( matrix, directed=False )
+    return num_components, labels, offsets, neighbors
+
+def select_seeds( positions, components, cell_size ):
+    """ Pick one seed per grid cell and component: the vertex closest to the cell's center.
+    Returns the indices of the seeds. """
+    cells = np.floor( positions/cell_size )
+    dist2 = (((cells + 0.5)*cell_size - positions)**2).sum( axis=1 )
+    order = np.lexsort( (dist2, cells[:,2], cells[:,1], cells[:,0], components) )
+    keys = np.column_stack( (components, cells) )[order]
+    first = np.ones( len( order ), dtype=bool )
+    first[1:] = (keys[1:] != keys[:-1]).any( axis=1 )
+    return np.sort( order[first] )
+
+def grow_zones( positions, normals, components, offsets, neighbors, max_radius ):
+    """ Split the vertices into zones by seeded region growing (see the comment at the top).
+    The graph must not have edges between vertices of different components.
+    Returns the zone id of every vertex and the number of zones. """
+
+    num_vertices = len( positions )
+    max_radius2 = max_radius**2
+    cos_thresh = math.cos( MAX_NORMAL_ANGLE )
+
+    zone_ids = np.full( num_vertices, -1, dtype=np.int64 )
+    seed_of = np.full( num_vertices, -1, dtype=np.int64 )
+    num_zones = 0
+    while True:
+        open_vertices = np.flatnonzero( zone_ids < 0 )
+        if len( open_vertices ) == 0:
+            break
+        seeds = open_vertices[select_seeds( positions[open_vertices],
+                components[open_vertices], max_radius*SEED_CELL_SIZE )]
+        zone_ids[seeds] = np.arange( num_zones, num_zones + len( seeds ) )
+        seed_of[seeds] = seeds
+        num_zones += len( seeds )
+
+        front = seeds
+        while len( front ) > 0:
+            sources, edges = csr_edges( offsets, front )
+            targets = neighbors[edges]
+            candidates = zone_ids[targets] < 0
+            sources = sources[candidates]
+            targets = targets[candidates]
+            seeds = seed_of[sources]
+
+            dist2 = ((positions[targets] - positions[seeds])**2).sum( axis=1 )
+            similar = (normals[targets]*normals[seeds]).sum( axis=1 ) > cos_thresh
+            valid = (dist2 < max_radius2) & similar
+            targets = targets[valid]
+            seeds = seeds[valid]
+            dist2 = dist2[valid]
+
+            # Vertices reached by several zones at once join the one with the closest seed:
+            order = np.lexsort( (dist2, targets) )
+            targets = targets[order]
+            seeds = seeds[order]
+            first = np.ones( len( targets ), dtype=bool )
+            first[1:] = targets[1:] != targets[:-1]
+            front = targets[first]
+            seed_of[front] = seeds[first]
+            zone_ids[front] = zone_ids[seeds[first]]
+
+    return zone_ids, num_zones
+
+def grow_zones_task( task ):
+    """ Run grow_zones on the vertices of some components, see cluster_zones """
+    return grow_zones( *task )
+
+def cluster_zones( positions, normals, heights, offsets, neighbors, split_at=(1,3,5,7),
+        max_radius=10, workers=1 ):
+    """ Assign every vertex to a zone (see the comment at the top). The components of the graph
+    are split into zones by the given number of worker processes (None for the number of CPUs).
+    Zones are numbered in the order of their lowest vertex index, so the result doesn't depend on
+    the number of workers.
+    Returns the zone id of every vertex and the height of every zone. """
+
+    positions = np.asarray( positions, dtype=np.float64 ).reshape( -1, 3 )
+    normals = np.asarray( normals, dtype=np.float64 ).reshape( -1, 3 )
+    offsets = np.asarray( offsets, dtype=np.int64 )
+    neighbors = np.asarray( neighbors, dtype=np.int64 )
+    num_vertices = len( positions )
+    levels = level_for_heights( np.asarray( heights, dtype=np.float64 ), split_at )
+
+    num_components, components, offsets, neighbors = constrained_components( levels, offsets,
+            neighbors )
+
+    if workers is None:
+        workers = os.cpu_count()
+    if workers <= 1 or num_components <= 1:
+        zone_ids, num_zones = grow_zones( positions, normals, components, offsets, neighbors,
+                max_radius )
+    else:
+        # Split the components into a few batches per worker, with about the same number of
+        # vertices each. A batch holds whole components, so all neighbors of its vertices are in
+        # the batch as well:
+        order = np.argsort( components, kind="stable" )
+        sizes = np.bincount( components, minlength=num_components )
+        ends = np.cumsum( sizes )
+        splits = np.searchsorted( ends, np.linspace( 0, num_vertices, 4*workers + 1 )[1:-1] )
+        bounds = np.unique( np.concatenate( ([0], ends[splits], [num_vertices]) ) )
+        local_index = np.empty( num_vertices, dtype=np.int64 )
+        tasks = []
+        batches = []
+        for start, end in zip( bounds[:-1], bounds[1:] ):
+            vertices = np.sort( order[start:end] )
+            local_index[vertices] = np.arange( len( vertices ) )
+            sources, edges = csr_edges( offsets, vertices )
+            local_offsets = np.zeros( len( vertices ) + 1, dtype=np.int64 )
+            local_offsets[1:] = np.cumsum( offsets[vertices + 1] - offsets[vertices] )
+            tasks.append( (positions[vertices], normals[vertices], components[vertices],
+                local_offsets, local_index[neighbors[edges]], max_radius) )
+            batches.append( vertices )
+
+        zone_ids = np.empty( num_vertices, dtype=np.int64 )
+        num_zones = 0
+        with ProcessPoolExecutor( max_workers=workers ) as pool:
+            for vertices, (batch_zone_ids, batch_num_zones) in zip( batches,
+                    pool.map( grow_zones_task, tasks ) ):
+                zone_ids[vertices] = batch_zone_ids + num_zones
+                num_zones += batch_num_zones
+
+    # Number the zones in the order of their lowest vertex index:
+    first_vertex = np.full( num_zones, num_vertices, dtype=np.int64 )
+    np.minimum.at( first_vertex, zone_ids, np.arange( num_vertices ) )
+    order = np.argsort( first_vertex )
+    new_ids = np.empty( num_zones, dtype=np.int64 )
+    new_ids[order] = np.arange( num_zones )
+    zone_ids = new_ids[zone_ids].astype( np.int32 )
+    zone_heights = [split_at[level] for level in levels[first_vertex[order]]]
+    return zone_ids, zone_heights
+
+def zone_size_statistics( zone_ids, num_zones ):
+    """ Number of zones and the distribution of their sizes (number of vertices) """
+    sizes = np.bincount( zone_ids, minlength=num_zones )
+    if num_zones == 0:
+        return { "zones": 0 }
+    return {
+            "zones": int( num_zones ),
+            "min": int( sizes.min() ),
+            "median": float( np.median( sizes ) ),
+            "mean": float( sizes.mean() ),
+            "p90": float( np.percentile( sizes, 90 ) ),
+            "max": int( sizes.max() ),
+            "single_vertex_zones": int( (sizes == 1).sum() ),
+            }
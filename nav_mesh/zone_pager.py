@@ -0,0 +1,153 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from . import nav_graph
+from . import landmarks
+
+class ZonePage():
+    """ The low-level graph of a single zone, with its own (local) node indices.
+
+    Local node i is the global node node_indices[i]. Since low-level searches never leave a
+    zone, they can run on the page instead of on the graph of the whole mesh. """
+
+    def __init__( self, zone_id, node_indices, graph ):
+        self.zone_id = zone_id
+        self.node_indices = node_indices
+        self.graph = graph
+
+    @staticmethod
+    def load( graph, zone_id ):
+        """ Copy the nodes and edges of the zone out of the (global) graph. If the graph's arrays
+        are memory-mapped, only the parts of the file holding the zone's data are read. """
+
+        node_indices = np.asarray( graph.zone_node_indices( zone_id ), dtype=np.int64 )
+        num_nodes = len( node_indices )
+
+        # Gather the CSR rows of the zone's nodes:
+        begins = graph.offsets[node_indices]
+        counts = graph.offsets[node_indices + 1] - begins
+        offsets = np.zeros( num_nodes + 1, dtype=np.int64 )
+        offsets[1:] = np.cumsum( counts )
+        edges = np.repeat( begins - offsets[:-1], counts ) + np.arange( offsets[-1] )
+        neighbors = np.searchsorted( node_indices, graph.neighbors[edges] )
+        lengths = np.array( graph.lengths[edges] )
+
+        page_graph = nav_graph.NavGraph( np.array( graph.positions[node_indices] ),
+                np.array( graph.zone_ids[node_indices] ),
+                np.array( graph.max_heights[node_indices] ),
+                offsets, neighbors.astype( np.int32 ), lengths,
+                np.zeros( num_nodes + 1, dtype=np.int64 ), np.zeros( 0, dtype=np.int32 ) )
+        if graph.blocked is not None:
+            page_graph.blocked = graph.blocked[node_indices]
+        if graph.landmarks is not None:
+            # The heuristic only needs the distances of the zone's nodes:
+            page_graph.landmarks = landmarks.Landmarks( graph.landmarks.landmarks,
+                    np.array( graph.landmarks.distances[node_indices] ) )
+        return ZonePage( zone_id, node_indices, page_graph )
+
+    @property
+    def nbytes( self ):
+        graph = self.graph
+        size = self.node_indices.nbytes + graph.positions.nbytes + graph.zone_ids.nbytes + \
+                graph.max_heights.nbytes + graph.offsets.nbytes + graph.neighbors.nbytes + \
+                graph.lengths.nbytes + graph.next_level_offsets.nbytes
+        if graph.blocked is not None:
+            size += graph.blocked.nbytes
+        if graph.landmarks is not None:
+            size += graph.landmarks.distances.nbytes
+        return size
+
+    def to_local( self, indices ):
+        """ Turn global node indices (of nodes in this zone) into local ones """
+        local = np.searchsorted( self.node_indices, indices )
+        return local.tolist()
+
+    def to_global( self, indices ):
+        return self.node_indices[np.asarray( indices, dtype=np.int64 )].tolist()
+
+class ZonePager():
+    """ Loads the low-level graphs of zones (see ZonePage) when they are first searched and
+    keeps the recently used ones in memory.
+
+    The least recently used pages are evicted once the pages take more than max_bytes (the
+    page which was loaded last is always kept). Pages of zones whose nodes change must be
+    dropped (see invalidate_zone). Can be shared by multiple threads. """
+
+    def __init__( self, max_bytes=64*1024*1024 ):
+        self.max_bytes = max_bytes
+
+        # zone_id -> ZonePage, least recently used first:
+        self.pages = OrderedDict()
+        self.num_bytes = 0
+
+        self.hits = 0
+        self.page_ins = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self.lock = threading.Lock()
+
+    def get( self, graph, zone_id ):
+        """ Return the page of the zone, loading it from the graph if it is not in memory """
+        with self.lock:
+            page = self.pages.get( zone_id )
+            if page is not None:
+                self.pages.move_to_end( zone_id )
+                self.hits += 1
+                return page
+
+        # Load outside of the lock, so that other threads can keep using resident pages:
+        page = ZonePage.load( graph, zone_id )
+
+        with self.lock:
+            if zone_id in self.pages:
+                # Another thread loaded it in the meantime:
+                return self.pages[zone_id]
+            self.pages[zone_id] = page
+            self.num_bytes += page.nbytes
+            self.page_ins += 1
+            while self.num_bytes > self.max_bytes and len( self.pages ) > 1:
+                zone_id, evicted = self.pages.popitem( last=False )
+                self.num_bytes -= evicted.nbytes
+                self.evictions += 1
+        return page
+
+    def invalidate_zone( self, zone_id ):
+        """ Drop the page of the zone, it is loaded again (with the current data) when needed """
+        with self.lock:
+            page = self.pages.pop( zone_id, None )
+            if page is not None:
+                self.num_bytes -= page.nbytes
+                self.invalidations += 1
+
+    def clear( self ):
+        with self.lock:
+            self.pages.clear()
+            self.num_bytes = 0
+
+    def stats( self ):
+        with self.lock:
+            return {
+                    "pages": len( self.pages ),
+                    "bytes": self.num_bytes,
+                    "hits": self.hits,
+                    "page_ins": self.page_ins,
+                    "evictions": self.evictions,
+                    "invalidations": self.invalidations,
+                    }
+
+    def __len__( self ):
+        return len( self.pages )
+
+    def __getstate__( self ):
+        # Only the settings are saved, no pages are resident after loading:
+        return { "max_bytes": self.max_bytes }
+
+    def __setstate__( self, state ):
+        self.__init__( state["max_bytes"] )
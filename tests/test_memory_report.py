@@ -0,0 +1,51 @@
+############################################################
+# Copyright (C) 2022 Germanunkol
+# License: MIT
+############################################################
+
+import os
+import sys
+import subprocess
+import numpy as np
+
+from nav_mesh import nav_mesh_builder
+from nav_mesh import memory_report
+from nav_mesh.nav_mesh import NavMesh
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+def grid_mesh( size=20 ):
+    """ Vertices and (quad) faces of a flat, square grid """
+    x, y = np.meshgrid( np.arange( size, dtype=np.float64 ), np.arange( size, dtype=np.float64 ) )
+    vertices = np.column_stack( (x.ravel(), y.ravel(), np.zeros( size*size )) )
+    corner = (np.arange( size - 1 )[None,:] + size*np.arange( size - 1 )[:,None]).ravel()
+    faces = np.column_stack( (corner, corner + 1, corner + size + 1, corner + size) )
+    return vertices, faces
+
+def build_binary_mesh( filename ):
+    vertices, faces = grid_mesh()
+    nav_mesh = nav_mesh_builder.build_nav_mesh( vertices, faces,
+            heights=np.full( len( vertices ), 4.0 ), max_radius=5, workers=1 )
+    nav_mesh.save_to_binary_file( filename )
+
+def test_memory_report_of_loaded_mesh( tmp_path ):
+    filename = str( tmp_path/"grid.navmesh" )
+    build_binary_mesh( filename )
+    nav_mesh = NavMesh.load_from_file( filename )
+    # Some views are in use while the report is made, others are not:
+    nodes = nav_mesh.nodes[:10]
+
+    report = memory_report.memory_report( nav_mesh )
+    assert report["num_nodes"][0] == 400
+    assert all( size > 0 for size in report["objects"] + report["compact"] )
+    # The mesh itself is not changed:
+    assert nav_mesh.registry.arrays[0] is not None
+    assert nodes[0].pos[0] == nav_mesh.nodes[0].pos[0]
+
+def test_memory_report_command( tmp_path ):
+    filename = str( tmp_path/"grid.navmesh" )
+    build_binary_mesh( filename )
+    result = subprocess.run( [sys.executable, "-m", "nav_mesh.memory_report", filename],
+            cwd=ROOT, capture_output=True, text=True )
+    assert result.returncode == 0, result.stderr
+    assert "Level 0 (400 nodes)" in result.stdout